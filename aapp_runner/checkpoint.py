@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Checkpoints of the processing steps of a pass, to resume a failed pass.
+
+After each completed step a manifest in the working dir is updated with the
+files the step wrote (with their sha256) and the changes it made to the
+process config and the job environment. When the pass is processed again in
+the same working dir, the steps completed before are not run again as long as
+their files are unchanged: their config and environment changes are restored
+instead, and the processing goes on from the first incomplete step.
+
+Several steps update the same l1b file in place, so a file not matching the
+hash of the last step writing it means a later step failed half way. The
+steps are then redone from the first one writing that file.
+
+The files a step wrote are found by comparing the working dir before and
+after the step. This can not tell apart the files of steps running at the
+same time, so a step is only checkpointed if no other step ran meanwhile.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from aapp_runner.helper_functions import hash_file
+
+LOG = logging.getLogger(__name__)
+
+MANIFEST_NAME = "aapp_runner_checkpoint.json"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and 'datetime' in value:
+        return datetime.fromisoformat(value['datetime'])
+    return value
+
+
+def _config_state(config):
+    """Get the values of the process config which the steps may change."""
+    state = {}
+    for key, value in config.config.items():
+        if isinstance(value, (bool, int, float, str, datetime, type(None))):
+            state[key] = value
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            state[key] = list(value)
+    return state
+
+
+class CheckpointManifest(object):
+    """The checkpoint manifest of the pass *scene_id* processed in *working_dir*."""
+
+    def __init__(self, working_dir, scene_id):
+        self.working_dir = working_dir
+        self.scene_id = scene_id
+        self.filename = os.path.join(working_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._steps = self._load()
+        self._reusable = self._find_reusable_steps()
+        self._reused = set()
+        # The running steps, and whether another step started or ended meanwhile
+        self._running = {}
+
+    def _load(self):
+        try:
+            with open(self.filename) as fd_:
+                manifest = json.load(fd_)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as err:
+            LOG.warning("Can not read checkpoint manifest {}: {}".format(self.filename, err))
+            return []
+        if manifest.get('scene_id') != self.scene_id:
+            LOG.info("Checkpoint manifest in {} is for {}, start from the beginning.".format(
+                self.working_dir, manifest.get('scene_id')))
+            return []
+        return manifest['steps']
+
+    def _find_reusable_steps(self):
+        """Get the names of the completed steps with files still as they were left."""
+        steps = list(self._steps)
+        while steps:
+            latest = {}
+            first_writer = {}
+            for index, step in enumerate(steps):
+                for name, sha in step['files'].items():
+                    latest[name] = sha
+                    first_writer.setdefault(name, index)
+            for name, sha in latest.items():
+                path = os.path.join(self.working_dir, name)
+                if not os.path.isfile(path) or hash_file(path) != sha:
+                    LOG.info("{} changed after step {}, redo the steps from {}".format(
+                        name, steps[-1]['name'], steps[first_writer[name]]['name']))
+                    steps = steps[:first_writer[name]]
+                    break
+            else:
+                break
+        return [step['name'] for step in steps]
+
+    def is_reusable(self, name, depends_on=()):
+        """Check if the step *name* completed before and the steps it depends on were reused."""
+        return name in self._reusable and all(dep in self._reused for dep in depends_on)
+
+    def checkpointed(self, name, func, config, depends_on=()):
+        """Get a function running the step *func*, or restoring what it did if it is reusable."""
+        def run_step(*args):
+            if self.is_reusable(name, depends_on):
+                self._restore(name, config)
+                return True
+            self._forget(name)
+            self._start(name)
+            try:
+                files_before = self._snapshot()
+                config_before = _config_state(config)
+                env_before = dict(config.get_job_context().env)
+                result = func(*args)
+            finally:
+                ran_alone = self._end(name)
+            if result and ran_alone:
+                self._record(name, files_before, config_before, env_before, config)
+            elif result:
+                LOG.info("Step {} ran at the same time as other steps, it is not checkpointed".format(name))
+            return result
+        return run_step
+
+    def _start(self, name):
+        with self._lock:
+            for other in self._running:
+                self._running[other] = False
+            self._running[name] = not self._running
+
+    def _end(self, name):
+        """Stop tracking the step *name*, return True if it ran alone."""
+        with self._lock:
+            ran_alone = self._running.pop(name)
+            for other in self._running:
+                self._running[other] = False
+        return ran_alone
+
+    def _snapshot(self):
+        files = {}
+        for entry in os.scandir(self.working_dir):
+            if entry.is_file(follow_symlinks=False) and not self._ignored(entry.name):
+                stat = entry.stat(follow_symlinks=False)
+                files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    @staticmethod
+    def _ignored(name):
+        # Log files are moved away after each run, whatever the result
+        return name.endswith('.log') or name.startswith(MANIFEST_NAME)
+
+    def _record(self, name, files_before, config_before, env_before, config):
+        files = {}
+        for filename, stat in self._snapshot().items():
+            if files_before.get(filename) != stat:
+                files[filename] = hash_file(os.path.join(self.working_dir, filename))
+        config_changes = {key: _encode(value) for key, value in _config_state(config).items()
+                          if key not in config_before or config_before[key] != value}
+        env = config.get_job_context().env
+        env_changes = {key: value for key, value in env.items() if env_before.get(key) != value}
+        with self._lock:
+            self._steps = [step for step in self._steps if step['name'] != name]
+            self._steps.append({'name': name, 'files': files, 'config': config_changes, 'env': env_changes})
+            self._write()
+        LOG.debug("Checkpoint {} with {} files".format(name, len(files)))
+
+    def _restore(self, name, config):
+        with self._lock:
+            step = [step for step in self._steps if step['name'] == name][0]
+            self._reused.add(name)
+        for key, value in step['config'].items():
+            config[key] = _decode(value)
+        job = config.get_job_context()
+        for key, value in step['env'].items():
+            job.setenv(key, value)
+        LOG.info("Step {} completed before, reuse its {} files".format(name, len(step['files'])))
+
+    def _forget(self, name):
+        with self._lock:
+            if any(step['name'] == name for step in self._steps):
+                self._steps = [step for step in self._steps if step['name'] != name]
+                self._write()
+
+    def _write(self):
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, 'w') as fd_:
+            json.dump({'scene_id': self.scene_id, 'steps': self._steps}, fd_, indent=1)
+        os.replace(tmp_filename, self.filename)
+
+    def remove(self):
+        """Remove the manifest, when the pass is done."""
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
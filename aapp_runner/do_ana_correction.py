@@ -59,16 +59,15 @@ def do_ana_correction(process_config, msg, timestamp):
 
     return_status = True
 
-    # This function relays on beeing in a working directory
-    current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
+    job = process_config.get_job_context()
+    tail_lines = process_config.get_output_tail_lines('ana')
 
     # Must check of the ana dir exists
-    ana_dir = os.path.join(os.getenv('DIR_NAVIGATION'), 'ana')
+    ana_dir = os.path.join(job.getenv('DIR_NAVIGATION'), 'ana')
     if not os.path.exists(ana_dir):
         try:
             os.makedirs(ana_dir)
-            os.environ['DIR_ANA'] = ana_dir
+            job.setenv('DIR_ANA', ana_dir)
         except OSError in e:
             LOG.error("Failed to create directory: {}. This is needed to run the ANA software.")
             return_status = False
@@ -85,18 +84,15 @@ def do_ana_correction(process_config, msg, timestamp):
             status = False
             status, returncode, std, err = run_shell_command(cmd,
                                                              stdout_logfile="ana_lmk_loc.log",
-                                                             stderr_logfile="ana_lmk_loc.err")
+                                                             stderr_logfile="ana_lmk_loc.err",
+                                                             my_cwd=job.cwd, my_env=job.env)
         except:
             LOG.exception(f"Command {cmd:s} failed with exception:")
             if not status:
                 return_status = False
         else:
             if not status or returncode != 0:
-                LOG.error("Command {} failed with {}".format(cmd, returncode))
-                _ana_file = open('ana_lmk_loc.err', "w")
-                _ana_file.write(std)
-                _ana_file.write(err)
-                _ana_file.close()
+                LOG.error("Command {} failed with {}. See ana_lmk_loc.log and ana_lmk_loc.err".format(cmd, returncode))
                 return_status = False
 
     if return_status:
@@ -113,7 +109,8 @@ def do_ana_correction(process_config, msg, timestamp):
                 status, returncode, std, err = run_shell_command(cmd,
                                                                  stdin="{}\n".format(
                                                                      process_config['aapp_static_configuration']
-                                                                     ['decommutation_files']['avhrr_file']))
+                                                                     ['decommutation_files']['avhrr_file']),
+                                                                 my_cwd=job.cwd, my_env=job.env)
             except:
                 import sys
                 LOG.error("Command {} failed with {}.".format(cmd, sys.exc_info()[0]))
@@ -122,7 +119,7 @@ def do_ana_correction(process_config, msg, timestamp):
             else:
                 if not status or returncode != 0:
                     LOG.error("Command {} failed with {}".format(cmd, returncode))
-                    _ana_file = open('ana_lmk_loc.err', "w")
+                    _ana_file = open(job.path('ana_lmk_loc.err'), "w")
                     _ana_file.write(std)
                     _ana_file.write(err)
                     _ana_file.close()
@@ -155,7 +152,8 @@ def do_ana_correction(process_config, msg, timestamp):
                                                                               timestamp,
                                                                               process_config['orbit_number'])
         try:
-            status, returncode, std, err = run_shell_command(cmd)
+            status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                             tail_lines=tail_lines)
         except:
             LOG.exception(f"Command {cmd:s} failed with exception:")
             if not status:
@@ -163,16 +161,13 @@ def do_ana_correction(process_config, msg, timestamp):
         else:
             if not status or returncode != 0:
                 LOG.error("Command {} failed with {}".format(cmd, returncode))
-                _ana_file = open('ana_lmk_loc.err', "w")
-                _ana_file.write(std)
-                _ana_file.write(err)
-                _ana_file.close()
                 return_status = False
 
         # LOG.debug("sha256 of aapp input avhrr_file: {}".format(hashlib.sha256(open(
         # process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'], 'rb').read()).hexdigest()))
 
-        sha256_before_correction = hashlib.sha256(open(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'], 'rb').read()).hexdigest()
+        avhrr_file = job.path(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'])
+        sha256_before_correction = hashlib.sha256(open(avhrr_file, 'rb').read()).hexdigest()
 
     if return_status:
         # Recalculate the location in the avhhr data file with the new correction attitude coefisients.
@@ -185,7 +180,7 @@ def do_ana_correction(process_config, msg, timestamp):
             return_status = False
 
     if return_status:
-        sha256_after_correction = hashlib.sha256(open(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'], 'rb').read()).hexdigest()
+        sha256_after_correction = hashlib.sha256(open(avhrr_file, 'rb').read()).hexdigest()
         LOG.debug("sha256 of aapp input avhrr_file BEFORE ana: {}".format(sha256_before_correction))
         LOG.debug("sha256 of aapp input avhrr_file AFTER  ana: {}".format(sha256_after_correction))
         if (sha256_before_correction == sha256_after_correction):
@@ -194,9 +189,6 @@ def do_ana_correction(process_config, msg, timestamp):
         else:
             LOG.info("The correction of AVHRR location with data from ANA was performed.")
 
-    # Change back after this is done
-    os.chdir(current_dir)
-
     LOG.info("do_ana_correction complete!")
 
     return return_status
@@ -25,7 +25,7 @@ Rename standard AAPP files to proctical ones  ...
 
 import os
 import logging
-from aapp_runner.helper_functions import run_shell_command
+from aapp_runner.helper_functions import replace_symlink, run_shell_command
 
 LOG = logging.getLogger(__name__)
 
@@ -41,9 +41,8 @@ def do_atovpp_and_avh2hirs_processing(process_config, timestamp):
 
     return_status = True
 
-    # This function relays on beeing in a working directory
-    current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
+    job = process_config.get_job_context()
+    tail_lines = process_config.get_output_tail_lines('atovpp')
 
     instruments = "AMSU-A AMSU-B HIRS"
     grids = "AMSU-A AMSU-B HIRS"
@@ -67,7 +66,8 @@ def do_atovpp_and_avh2hirs_processing(process_config, timestamp):
     if process_config['do_atovpp']:
         cmd = "atovin {}".format(instruments)
         try:
-            status, returncode, std, err = run_shell_command(cmd)
+            status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                             tail_lines=tail_lines)
         except:
             LOG.error("Command {} failed.".format(cmd))
         else:
@@ -84,7 +84,8 @@ def do_atovpp_and_avh2hirs_processing(process_config, timestamp):
         if return_status:
             cmd = "atovpp -i \"{}\" -g \"{}\"".format(instruments, grids)
             try:
-                status, returncode, std, err = run_shell_command(cmd)
+                status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                                 tail_lines=tail_lines)
             except:
                 LOG.error("Command {} failed.".format(cmd))
             else:
@@ -97,23 +98,24 @@ def do_atovpp_and_avh2hirs_processing(process_config, timestamp):
                     LOG.info("Command {} complete.".format(cmd))
 
     if return_status and process_config['do_avh2hirs'] and process_config['process_hirs']:
-        if os.path.exists("./{}".format(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'])):
-            os.symlink("./{}".format(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file']),
-                       "{}11".format(os.environ["FORT"]))
+        if os.path.exists(job.path(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'])):
+            replace_symlink("./{}".format(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file']),
+                            job.path("{}11".format(job.getenv("FORT"))))
         else:
-            LOG.error("Could not find file: ./{}".format(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file']))
+            LOG.error("Could not find file: {}".format(
+                job.path(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'])))
             return_status = False
 
-        if os.path.exists("./hirs.l1d"):
-            os.symlink("./hirs.l1d", "{}12".format(os.environ["FORT"]))
+        if os.path.exists(job.path("hirs.l1d")):
+            replace_symlink("./hirs.l1d", job.path("{}12".format(job.getenv("FORT"))))
         else:
-            LOG.error("Could not find file: {}".format("./hirs.l1d"))
+            LOG.error("Could not find file: {}".format(job.path("hirs.l1d")))
             return_status = False
 
         if return_status:
             cmd = "l1didf -i hirs.l1d"
             try:
-                status, returncode, std, err = run_shell_command(cmd)
+                status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env)
             except:
                 LOG.error("Command {} failed.".format(cmd))
             else:
@@ -136,20 +138,20 @@ def do_atovpp_and_avh2hirs_processing(process_config, timestamp):
             mmc = int(yyyymmdd[4:6])
             LOG.debug("Using unit: {} and mmc: {}".format(unit, mmc))
 
-            if os.path.exists(os.path.join(os.environ["DIR_PREPROC"], "cor_{}.dat".format(satimg))):
-                os.symlink(os.path.join(os.environ["DIR_PREPROC"], "cor_{}.dat".format(satimg)),
-                           "{}{}".format(os.environ["FORT"], unit))
+            if os.path.exists(os.path.join(job.getenv("DIR_PREPROC"), "cor_{}.dat".format(satimg))):
+                replace_symlink(os.path.join(job.getenv("DIR_PREPROC"), "cor_{}.dat".format(satimg)),
+                                job.path("{}{}".format(job.getenv("FORT"), unit)))
             else:
-                LOG.error("Failed to find {}".format(os.path.join(os.environ["DIR_PREPROC"],
+                LOG.error("Failed to find {}".format(os.path.join(job.getenv("DIR_PREPROC"),
                                                                   "cor_{}.dat".format(satimg))))
                 return_status = False
 
         if return_status:
-            os.environ["SATIMG"] = satimg
-            os.environ["YYYYMMDD"] = yyyymmdd
-            os.environ["HHMN"] = hhmn
-            os.environ["DIR_MAIA2_ATLAS"] = os.path.join(os.environ["DIR_PREPROC"], "atlas")
-            os.environ["DIR_MAIA2_THRESHOLDS"] = os.path.join(os.environ["DIR_PREPROC"], "thresholds")
+            job.setenv("SATIMG", satimg)
+            job.setenv("YYYYMMDD", yyyymmdd)
+            job.setenv("HHMN", hhmn)
+            job.setenv("DIR_MAIA2_ATLAS", os.path.join(job.getenv("DIR_PREPROC"), "atlas"))
+            job.setenv("DIR_MAIA2_THRESHOLDS", os.path.join(job.getenv("DIR_PREPROC"), "thresholds"))
             if "".join(process_config['a_tovs']) == 'TOVS':
                 cmd = "maia2_env;maia2_environment;avh2hirs.exe 2>&1"
             else:
@@ -160,30 +162,24 @@ def do_atovpp_and_avh2hirs_processing(process_config, timestamp):
                 status, returncode, std, err = run_shell_command(cmd,
                                                                  stdout_logfile="avh2hirs.log",
                                                                  use_shlex=False,
-                                                                 use_shell=True)
+                                                                 use_shell=True,
+                                                                 my_cwd=job.cwd, my_env=job.env)
             except:
                 LOG.error("Command {} failed.".format(cmd))
             else:
                 if returncode != 0:
-                    LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
-                    LOG.error(std)
-                    LOG.error(err)
+                    LOG.error("Command {} failed with return code {}. See avh2hirs.log".format(cmd, returncode))
                     return_status = False
                 else:
                     LOG.info("Command {} complete.".format(cmd))
-                    LOG.debug(std)
-                    LOG.debug(err)
 
         if return_status:
             import glob
-            for fortfile in glob.glob("./fort*"):
+            for fortfile in glob.glob(job.path("fort*")):
                 os.remove(fortfile)
-            os.remove("./albedo")
-            os.remove("./sst")
-            os.remove("./wv")
-
-    # Change back after this is done
-    os.chdir(current_dir)
+            os.remove(job.path("albedo"))
+            os.remove(job.path("sst"))
+            os.remove(job.path("wv"))
 
     LOG.info("atovpp and avh2hirs complete!")
     return return_status
@@ -26,7 +26,6 @@ Rely on several other steps before this can be DONE.
 """
 
 import logging
-import os
 
 from aapp_runner.helper_functions import run_shell_command
 
@@ -48,9 +47,8 @@ def do_atovs_calibration(process_config, timestamp):
 
     return_value = True
 
-    # This function relays on beeing in a working directory
-    current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
+    job = process_config.get_job_context()
+    tail_lines = process_config.get_output_tail_lines('atovs')
 
     # calibration_location = "-c -l"
     if "".join(process_config['a_tovs']) == 'TOVS':
@@ -60,7 +58,9 @@ def do_atovs_calibration(process_config, timestamp):
                                                                                  int(process_config['orbit_number']),
                                                                                  process_config['aapp_static_configuration']['decommutation_files']['msun_file'])
         try:
-            status, returncode, std, err = run_shell_command(cmd)
+            status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                             tail_lines=tail_lines,
+                                                             accepted_return_codes=accepted_return_codes_msucl)
         except Exception:
             LOG.error("Command {} failed.".format(cmd))
         else:
@@ -78,7 +78,9 @@ def do_atovs_calibration(process_config, timestamp):
                                                                                        int(process_config['orbit_number']),
                                                                                        process_config['aapp_static_configuration']['decommutation_files']['amsua_file'])
             try:
-                status, returncode, std, err = run_shell_command(cmd)
+                status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                                 tail_lines=tail_lines,
+                                                                 accepted_return_codes=accepted_return_codes_amsuacl)
             except Exception:
                 LOG.error("Command {} failed.".format(cmd))
             else:
@@ -108,7 +110,9 @@ def do_atovs_calibration(process_config, timestamp):
                                                                                    int(process_config['orbit_number']),
                                                                                    process_config['aapp_static_configuration']['decommutation_files']['amsub_file'])
             try:
-                status, returncode, std, err = run_shell_command(cmd)
+                status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                                 tail_lines=tail_lines,
+                                                                 accepted_return_codes=accepted_return_codes_amsubcl)
             except Exception:
                 LOG.error("Command {} failed.".format(cmd))
             else:
@@ -122,8 +126,5 @@ def do_atovs_calibration(process_config, timestamp):
         LOG.error("Unknown A|TOVS key string: {}".format("".join(process_config['a_tovs'])))
         return_value = False
 
-    # Change back after this is done
-    os.chdir(current_dir)
-
     LOG.info("do_atovs_calibration complete!")
     return return_value
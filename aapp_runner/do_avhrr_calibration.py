@@ -24,7 +24,6 @@
 Relay on several other steps before this can be DONE
 """
 
-import os
 import logging
 from aapp_runner.helper_functions import run_shell_command
 
@@ -42,9 +41,8 @@ def do_avhrr_calibration(process_config, msg, timestamp):
     return_value = True
     LOG.debug("Do the avhrr calibration")
 
-    # This function relays on beeing in a working directory
-    current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
+    job = process_config.get_job_context()
+    tail_lines = process_config.get_output_tail_lines('avhrr')
 
     # calibration_location = "-c -l"
 
@@ -58,7 +56,9 @@ def do_avhrr_calibration(process_config, msg, timestamp):
         LOG.error("Failed to build avhrcl command: {}".format(err))
 
     try:
-        status, returncode, std, err = run_shell_command(cmd)
+        status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                         tail_lines=tail_lines,
+                                                         accepted_return_codes=accepted_return_codes_avhrcl)
     except:
         LOG.error("Command {} failed.".format(cmd))
     else:
@@ -68,9 +68,6 @@ def do_avhrr_calibration(process_config, msg, timestamp):
             LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
             return_value = False
 
-    # Change back after this is done
-    os.chdir(current_dir)
-
     LOG.info("do_avhrr_calibration complete!")
     return return_value
 
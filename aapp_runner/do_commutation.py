@@ -28,12 +28,22 @@ import os
 import shutil
 import re
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-from aapp_runner.helper_functions import run_shell_command
+from aapp_runner.helper_functions import replace_symlink, run_shell_command
 
 LOG = logging.getLogger(__name__)
 
 
+# The fort unit, decommutation_files key and instrument of the NOAA decommutation outputs
+NOAA_DECOM_OUTPUTS = [(14, 'avhrr_file', 'avhrr'),
+                      (11, 'hirs_file', 'hirs'),
+                      (12, 'msu_file', 'msu'),
+                      (13, 'dcs_file', 'dcs'),
+                      (15, 'amsua_file', 'amsua'),
+                      (16, 'amsub_file', 'amsub')]
+
+
 def do_decommutation(process_config, msg, timestamp):
     """
     decommutation ${A_TOVS}  decommutation.par  ${FILE}
@@ -86,9 +96,9 @@ def do_decommutation(process_config, msg, timestamp):
 
     return_status = True
 
-    # This function relays on beeing in a working directory
-    current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
+    job = process_config.get_job_context()
+    tail_lines = process_config.get_output_tail_lines('decommutation')
+    decom_files = process_config['aapp_static_configuration']['decommutation_files']
 
     # for sensor in sensors:
     #    if str(sensor) in "amsu-a":
@@ -119,7 +129,7 @@ def do_decommutation(process_config, msg, timestamp):
         # dcs = 0
 
         try:
-            decom_file = "decommutation.par"
+            decom_file = job.path("decommutation.par")
             # Needs to find platform number for A/TOVS
             decom = open(decom_file, 'w')
 
@@ -153,14 +163,15 @@ def do_decommutation(process_config, msg, timestamp):
         decom_input = decom.read()
         decom.close()
 
-        os.environ['FILE_COEF'] = os.path.join(os.environ.get('PAR_CALIBRATION_COEF'), 'amsua', 'amsua_clparams.dat')
-        os.symlink(os.environ['FILE_COEF'], "{}50".format(os.environ['FORT']))
+        job.setenv('FILE_COEF', os.path.join(job.getenv('PAR_CALIBRATION_COEF'), 'amsua', 'amsua_clparams.dat'))
+        replace_symlink(job.getenv('FILE_COEF'), job.path("{}50".format(job.getenv('FORT'))))
 
         cmd = "decommutation.exe"  # .format("".join(process_config['a_tovs']),decom_file, process_config['input_hrpt_file'])
         try:
-            status, returncode, std, err = run_shell_command(cmd, stdin="{}\n{}{}\n".format(process_config['input_hrpt_file'], decom_input, os.getenv('STATION_ID', 'ST')),
+            status, returncode, std, err = run_shell_command(cmd, stdin="{}\n{}{}\n".format(process_config['input_hrpt_file'], decom_input, job.getenv('STATION_ID', 'ST')),
                                                              stdout_logfile='decommutation.log',
-                                                             stderr_logfile='decommutation.log')
+                                                             stderr_logfile='decommutation.log',
+                                                             my_cwd=job.cwd, my_env=job.env)
         except:
             LOG.error("Command {} failed.".format(cmd))
         else:
@@ -170,153 +181,29 @@ def do_decommutation(process_config, msg, timestamp):
                 LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
                 return_status = False
 
-        # Need to check the decommutation output and rename fort files
+        # Need to check the decommutation output and rename fort files.
+        # The instruments are checked at the same time. The fort files are only
+        # complete when decommutation.exe is done, so the checks can not start before.
         if return_status:
-            # hrpt 14
-            if os.path.exists("{}14".format(os.environ['FORT'])):
-                shutil.move("{}14".format(os.environ['FORT']), process_config['aapp_static_configuration']['decommutation_files']['avhrr_file'])
-                cmd = "chk1btime.exe"
-                try:
-                    status, returncode, std, err = run_shell_command(cmd, stdin="{}\n".format(process_config['aapp_static_configuration']['decommutation_files']['avhrr_file']))
-                except:
-                    LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
-                else:
-                    if returncode in accepted_return_codes_chk1btime:
-                        LOG.debug("chk1btime command {} ok.".format(cmd))
-                        LOG.debug("std: {}".format(std))
-                    else:
-                        LOG.error("This means that the start of the data are bad,"
-                                  " and that the processing for this data later will fail.")
-                        LOG.debug("Return code: {}".format(returncode))
-                        LOG.debug("std: {}".format(std))
-                        LOG.debug("err: {}".format(err))
-                        LOG.debug("status: {}".format(status))
-                        process_config['process_avhrr'] = False
-
-            elif process_config['process_avhrr']:
-                LOG.warning("Fort file for avhrr does not exist after decommutation. Skip processing this.")
-                process_config['process_avhrr'] = False
-
-            # hrsn 11
-            if os.path.exists("{}11".format(os.environ['FORT'])):
-                shutil.move("{}11".format(os.environ['FORT']), process_config['aapp_static_configuration']['decommutation_files']['hirs_file'])
-                cmd = "chk1btime.exe"
-                try:
-                    status, returncode, std, err = run_shell_command(cmd, stdin="{}\n".format(process_config['aapp_static_configuration']['decommutation_files']['hirs_file']))
-                except:
-                    LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
-                else:
-                    if returncode in accepted_return_codes_chk1btime:
-                        LOG.debug("chk1btime command {} ok.".format(cmd))
-                    else:
-                        LOG.error("This means that the start of the data are bad,"
-                                  " and that the processing for this data later will fail.")
-                        LOG.debug("Return code: {}".format(returncode))
-                        LOG.debug("std: {}".format(std))
-                        LOG.debug("err: {}".format(err))
-                        LOG.debug("status: {}".format(status))
-                        process_config['process_hirs'] = False
-            elif process_config['process_hirs']:
-                LOG.warning("Fort file for hirs does not exist after decommutation. Skip processing this.")
-                process_config['process_hirs'] = False
-
-            # msun 12
-            if os.path.exists("{}12".format(os.environ['FORT'])):
-                shutil.move("{}12".format(os.environ['FORT']), process_config['aapp_static_configuration']['decommutation_files']['msu_file'])
-                cmd = "chk1btime.exe"
-                try:
-                    status, returncode, std, err = run_shell_command(cmd, stdin="{}\n".format(process_config['aapp_static_configuration']['decommutation_files']['msu_file']))
-                except:
-                    LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
-                else:
-                    if returncode in accepted_return_codes_chk1btime:
-                        LOG.debug("chk1btime command {} ok.".format(cmd))
-                    else:
-                        LOG.error("This means that the start of the data are bad, "
-                                  " and that the processing for this data later will fail.")
-                        LOG.debug("Return code: {}".format(returncode))
-                        LOG.debug("std: {}".format(std))
-                        LOG.debug("err: {}".format(err))
-                        LOG.debug("status: {}".format(status))
-                        process_config['process_msu'] = False
-            elif process_config['process_msu']:
-                LOG.warning("Fort file for msu does not exist after decommutation. Skip processing this.")
-                process_config['process_msu'] = False
-
-            # dcsn 13
-            if os.path.exists("{}13".format(os.environ['FORT'])):
-                shutil.move("{}13".format(os.environ['FORT']), process_config['aapp_static_configuration']['decommutation_files']['dcs_file'])
-                cmd = "chk1btime.exe"
-                try:
-                    status, returncode, std, err = run_shell_command(cmd, stdin="{}\n".format(process_config['aapp_static_configuration']['decommutation_files']['dcs_file']))
-                except:
-                    LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
-                else:
-                    if returncode in accepted_return_codes_chk1btime:
-                        LOG.debug("chk1btime command {} ok.".format(cmd))
-                    else:
-                        LOG.error("This means that the start of the data are bad,"
-                                  " and that the processing for this data later will fail.")
-                        LOG.debug("Return code: {}".format(returncode))
-                        LOG.debug("std: {}".format(std))
-                        LOG.debug("err: {}".format(err))
-                        LOG.debug("status: {}".format(status))
-                        process_config['process_dcs'] = False
-            elif process_config['process_dcs']:
-                LOG.warning("Fort file for dcs does not exist after decommutation. Skip processing this.")
-                process_config['process_dcs'] = False
-
-            # aman 15
-            if os.path.exists("{}15".format(os.environ['FORT'])):
-                shutil.move("{}15".format(os.environ['FORT']), process_config['aapp_static_configuration']['decommutation_files']['amsua_file'])
-                cmd = "chk1btime.exe"
-                try:
-                    status, returncode, std, err = run_shell_command(cmd,
-                                                                     stdin="{}\n".format(process_config['aapp_static_configuration']['decommutation_files']['amsua_file']))
-                except:
-                    LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
-                else:
-                    if returncode in accepted_return_codes_chk1btime:
-                        LOG.debug("chk1btime command {} ok.".format(cmd))
-                    else:
-                        LOG.error("This means that the start of the data are bad, "
-                                  "and that the processing for this data later will fail?")
-                        LOG.debug("Return code: {}".format(returncode))
-                        LOG.debug("std: {}".format(std))
-                        LOG.debug("err: {}".format(err))
-                        LOG.debug("status: {}".format(status))
-                        process_config['process_amsua'] = False
-            elif process_config['process_amsua']:
-                LOG.warning("Fort file for amsu-a does not exist after decommutation. Skip processing this.")
-                process_config['process_amsua'] = False
-
-            # ambn 16
-            if os.path.exists("{}16".format(os.environ['FORT'])):
-                shutil.move("{}16".format(os.environ['FORT']), process_config['aapp_static_configuration']['decommutation_files']['amsub_file'])
-                cmd = "chk1btime.exe"
-                try:
-                    status, returncode, std, err = run_shell_command(cmd, stdin="{}\n".format(process_config['aapp_static_configuration']['decommutation_files']['amsub_file']))
-                except:
-                    LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
-                else:
-                    if returncode in accepted_return_codes_chk1btime:
-                        LOG.debug("chk1btime command {} ok.".format(cmd))
-                    else:
-                        LOG.error("This means that the start of the data are bad, "
-                                  "and that the processing for this data later will fail.")
-                        LOG.debug("Return code: {}".format(returncode))
-                        LOG.debug("std: {}".format(std))
-                        LOG.debug("err: {}".format(err))
-                        LOG.debug("status: {}".format(status))
-                        process_config['process_amsub'] = False
-            elif process_config['process_amsub']:
-                LOG.warning("Fort file for amsu-b does not exist after decommutation. Skip processing this.")
-                process_config['process_amsub'] = False
-
-        if os.path.exists("decommutation.log"):
+            with ThreadPoolExecutor(max_workers=len(NOAA_DECOM_OUTPUTS)) as pool:
+                checks = list(pool.map(
+                    lambda output: _check_noaa_decom_output(job, output[0], decom_files[output[1]],
+                                                            accepted_return_codes_chk1btime, tail_lines),
+                    NOAA_DECOM_OUTPUTS))
+            for (unit, decom_file_key, instrument), check in zip(NOAA_DECOM_OUTPUTS, checks):
+                process_flag = 'process_{}'.format(instrument)
+                if check is None:
+                    if process_config[process_flag]:
+                        LOG.warning("Fort file for {} does not exist after decommutation. "
+                                    "Skip processing this.".format(instrument))
+                        process_config[process_flag] = False
+                elif not check:
+                    process_config[process_flag] = False
+
+        if os.path.exists(job.path("decommutation.log")):
             dd = None
             tt = None
-            with open("decommutation.log") as decomlog:
+            with open(job.path("decommutation.log")) as decomlog:
                 while True:
                     line = decomlog.readline()
                     if not line:
@@ -342,75 +229,97 @@ def do_decommutation(process_config, msg, timestamp):
                         break
     elif 'METOP' in process_config['platform_name'].upper():
         LOG.info("Do the metop decommutation")
+        # The decoms read and write their own files, so they are run at the same time.
+        # A failing decom only disables the processing of its own instrument.
+        ignore_degraded = "-ignore_degraded_inst_mdr -ignore_degraded_proc_mdr"
+        metop_decoms = []
         if process_config['process_amsua']:
-            cmd = "decom-amsua-metop {} {} ".format(process_config['input_amsua_file'],
-                                                    process_config['aapp_static_configuration']['decommutation_files']['amsua_file'])
-            try:
-                status, returncode, std, err = run_shell_command(cmd, stdout_logfile="decom-amsua-metop.log")
-            except:
-                LOG.error("Command {} failed.".format(cmd))
-            else:
-                if returncode in accepted_return_codes_decom_amsua_metop:
-                    LOG.info("Command {} complete.".format(cmd))
-                    if not os.path.exists(process_config['aapp_static_configuration']['decommutation_files']['amsua_file']):
-                        LOG.warning("Decom gave OK status, but no data is produced. Something is wrong")
-                else:
-                    LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
-                    return_status = False
-
-        if process_config['process_mhs'] and return_status:
-            cmd = "decom-mhs-metop {} {} {} ".format("-ignore_degraded_inst_mdr -ignore_degraded_proc_mdr",
-                                                     process_config['input_mhs_file'],
-                                                     process_config['aapp_static_configuration']['decommutation_files']['mhs_file'])
-            try:
-                status, returncode, std, err = run_shell_command(cmd, stdout_logfile="decom-mhs-metop.log")
-            except:
-                LOG.error("Command {} failed.".format(cmd))
-            else:
-                if returncode in accepted_return_codes_decom_amsub_metop:
-                    LOG.info("Command {} complete.".format(cmd))
-                else:
-                    LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
-                    return_status = False
-
-        if process_config['process_hirs'] and return_status:
-            cmd = "decom-hirs-metop {} {} {} ".format("-ignore_degraded_inst_mdr -ignore_degraded_proc_mdr",
-                                                      process_config['input_hirs_file'],
-                                                      process_config['aapp_static_configuration']['decommutation_files']['hirs_file'])
-            try:
-                status, returncode, std, err = run_shell_command(cmd, stdout_logfile="decom-hirs-metop.log")
-            except:
-                LOG.error("Command {} failed.".format(cmd))
-            else:
-                if returncode in accepted_return_codes_decom_hirs_metop:
-                    LOG.info("Command {} complete.".format(cmd))
-                else:
-                    LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
-                    return_status = False
-
-        if process_config['process_avhrr'] and return_status:
-            cmd = "decom-avhrr-metop {} {} {} ".format("-ignore_degraded_inst_mdr -ignore_degraded_proc_mdr",
-                                                       process_config['input_avhrr_file'],
-                                                       process_config['aapp_static_configuration']
-                                                       ['decommutation_files']['avhrr_file'])
-            try:
-                status, returncode, std, err = run_shell_command(cmd, stdout_logfile="decom-avhrr-metop.log")
-            except:
-                LOG.error("Command {} failed.".format(cmd))
-            else:
-                if returncode in accepted_return_codes_decom_avhrr_metop:
-                    LOG.info("Command {} complete.".format(cmd))
-                else:
-                    LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
-                    return_status = False
+            metop_decoms.append(('amsua', ('process_amsua',), "decom-amsua-metop {} {} ".format(
+                process_config['input_amsua_file'], decom_files['amsua_file']),
+                accepted_return_codes_decom_amsua_metop, decom_files['amsua_file']))
+        if process_config['process_mhs']:
+            metop_decoms.append(('mhs', ('process_mhs', 'process_amsub'), "decom-mhs-metop {} {} {} ".format(
+                ignore_degraded, process_config['input_mhs_file'], decom_files['mhs_file']),
+                accepted_return_codes_decom_amsub_metop, decom_files['mhs_file']))
+        if process_config['process_hirs']:
+            metop_decoms.append(('hirs', ('process_hirs',), "decom-hirs-metop {} {} {} ".format(
+                ignore_degraded, process_config['input_hirs_file'], decom_files['hirs_file']),
+                accepted_return_codes_decom_hirs_metop, decom_files['hirs_file']))
+        if process_config['process_avhrr']:
+            metop_decoms.append(('avhrr', ('process_avhrr',), "decom-avhrr-metop {} {} {} ".format(
+                ignore_degraded, process_config['input_avhrr_file'], decom_files['avhrr_file']),
+                accepted_return_codes_decom_avhrr_metop, decom_files['avhrr_file']))
+
+        if metop_decoms:
+            with ThreadPoolExecutor(max_workers=len(metop_decoms)) as pool:
+                decom_ok = list(pool.map(lambda decom: _run_metop_decom(job, *decom[2:], tail_lines=tail_lines),
+                                         metop_decoms))
+            for (instrument, process_flags, _, _, _), ok in zip(metop_decoms, decom_ok):
+                if not ok:
+                    LOG.warning("Decommutation of {} failed. Skip processing this.".format(instrument))
+                    for process_flag in process_flags:
+                        process_config[process_flag] = False
+            if not any(decom_ok):
+                LOG.error("All the metop decommutations failed.")
+                return_status = False
 
     else:
         LOG.error("Unknown platform: {}".format(process_config['platform_name']))
         return_status = False
 
-    # print os.listdir("./")
-    # Change back after this is done
-    os.chdir(current_dir)
-
     LOG.info("All decommutations complete.")
     return return_status
+
+
+def _check_noaa_decom_output(job, unit, decom_file, accepted_return_codes, tail_lines=None):
+    """Rename the fort file of a decommutation output and check its start time.
+
+    Return None if the fort file does not exist, else whether the check is ok.
+    """
+    fort_file = job.path("{}{}".format(job.getenv('FORT'), unit))
+    if not os.path.exists(fort_file):
+        return None
+    shutil.move(fort_file, job.path(decom_file))
+
+    cmd = "chk1btime.exe"
+    try:
+        status, returncode, std, err = run_shell_command(cmd, stdin="{}\n".format(decom_file),
+                                                         my_cwd=job.cwd, my_env=job.env, tail_lines=tail_lines,
+                                                         accepted_return_codes=accepted_return_codes)
+    except Exception:
+        LOG.error("Failed to execute command {}. Something wrong with the command.".format(cmd))
+        return True
+
+    if returncode in accepted_return_codes:
+        LOG.debug("chk1btime command {} on {} ok.".format(cmd, decom_file))
+        LOG.debug("std: {}".format(std))
+        return True
+
+    LOG.error("chk1btime of {}: This means that the start of the data are bad,"
+              " and that the processing for this data later will fail.".format(decom_file))
+    LOG.debug("Return code: {}".format(returncode))
+    LOG.debug("std: {}".format(std))
+    LOG.debug("err: {}".format(err))
+    LOG.debug("status: {}".format(status))
+    return False
+
+
+def _run_metop_decom(job, cmd, accepted_return_codes, decom_file, tail_lines=None):
+    """Run one metop decom command, return True if it succeeded."""
+    stdout_logfile = "{}.log".format(cmd.split()[0])
+    try:
+        status, returncode, std, err = run_shell_command(cmd, stdout_logfile=stdout_logfile,
+                                                         my_cwd=job.cwd, my_env=job.env, tail_lines=tail_lines,
+                                                         accepted_return_codes=accepted_return_codes)
+    except Exception:
+        LOG.error("Command {} failed.".format(cmd))
+        return False
+
+    if returncode not in accepted_return_codes:
+        LOG.error("Command {} failed with return code {}.".format(cmd, returncode))
+        return False
+
+    LOG.info("Command {} complete.".format(cmd))
+    if not os.path.exists(job.path(decom_file)):
+        LOG.warning("Decom gave OK status, but no data is produced. Something is wrong")
+    return True
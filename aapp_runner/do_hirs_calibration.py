@@ -42,13 +42,12 @@ def do_hirs_calibration(process_config, msg, timestamp):
     # A list of accepted return codes for the various scripts/binaries run in this function
     accepted_return_codes_hirs_historic_file_manage = [0]
 
-    # This function relays on beeing in a working directory
-    current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
+    job = process_config.get_job_context()
+    tail_lines = process_config.get_output_tail_lines('hirs')
     hirs_version_use = None
-    hirs_version = os.getenv('HIRSCL_VERSION', 0)
+    hirs_version = job.getenv('HIRSCL_VERSION', 0)
     hirs_version_list = hirs_version.split()
-    hirs_sats = os.getenv('HIRSCL_SAT', 'default')
+    hirs_sats = job.getenv('HIRSCL_SAT', 'default')
     hirs_sat_list = hirs_sats.split()
     index = 0
     for sat in hirs_sat_list:
@@ -75,15 +74,17 @@ def do_hirs_calibration(process_config, msg, timestamp):
     elif int(hirs_version_use) == 0 or "".join(process_config['a_tovs']) == 'TOVS':
         calibration_location = "-c -l"
     elif int(hirs_version_use) == 1:
-        file_historic = os.path.join(os.getenv('PAR_CALIBRATION_MONITOR'),
+        file_historic = os.path.join(job.getenv('PAR_CALIBRATION_MONITOR'),
                                      process_config['platform_name'], "hirs_historic.txt")
         if os.path.exists(file_historic):
-            cmd = "hirs_historic_file_manage -m {} -r {} -n {} {}".format(os.getenv('HIST_SIZE_HIGH'),
-                                                                          os.getenv('HIST_SIZE_LOW'),
-                                                                          os.getenv('HIST_NMAX'),
+            cmd = "hirs_historic_file_manage -m {} -r {} -n {} {}".format(job.getenv('HIST_SIZE_HIGH'),
+                                                                          job.getenv('HIST_SIZE_LOW'),
+                                                                          job.getenv('HIST_NMAX'),
                                                                           file_historic)
             try:
-                status, returncode, std, err = run_shell_command(cmd)
+                status, returncode, std, err = run_shell_command(
+                    cmd, my_cwd=job.cwd, my_env=job.env, tail_lines=tail_lines,
+                    accepted_return_codes=accepted_return_codes_hirs_historic_file_manage)
             except:
                 LOG.error("Command {} failed.".format(cmd))
                 return_status = False
@@ -99,14 +100,15 @@ def do_hirs_calibration(process_config, msg, timestamp):
         if return_status:
             cmd = "hcalcb1_algoV4 -s {0} -y {1:%Y} -m {1:%m} -d {1:%d} -h {1:%H} -n {1:%M}".format(process_config['platform_name'], timestamp)
             try:
-                status, returncode, std, err = run_shell_command(cmd)
+                status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=job.env,
+                                                                 tail_lines=tail_lines)
             except:
                 import sys
                 LOG.error("Command {} failed with {}.".format(cmd, sys.exc_info()[0]))
             else:
                 if returncode != 0:
                     LOG.error("Command {} failed with {}".format(cmd, returncode))
-                    _hirs_file = open(hirs_err_file, "w")
+                    _hirs_file = open(job.path(hirs_err_file), "w")
                     _hirs_file.write(std)
                     _hirs_file.write(err)
                     _hirs_file.close()
@@ -135,22 +137,17 @@ def do_hirs_calibration(process_config, msg, timestamp):
 
         try:
             status, returncode, out, err = run_shell_command(cmd, stdout_logfile="{}.log".format(hirs_script),
-                                                             stderr_logfile="{}".format(hirs_err_file))
+                                                             stderr_logfile="{}".format(hirs_err_file),
+                                                             my_cwd=job.cwd, my_env=job.env)
         except:
             import sys
             LOG.error("Command {} failed {}.".format(cmd, sys.exc_info()[0]))
         else:
             if (returncode != 0):
-                LOG.error("Command {} failed with {}".format(cmd, returncode))
-                _hirs_file = open(hirs_err_file, "w")
-                _hirs_file.write(out)
-                _hirs_file.write(err)
-                _hirs_file.close()
+                LOG.error("Command {} failed with {}. See {}.log and {}".format(
+                    cmd, returncode, hirs_script, hirs_err_file))
                 return_status = False
 
-    # Change back after this is done
-    os.chdir(current_dir)
-
     LOG.info("do_hirs_calibration complete!")
 
     return return_status
@@ -25,7 +25,18 @@
 '''Helper functions for aapp runner
 '''
 
+import asyncio
+import hashlib
 import logging
+import os
+from collections import deque
+from contextlib import contextmanager
+from subprocess import PIPE, STDOUT
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 LOGGER = logging.getLogger(__name__)
 
@@ -44,7 +55,18 @@ def check_if_scene_is_unique(config):
     LOGGER.debug("config - collection_area_id: %s", str(config['collection_area_id']))
 
     # Use sat id, start and end time and area_id as the unique identifier of the scene!
-    if (config['platform_name'] in config.job_register and
+    if hasattr(config.job_register, 'find_overlap'):
+        # A JobRegistry, indexed by platform and area
+        status = config.job_register.find_overlap(config['platform_name'], config['collection_area_id'],
+                                                  config['starttime'], config['endtime'])
+        if status:
+            LOGGER.info("Processing of scene " + config['platform_name'] +
+                        " " + str(status[0]) + " " + str(status[1]) +
+                        " with overlapping time has been"
+                        " launched previously. Skip it!")
+            return False
+
+    elif (config['platform_name'] in config.job_register and
             len(config.job_register[config['platform_name']]) > 0):
 
         # Go through list of start,end time tuples and see if the current
@@ -87,6 +109,51 @@ def create_scene_id(config):
     return scene_id
 
 
+def hash_file(filename):
+    """Get the sha256 hex digest of the content of *filename*."""
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as fd_:
+        for chunk in iter(lambda: fd_.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def replace_symlink(src, dst):
+    """Make *dst* a symbolic link to *src*, replacing any file or link *dst* already there.
+
+    A working directory reused for a resumed pass has the links of the
+    previous attempt left, on which os.symlink would fail.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.symlink(src, dst)
+
+
+@contextmanager
+def file_lock(lock_filename, shared=False):
+    """Hold an advisory lock on *lock_filename*, shared for reading or exclusive for writing.
+
+    The lock is taken with flock on the lock file, created if needed, so it
+    holds between processes as well as between threads. Without fcntl, no
+    lock is taken.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(lock_filename), exist_ok=True)
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    with open(lock_filename, 'a') as fd_:
+        try:
+            fcntl.flock(fd_, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            LOGGER.info("Waiting for the lock {} held by another job.".format(lock_filename))
+            fcntl.flock(fd_, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd_, fcntl.LOCK_UN)
+
+
 def overlapping_timeinterval(start_end_times, timelist):
     """From a list of start and end times check if the current time interval
     overlaps with one or more"""
@@ -103,11 +170,49 @@ def overlapping_timeinterval(start_end_times, timelist):
 
 
 def run_shell_command(command, use_shell=False, use_shlex=True, my_cwd=None,
-                      my_env=None, stdout_logfile=None, stderr_logfile=None, stdin=None, my_timeout=24 * 60 * 60):
+                      my_env=None, stdout_logfile=None, stderr_logfile=None, stdin=None, my_timeout=24 * 60 * 60,
+                      tail_lines=None, accepted_return_codes=None):
     """Run the given command as a shell and get the return code, stdout and stderr
         Returns True/False and return code.
+
+    Relative stdout_logfile and stderr_logfile paths are relative to my_cwd
+    (if given), like the paths used by the command itself. Output going to a
+    log file is written there by the command directly and not kept in
+    memory, so it is returned as an empty string. The same file may be given
+    for both.
+
+    By default all the other output is logged at debug level, line by line.
+    If tail_lines is given, only the last tail_lines lines of it are kept,
+    returned, and logged (as errors) if the return code is not one of the
+    accepted_return_codes (default [0]).
+
+    This runs run_shell_command_async in an event loop of its own, so it may be
+    called from any thread, also several commands at the same time.
+    """
+    return asyncio.run(run_shell_command_async(command, use_shell=use_shell, use_shlex=use_shlex,
+                                               my_cwd=my_cwd, my_env=my_env,
+                                               stdout_logfile=stdout_logfile, stderr_logfile=stderr_logfile,
+                                               stdin=stdin, my_timeout=my_timeout,
+                                               tail_lines=tail_lines, accepted_return_codes=accepted_return_codes))
+
+
+async def run_shell_command_async(command, use_shell=False, use_shlex=True, my_cwd=None,
+                                  my_env=None, stdout_logfile=None, stderr_logfile=None, stdin=None,
+                                  my_timeout=24 * 60 * 60, tail_lines=None, accepted_return_codes=None):
+    """Run the given command in a subprocess and get the return code, stdout and stderr.
+
+    Same arguments and return values as run_shell_command. The command is
+    run in a process group of its own. If it takes more than my_timeout
+    seconds, or the coroutine is cancelled, the whole process group (the
+    AAPP scripts and all the programs they started) is killed. On timeout,
+    (False, None, out, err) is returned, with the tail_lines last lines of
+    output so far (empty without tail_lines).
     """
-    from subprocess import PIPE, Popen
+    if my_cwd is not None:
+        if stdout_logfile is not None:
+            stdout_logfile = os.path.join(my_cwd, stdout_logfile)
+        if stderr_logfile is not None:
+            stderr_logfile = os.path.join(my_cwd, stderr_logfile)
 
     if stdin is not None:
         stdin = stdin.encode('utf-8')
@@ -119,10 +224,30 @@ def run_shell_command(command, use_shell=False, use_shlex=True, my_cwd=None,
     else:
         myargs = command
 
+    if isinstance(myargs, str):
+        myargs = [myargs]
+    if use_shell:
+        # Like Popen with shell=True
+        myargs = ['/bin/sh', '-c'] + list(myargs)
+
     try:
-        proc = Popen(myargs,
-                     cwd=my_cwd, shell=use_shell, env=my_env,
-                     stderr=PIPE, stdout=PIPE, stdin=PIPE, close_fds=True)
+        stdout = stderr = PIPE
+        if stdout_logfile is not None:
+            stdout = open(stdout_logfile, 'wb')
+        if stderr_logfile is not None and stderr_logfile == stdout_logfile:
+            stderr = STDOUT
+        elif stderr_logfile is not None:
+            stderr = open(stderr_logfile, 'wb')
+    except IOError as e:
+        LOGGER.error("IO operation to log file of command: {} failed with {}".format(command, e))
+        _close_logfiles(stdout, stderr)
+        return False
+
+    try:
+        proc = await asyncio.create_subprocess_exec(*myargs,
+                                                    cwd=my_cwd, env=my_env,
+                                                    stderr=stderr, stdout=stdout, stdin=PIPE,
+                                                    close_fds=True, start_new_session=True)
 
         LOGGER.debug("Process pid: {}".format(proc.pid))
     except OSError as e:
@@ -131,65 +256,111 @@ def run_shell_command(command, use_shell=False, use_shlex=True, my_cwd=None,
     except ValueError:
         LOGGER.error("Popen called with invalid arguments.")
         return False
-    except:
+    except Exception:
         LOGGER.error("Popen failed for an unknown reason.")
         return False
+    finally:
+        # The command has its own copy of the log file descriptors
+        _close_logfiles(stdout, stderr)
 
-    import signal
-
-    class Alarm(Exception):
-        pass
-
-    def alarm_handler(signum, frame):
-        raise Alarm
-
-    signal.signal(signal.SIGALRM, alarm_handler)
-    signal.alarm(my_timeout)
+    tails = None if tail_lines is None else (deque(maxlen=tail_lines), deque(maxlen=tail_lines))
     try:
         LOGGER.debug("Before call to communicate:")
-        if stdin is None:
-            out, err = proc.communicate()
+        if tails is None:
+            out, err = await asyncio.wait_for(proc.communicate(input=stdin), my_timeout)
         else:
-            out, err = proc.communicate(input=stdin)
+            out, err = await asyncio.wait_for(_communicate_tail(proc, stdin, tails), my_timeout)
 
-        out = out.decode('utf-8')
-        err = err.decode('utf-8')
+        out = out.decode('utf-8', errors='replace') if out is not None else ''
+        err = err.decode('utf-8', errors='replace') if err is not None else ''
 
         return_value = proc.returncode
-        signal.alarm(0)
-    except Alarm:
+    except asyncio.TimeoutError:
         LOGGER.error(
             "Command: {} took to long time(more than {}s) to complete. Terminates the job.".format(command, my_timeout))
-        proc.terminate()
-        return False
+        await _kill_process_group(proc)
+        out, err = ('', '') if tails is None else (b''.join(tail).decode('utf-8', errors='replace') for tail in tails)
+        for line in out.splitlines() + err.splitlines():
+            LOGGER.error(line)
+        return False, None, out, err
+    except asyncio.CancelledError:
+        LOGGER.warning("Command: {} cancelled. Terminates the job.".format(command))
+        await _kill_process_group(proc)
+        raise
 
     LOGGER.debug("communicate complete")
-    lines = out.splitlines()
-    if stdout_logfile is None:
-        for line in lines:
+    if tail_lines is None:
+        for line in out.splitlines():
             LOGGER.debug(line)
-    else:
-        try:
-            _stdout = open(stdout_logfile, 'w')
-            for line in lines:
-                _stdout.write(line + "\n")
-            _stdout.close()
-        except IOError as e:
-            LOGGER.error("IO operation to file stdout_logfile: {} failed with {}".format(stdout_logfile, e))
-            return False
-
-    errlines = err.splitlines()
-    if stderr_logfile is None:
-        for errline in errlines:
+        for errline in err.splitlines():
             LOGGER.debug(errline)
-    else:
-        try:
-            _stderr = open(stderr_logfile, 'w')
-            for errline in errlines:
-                _stderr.write(errline + "\n")
-            _stderr.close()
-        except IOError as e:
-            LOGGER.error("IO operation to file stderr_logfile: {} failed with {}".format(stderr_logfile, e))
-            return False
+    elif return_value not in (accepted_return_codes or [0]):
+        LOGGER.error("Command: {} failed with return code {}. Last lines of output:".format(command, return_value))
+        for line in out.splitlines():
+            LOGGER.error(line)
+        for errline in err.splitlines():
+            LOGGER.error(errline)
 
     return True, return_value, out, err
+
+
+async def _communicate_tail(proc, stdin, tails):
+    """Like proc.communicate, but only keep the last lines of stdout and stderr.
+
+    The lines are kept in the bounded deques *tails*, for stdout and stderr,
+    so these are there also if the command is cancelled.
+    """
+    async def _tail(stream, tail):
+        if stream is None:
+            return None
+        partial = b''
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            lines = (partial + chunk).split(b'\n')
+            # Keep a bounded part of a line not ended yet
+            partial = lines.pop()[-65536:]
+            tail.extend(line + b'\n' for line in lines)
+        if partial:
+            tail.append(partial)
+        return b''.join(tail)
+
+    if stdin is not None:
+        proc.stdin.write(stdin)
+        try:
+            await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    proc.stdin.close()
+
+    out, err = await asyncio.gather(_tail(proc.stdout, tails[0]), _tail(proc.stderr, tails[1]))
+    await proc.wait()
+    return out, err
+
+
+def _close_logfiles(*streams):
+    for stream in streams:
+        if stream not in (PIPE, STDOUT):
+            stream.close()
+
+
+async def _kill_process_group(proc, grace_period=10):
+    """Terminate the process group of *proc*, and kill it if still running after *grace_period* seconds."""
+    import signal
+
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            await asyncio.wait_for(asyncio.shield(proc.wait()), grace_period)
+        except asyncio.TimeoutError:
+            continue
+        # The command itself is done, make sure none of the programs it started are left
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        break
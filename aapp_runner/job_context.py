@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The environment and working directory of one AAPP processing job.
+
+The processing steps used to change the working directory of the process
+(os.chdir) and to write the AAPP variables into os.environ. That only allows
+one pass at the time per process. Instead each job carries its own copy of
+the environment and its own working dir, which are handed to the commands
+run by the steps (see run_shell_command's my_env and my_cwd).
+
+Sourcing the AAPP environment file is the same for every job, so the result
+is cached until the file is changed.
+"""
+
+import logging
+import os
+import threading
+
+from aapp_runner.helper_functions import run_shell_command
+
+LOG = logging.getLogger(__name__)
+
+# The sourced AAPP environments and the AAPP programs found in them, keyed by
+# the environment file, its modification time and AAPP_PREFIX
+_AAPP_ENV_CACHE = {}
+_AAPP_ENV_CACHE_LOCK = threading.Lock()
+
+
+class JobContext(object):
+    """Environment and working directory of one processing job."""
+
+    def __init__(self, cwd=None, env=None):
+        """Initialize the job context.
+
+        The environment is a copy of *env*, or of os.environ if not given.
+        The working dir defaults to the current working dir of the process.
+        """
+        if cwd is None:
+            cwd = os.getcwd()
+        if env is None:
+            env = os.environ
+        self.cwd = cwd
+        self.env = dict(env)
+
+    def getenv(self, key, default=None):
+        """Get an environment variable of the job."""
+        return self.env.get(key, default)
+
+    def setenv(self, key, value):
+        """Set an environment variable of the job.
+
+        The environment is replaced rather than changed in place, as steps
+        running at the same time may be passing it on to their commands.
+        """
+        env = dict(self.env)
+        env[key] = value
+        self.env = env
+
+    def path(self, *paths):
+        """Get the path of a file (relative to the working dir) of the job."""
+        return os.path.join(self.cwd, *paths)
+
+    def __repr__(self):
+        return "JobContext(cwd={!r})".format(self.cwd)
+
+
+def which(program, path=None):
+    """Check if executable is available in the system environment path.
+
+    Search *path* instead of the PATH of the process if given.
+    """
+    # Check if needed executable are available in the
+    # environment search path.
+    # Taken from https://stackoverflow.com/questions/377017/test-if-executable-exists-in-python
+    def is_exe(fpath):
+        return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+
+    fpath, fname = os.path.split(program)
+    if fpath:
+        if is_exe(program):
+            return program
+    else:
+        if path is None:
+            path = os.environ['PATH']
+        for path_dir in path.split(os.pathsep):
+            exe_file = os.path.join(path_dir, program)
+            if is_exe(exe_file):
+                return exe_file
+    return None
+
+
+def _aapp_env_cache_key(aapp_env_file, env):
+    try:
+        mtime = os.stat(aapp_env_file).st_mtime_ns
+    except OSError:
+        return None
+    return (os.path.abspath(aapp_env_file), mtime, env.get("AAPP_PREFIX"))
+
+
+def source_aapp_environment(aapp_env_file, env, programs=()):
+    """Get the environment given by sourcing the AAPP environment file.
+
+    The file is sourced in bash on top of *env*. The parsed environment and
+    the paths of the *programs* found in its PATH are cached until the
+    environment file is changed (or AAPP_PREFIX is). Returns a tuple of a
+    new dict of the environment and a dict of program paths (None if a
+    program is not found), or None if the environment file could not be
+    sourced.
+    """
+    key = _aapp_env_cache_key(aapp_env_file, env)
+    with _AAPP_ENV_CACHE_LOCK:
+        cached = _AAPP_ENV_CACHE.get(key) if key is not None else None
+    if cached is None:
+        status, returncode, out, err = run_shell_command(
+            "bash -c \"source {}\";env".format(aapp_env_file), my_env=env)
+        if not status:
+            LOG.error("Failed to run the bash source env command for " + str(aapp_env_file))
+            return None
+        aapp_env = {}
+        for line in out.splitlines():
+            if line:
+                (var, _, value) = line.partition("=")
+                aapp_env[var] = value
+        cached = (aapp_env, {})
+        if key is not None:
+            with _AAPP_ENV_CACHE_LOCK:
+                cached = _AAPP_ENV_CACHE.setdefault(key, cached)
+    else:
+        LOG.debug("Using cached AAPP environment of {}".format(aapp_env_file))
+
+    aapp_env, program_paths = cached
+    with _AAPP_ENV_CACHE_LOCK:
+        for program in programs:
+            if program not in program_paths:
+                program_paths[program] = which(program, aapp_env.get('PATH', ''))
+        found = {program: program_paths[program] for program in programs}
+    return dict(aapp_env), found
+
+
+def clear_aapp_environment_cache():
+    """Forget all the cached AAPP environments."""
+    with _AAPP_ENV_CACHE_LOCK:
+        _AAPP_ENV_CACHE.clear()
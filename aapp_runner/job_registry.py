@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The register of the passes being processed or processed recently.
+
+The passes are kept per platform and collection area, sorted by start time,
+so a pass overlapping with a new one is found with a binary search instead of
+going through all the registered passes. Passes are blocked for rerun for a
+while after they are processed; one scheduler thread takes care of releasing
+them all when their time is up.
+
+With PersistentJobRegistry the register is also kept in an SQLite database,
+so the passes blocked for rerun are still blocked after a restart.
+"""
+
+import heapq
+import logging
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from itertools import count
+from time import monotonic
+from time import time as _time
+
+from aapp_runner.helper_functions import overlapping_timeinterval
+
+LOG = logging.getLogger(__name__)
+
+
+class JobRegistry(object):
+    """Register of passes, by platform name, of (starttime, endtime, collection_area_id)."""
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        # (platform_name, area_id) -> sorted list of (starttime, endtime)
+        self._intervals = {}
+        # (platform_name, area_id) -> longest registered pass, to bound the search
+        self._longest = {}
+        self._expiry_heap = []
+        self._expiry_counter = count()
+        self._expiry_thread = None
+
+    def add(self, platform_name, job_key):
+        """Register the pass *job_key* (starttime, endtime, area_id) of *platform_name*."""
+        starttime, endtime, area_id = job_key
+        with self._lock:
+            index = (platform_name, area_id)
+            insort(self._intervals.setdefault(index, []), (starttime, endtime))
+            duration = endtime - starttime
+            if index not in self._longest or duration > self._longest[index]:
+                self._longest[index] = duration
+
+    def remove(self, platform_name, job_key):
+        """Remove the pass *job_key* of *platform_name*, return False if it is not registered."""
+        starttime, endtime, area_id = job_key
+        with self._lock:
+            intervals = self._intervals.get((platform_name, area_id), [])
+            pos = bisect_left(intervals, (starttime, endtime))
+            if pos < len(intervals) and intervals[pos] == (starttime, endtime):
+                del intervals[pos]
+                return True
+        return False
+
+    def find_overlap(self, platform_name, area_id, starttime, endtime):
+        """Get the (starttime, endtime) of a registered pass overlapping with the given times, or False."""
+        with self._lock:
+            index = (platform_name, area_id)
+            intervals = self._intervals.get(index)
+            if not intervals:
+                return False
+            # Only passes starting less than the longest pass before starttime can overlap
+            first = bisect_left(intervals, (starttime - self._longest[index],))
+            last = bisect_right(intervals, (endtime, endtime + self._longest[index]))
+            return overlapping_timeinterval((starttime, endtime), intervals[first:last])
+
+    def expire(self, platform_name, job_key, delay):
+        """Remove the pass *job_key* of *platform_name* from the register in *delay* seconds."""
+        with self._lock:
+            heapq.heappush(self._expiry_heap, (monotonic() + delay, next(self._expiry_counter),
+                                               platform_name, job_key))
+            if self._expiry_thread is None:
+                self._expiry_thread = threading.Thread(target=self._run_expiry, name="JobRegistryExpiry",
+                                                       daemon=True)
+                self._expiry_thread.start()
+            self._lock.notify()
+
+    def _run_expiry(self):
+        with self._lock:
+            while True:
+                if not self._expiry_heap:
+                    self._lock.wait()
+                    continue
+                expiry_time, _, platform_name, job_key = self._expiry_heap[0]
+                now = monotonic()
+                if expiry_time > now:
+                    self._lock.wait(expiry_time - now)
+                    continue
+                heapq.heappop(self._expiry_heap)
+                if self.remove(platform_name, job_key):
+                    LOG.debug("Release/reset job-key {} {} {} {} from job registry".format(platform_name, *job_key))
+                else:
+                    LOG.warning("Nothing to reset/release - Register didn't contain any entry "
+                                "matching: {} {}".format(platform_name, job_key))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(intervals) for intervals in self._intervals.values())
+
+    def __str__(self):
+        with self._lock:
+            register = {}
+            for (platform_name, area_id), intervals in self._intervals.items():
+                register.setdefault(platform_name, []).extend(
+                    (starttime, endtime, area_id) for starttime, endtime in intervals)
+        return str(register)
+
+
+class PersistentJobRegistry(JobRegistry):
+    """Job registry kept in an SQLite database as well as in memory.
+
+    On startup the passes still blocked for rerun are loaded from the
+    database, and the rest are pruned. Passes registered but not yet
+    blocked for rerun were being processed when the runner stopped, so these
+    are dropped to let them be processed again.
+    """
+
+    def __init__(self, filename):
+        super(PersistentJobRegistry, self).__init__()
+        self.filename = filename
+        self._db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs (platform_name TEXT, area_id TEXT, "
+                         "starttime TEXT, endtime TEXT, expires REAL)")
+        self._load()
+
+    def _load(self):
+        now = _time()
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE expires IS NULL OR expires <= ?", (now,))
+            rows = self._db.execute("SELECT platform_name, area_id, starttime, endtime, expires FROM jobs").fetchall()
+            for platform_name, area_id, starttime, endtime, expires in rows:
+                job_key = (datetime.fromisoformat(starttime), datetime.fromisoformat(endtime), area_id)
+                super(PersistentJobRegistry, self).add(platform_name, job_key)
+                super(PersistentJobRegistry, self).expire(platform_name, job_key, expires - now)
+        LOG.info("Loaded {} passes blocked for rerun from {}".format(len(rows), self.filename))
+
+    def add(self, platform_name, job_key):
+        starttime, endtime, area_id = job_key
+        with self._lock:
+            super(PersistentJobRegistry, self).add(platform_name, job_key)
+            self._db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, NULL)",
+                             (platform_name, area_id, starttime.isoformat(), endtime.isoformat()))
+
+    def remove(self, platform_name, job_key):
+        starttime, endtime, area_id = job_key
+        with self._lock:
+            if not super(PersistentJobRegistry, self).remove(platform_name, job_key):
+                return False
+            self._db.execute("DELETE FROM jobs WHERE rowid = (SELECT rowid FROM jobs WHERE platform_name = ? "
+                             "AND area_id IS ? AND starttime = ? AND endtime = ? LIMIT 1)",
+                             (platform_name, area_id, starttime.isoformat(), endtime.isoformat()))
+        return True
+
+    def expire(self, platform_name, job_key, delay):
+        starttime, endtime, area_id = job_key
+        with self._lock:
+            self._db.execute("UPDATE jobs SET expires = ? WHERE rowid = (SELECT rowid FROM jobs "
+                             "WHERE platform_name = ? AND area_id IS ? AND starttime = ? AND endtime = ? "
+                             "AND expires IS NULL LIMIT 1)",
+                             (_time() + delay, platform_name, area_id, starttime.isoformat(), endtime.isoformat()))
+            super(PersistentJobRegistry, self).expire(platform_name, job_key, delay)
+
+
+def create_job_registry(filename=None):
+    """Create a job registry, kept in the database *filename* if given."""
+    if filename:
+        return PersistentJobRegistry(filename)
+    return JobRegistry()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Gather the messages of the instruments of one pass into one dataset message.
+
+Metop data comes as one file (and one message) per instrument. Processed one
+by one, the first message registers the pass and the others are skipped as
+overlapping, or run as passes of their own. The collector holds the messages
+for a while, grouped by pass_key (or by platform and overlapping time if there
+is no pass_key), and gives one dataset message for all the instruments.
+"""
+
+import logging
+from time import monotonic
+
+from posttroll.message import Message
+
+from aapp_runner.helper_functions import overlapping_timeinterval
+
+LOG = logging.getLogger(__name__)
+
+
+class _PassMessages(object):
+    """The messages collected for one pass."""
+
+    def __init__(self, msg, deadline):
+        self.deadline = deadline
+        self.pass_key = msg.data.get('pass_key')
+        self.platform_name = msg.data['platform_name']
+        self.start_time = msg.data['start_time']
+        self.end_time = msg.data.get('end_time', msg.data['start_time'])
+        self.messages = []
+        self.sensors = set()
+
+    def matches(self, msg):
+        if self.pass_key is not None or msg.data.get('pass_key') is not None:
+            return self.pass_key == msg.data.get('pass_key')
+        if msg.data['platform_name'] != self.platform_name:
+            return False
+        end_time = msg.data.get('end_time', msg.data['start_time'])
+        return bool(overlapping_timeinterval((msg.data['start_time'], end_time),
+                                             [(self.start_time, self.end_time)]))
+
+    def add(self, msg):
+        sensors = _get_sensors(msg)
+        if self.sensors.intersection(sensors):
+            LOG.debug("Already got {} for this pass, skip {}".format(sensors, msg.data.get('uid')))
+            return
+        self.sensors.update(sensors)
+        self.messages.append(msg)
+        self.start_time = min(self.start_time, msg.data['start_time'])
+        self.end_time = max(self.end_time, msg.data.get('end_time', msg.data['start_time']))
+
+    def to_message(self):
+        """Make one dataset message of the collected messages."""
+        first = self.messages[0]
+        if len(self.messages) == 1:
+            return first
+        data = first.data.copy()
+        for key in ('uri', 'uid', 'sensor'):
+            data.pop(key, None)
+        data['sensor'] = []
+        data['dataset'] = []
+        for msg in self.messages:
+            for sensor in _get_sensors(msg):
+                data['sensor'].append(sensor)
+                data['dataset'].append({'uri': msg.data['uri'], 'uid': msg.data.get('uid')})
+        data['start_time'] = self.start_time
+        data['end_time'] = self.end_time
+        return Message(first.subject, 'dataset', data)
+
+
+def _get_sensors(msg):
+    sensors = msg.data.get('sensor', [])
+    if isinstance(sensors, str):
+        return [sensors]
+    return list(sensors)
+
+
+class PassCollector(object):
+    """Collect the per instrument messages of passes for *window* seconds."""
+
+    def __init__(self, window):
+        self.window = window
+        self._passes = []
+
+    def add(self, msg):
+        """Add a file message to the pass it belongs to."""
+        for pass_messages in self._passes:
+            if pass_messages.matches(msg):
+                break
+        else:
+            pass_messages = _PassMessages(msg, monotonic() + self.window)
+            self._passes.append(pass_messages)
+            LOG.debug("Collect messages for pass {} {} for {}s".format(
+                msg.data['platform_name'], msg.data.get('pass_key', msg.data['start_time']), self.window))
+        pass_messages.add(msg)
+
+    def get_ready(self, now=None):
+        """Get the messages of the passes collected for the whole window, one per pass."""
+        if now is None:
+            now = monotonic()
+        ready = [pass_messages for pass_messages in self._passes if pass_messages.deadline <= now]
+        self._passes = [pass_messages for pass_messages in self._passes if pass_messages.deadline > now]
+        return [pass_messages.to_message() for pass_messages in ready]
+
+    def __len__(self):
+        return len(self._passes)
@@ -26,6 +26,10 @@ import copy
 import os
 from socket import gaierror, gethostbyaddr, gethostname
 
+from aapp_runner.job_context import JobContext
+from aapp_runner.job_registry import create_job_registry
+from aapp_runner.result_cache import create_result_cache
+
 
 class StationError(RuntimeError):
     """Mismatching station name on commandline compared to config or wrong station."""
@@ -97,7 +101,19 @@ OPTIONAL_CONFIG_VARIABLES = [
     'tle_indir',
     'tle_infile_format',
     'tle_file_to_data_diff_limit_days',
-    'tle_archive_dir'
+    'tle_archive_dir',
+    'max_concurrent_passes',
+    'max_concurrent_steps',
+    'output_tail_lines',
+    'job_registry_file',
+    'pass_collect_window',
+    'resume_failed_passes',
+    'resume_failed_passes_max_age',
+    'result_cache_file',
+    'result_cache_max_age',
+    'tle_watch_interval',
+    'prefilter_tle_files',
+    'tle_store_file'
 ]
 
 #
@@ -322,8 +338,12 @@ class AappL1Config(object):
         self.orig_config = copy.deepcopy(config)
         self.config = config
         self.process_name = process_name
-        self.job_register = {}
-        self.local_env = {}
+        self.job_register = create_job_registry(self.get_parameter('job_registry_file'))
+        self.result_cache = create_result_cache(self.get_parameter('result_cache_file'),
+                                                self.get_parameter('result_cache_max_age'))
+        self.job_context = None
+        self.pass_report = None
+        self.checkpoint = None
 
     def __getitem__(self, key):
         try:
@@ -341,8 +361,33 @@ class AappL1Config(object):
         """
         self.config = {}
         self.config = copy.deepcopy(self.orig_config)
-        self.local_env = {}
-        self.local_env = os.environ.copy()
+        self.job_context = None
+        self.pass_report = None
+        self.checkpoint = None
+
+    def get_job_context(self):
+        """Get the environment and working dir of the current job.
+
+        If not set up already, the job context is made from the configured
+        working dir and a copy of os.environ.
+        """
+        if self.job_context is None:
+            self.job_context = JobContext(self.get_parameter('working_dir'))
+        return self.job_context
+
+    def get_output_tail_lines(self, step):
+        """Get the number of lines of command output to keep for the processing *step*.
+
+        The output_tail_lines option is either a number for all the steps,
+        or a dict with a number per step name and an optional default.
+        None means all the output is logged.
+        """
+        tail_lines = self.get_parameter('output_tail_lines')
+        if isinstance(tail_lines, dict):
+            tail_lines = tail_lines.get(step, tail_lines.get('default'))
+        if tail_lines is None:
+            return None
+        return int(tail_lines)
 
     def add_process_config_paramenter(self, config_key, config_value):
         """
@@ -60,8 +60,9 @@ def rename_file(process_config, values):
         
     new_name = ""
     
+    aapp_file = process_config.get_job_context().path(values[sensor]['aapp_file'])
     if process_config[process_file]:
-        if os.path.exists(values[sensor]['aapp_file']):
+        if os.path.exists(aapp_file):
             try:
                 _outdir = compose(tmp_process_config['aapp_outdir_format'],tmp_process_config)
                 dir = os.path.join(tmp_process_config['aapp_outdir_base'], _outdir)
@@ -85,15 +86,15 @@ def rename_file(process_config, values):
    
             try:
                 #shutil.move(process_config['aapp_static_configuration']['decommutation_files'][inputfile],new_name)
-                shutil.move(values[sensor]['aapp_file'], new_name)
+                shutil.move(aapp_file, new_name)
                 #LOG.debug("Renamed: {} to {}".format(process_config['aapp_static_configuration']['decommutation_files'][inputfile], new_name))
-                LOG.debug("Renamed: {} to {}".format(values[sensor]['aapp_file'], new_name))
+                LOG.debug("Renamed: {} to {}".format(aapp_file, new_name))
             except OSError as e:
                 LOG.error("Failed to rename {} to {}. {}".format(process_config[inputfile],new_name,e))
                 LOG.error("Please check previous processing")
                 return False
         else:
-            LOG.error("Excpected file {} does not exists. Please check previous processing.".format(values[sensor]['aapp_file']))
+            LOG.error("Excpected file {} does not exists. Please check previous processing.".format(aapp_file))
             return False
     else:
         return False
@@ -108,10 +109,6 @@ def rename_file(process_config, values):
 def rename_aapp_filenames(process_config):
     LOG.debug("Rename AAPP filenames ... ")
 
-    #This function relays on beeing in a working directory
-    current_dir = os.getcwd() #Store the dir to change back to after function complete
-    os.chdir(process_config['aapp_processes'][process_config.process_name]['working_dir'])
-
     files = []
     for values in process_config['aapp_processes'][process_config.process_name]['rename_aapp_files']:
         #print values
@@ -125,10 +122,6 @@ def rename_aapp_filenames(process_config):
         if file:
             files.append(file)
 
-            
-    #Change back after this is done
-    os.chdir(current_dir)
-
     if len(files) > 0:
         LOG.info("Renamed aapp files complete into: {}!".format(os.path.dirname(files[0]['file'])))
     return files
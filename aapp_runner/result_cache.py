@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the results of processed passes, keyed by the content of the input.
+
+The same level 0 file may come twice, long after the job registry stopped
+blocking it. The key of a pass is made from the sha256 of its input files,
+the process configuration and the AAPP installation, and the cache keeps the
+renamed output files of each key in an SQLite database. If the files are still
+there, these are published again instead of processing the pass once more.
+The results of which the files are gone, or older than the maximum age, are
+pruned when the cache is opened.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from time import time as _time
+
+from aapp_runner.helper_functions import hash_file
+
+LOG = logging.getLogger(__name__)
+
+# Keys of the process config set per pass, not changing the result
+_VOLATILE_PARAMETERS = ('working_dir', 'result_cache_max_age')
+
+
+def _get_input_files(config):
+    """Get the input files of the pass, from the input_*_file keys of the process config."""
+    return sorted(set(value for key, value in config.config.items()
+                      if key.startswith('input_') and key.endswith('_file') and value))
+
+
+def _get_aapp_version(config):
+    """Identify the AAPP installation by its prefix and the content of its environment file."""
+    aapp_prefix = config.get_parameter('aapp_prefix')
+    aapp_env_file = os.path.join(aapp_prefix, config.get_parameter('aapp_environment_file'))
+    try:
+        env_digest = hash_file(aapp_env_file)
+    except OSError:
+        env_digest = None
+    return [aapp_prefix, env_digest]
+
+
+def get_cache_key(config):
+    """Get the cache key of the pass in *config*.
+
+    Raise OSError if an input file can not be read.
+    """
+    sha = hashlib.sha256()
+    for filename in _get_input_files(config):
+        sha.update(hash_file(filename).encode())
+    process_config = {key: value for key, value in config['aapp_processes'][config.process_name].items()
+                      if key not in _VOLATILE_PARAMETERS}
+    process_flags = {key: value for key, value in config.config.items() if key.startswith('process_')}
+    relevant_config = {'platform_name': config['platform_name'],
+                       'process_config': process_config,
+                       'process_flags': process_flags,
+                       'static_config': config['aapp_static_configuration'],
+                       'aapp': _get_aapp_version(config)}
+    sha.update(json.dumps(relevant_config, sort_keys=True, default=str).encode())
+    return sha.hexdigest()
+
+
+class ResultCache(object):
+    """The renamed output files of processed passes, kept in the SQLite database *filename*.
+
+    The results older than *max_age* hours are dropped, if given.
+    """
+
+    def __init__(self, filename, max_age=None):
+        self.filename = filename
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, files TEXT, created REAL)")
+        self.prune()
+
+    def _expire(self):
+        """Remove the results older than max_age, with the lock held."""
+        if self.max_age is not None:
+            self._db.execute("DELETE FROM results WHERE created < ?", (_time() - self.max_age * 3600,))
+
+    def prune(self):
+        """Remove the results which expired or of which files are gone."""
+        with self._lock:
+            self._expire()
+            rows = self._db.execute("SELECT key, files FROM results").fetchall()
+        gone = [key for key, files in rows
+                if not all(os.path.exists(item['file']) for item in json.loads(files))]
+        with self._lock:
+            self._db.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in gone])
+        if gone:
+            LOG.info("Pruned {} results of which files are gone from {}".format(len(gone), self.filename))
+
+    def get(self, key):
+        """Get the output files of *key*, or None if not cached, expired or the files are gone."""
+        with self._lock:
+            self._expire()
+            row = self._db.execute("SELECT files FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        files = json.loads(row[0])
+        missing = [item['file'] for item in files if not os.path.exists(item['file'])]
+        if missing:
+            LOG.info("Cached result {} is gone, missing: {}".format(key, missing))
+            self.remove(key)
+            return None
+        return files
+
+    def put(self, key, files):
+        """Cache the output *files* of *key*."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(files), _time()))
+
+    def remove(self, key):
+        """Remove the cached result of *key*."""
+        with self._lock:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+
+
+def create_result_cache(filename=None, max_age=None):
+    """Create a result cache in the database *filename*, or None if no filename is given.
+
+    The results are kept *max_age* hours, or until their files are gone if not given.
+    """
+    if filename:
+        return ResultCache(filename, None if max_age is None else float(max_age))
+    return None
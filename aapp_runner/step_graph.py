@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run the processing steps of a pass as a graph of dependencies.
+
+Steps without dependencies between them (like the HIRS, ATOVS and AVHRR
+calibrations, which each work on their own l1b file) may run at the same
+time. A step is started when all the steps it depends on are done, whatever
+their result, just like the steps used to run one after another. If a step
+raises an exception, the steps depending on it are skipped.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import time as _time
+
+LOG = logging.getLogger(__name__)
+
+
+class StepResult(object):
+    """The result of one processing step."""
+
+    def __init__(self, name, status, duration=0.0, exception=None):
+        """Initialize the result.
+
+        *status* is True or False as returned by the step, or None if the
+        step raised an exception or was skipped.
+        """
+        self.name = name
+        self.status = status
+        self.duration = duration
+        self.exception = exception
+
+    @property
+    def skipped(self):
+        """Whether the step was skipped."""
+        return self.status is None and self.exception is None
+
+    def __repr__(self):
+        if self.exception is not None:
+            state = "raised {!r}".format(self.exception)
+        elif self.skipped:
+            state = "skipped"
+        else:
+            state = "ok" if self.status else "failed"
+        return "{}: {} ({:.1f}s)".format(self.name, state, self.duration)
+
+
+class PassReport(object):
+    """The results of all the processing steps of a pass, in the order they finished."""
+
+    def __init__(self):
+        self.results = {}
+
+    def add(self, result):
+        self.results[result.name] = result
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def __contains__(self, name):
+        return name in self.results
+
+    @property
+    def ok(self):
+        """Whether all the steps were run and succeeded."""
+        return all(result.status for result in self.results.values())
+
+    def failed(self):
+        """Get the names of the steps which returned False."""
+        return [name for name, result in self.results.items() if result.status is False]
+
+    def first_exception(self):
+        """Get the first exception raised by a step, or None."""
+        for result in self.results.values():
+            if result.exception is not None:
+                return result.exception
+        return None
+
+    def __str__(self):
+        return "; ".join(repr(result) for result in self.results.values())
+
+
+class StepGraph(object):
+    """A graph of processing steps and their dependencies."""
+
+    def __init__(self):
+        self._steps = {}
+
+    def add_step(self, name, func, args=(), depends_on=()):
+        """Add the step *name* running func(*args) after the steps in *depends_on*."""
+        if name in self._steps:
+            raise ValueError("Step {} is already added".format(name))
+        for dependency in depends_on:
+            if dependency not in self._steps:
+                raise ValueError("Step {} depends on unknown step {}".format(name, dependency))
+        self._steps[name] = (func, args, tuple(depends_on))
+
+    def run(self, max_workers=1):
+        """Run all the steps, at most *max_workers* at the same time, and return a PassReport."""
+        report = PassReport()
+        pending = dict(self._steps)
+        running = {}
+
+        def _run_step(name, func, args):
+            start = _time()
+            try:
+                status = bool(func(*args))
+            except Exception as err:
+                return StepResult(name, None, _time() - start, err)
+            return StepResult(name, status, _time() - start)
+
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+            while pending or running:
+                for name, (func, args, depends_on) in list(pending.items()):
+                    if not all(dependency in report for dependency in depends_on):
+                        continue
+                    del pending[name]
+                    if any(report[dependency].status is None for dependency in depends_on):
+                        LOG.warning("Skipping step {} as a step it depends on did not complete.".format(name))
+                        report.add(StepResult(name, None))
+                        continue
+                    LOG.debug("Starting step {}".format(name))
+                    running[pool.submit(_run_step, name, func, args)] = name
+
+                if not running:
+                    # Only skipped steps were resolved in this round, check the pending ones again
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    result = future.result()
+                    LOG.debug("Step {}".format(result))
+                    report.add(result)
+
+        return report
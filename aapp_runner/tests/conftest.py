@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fixtures shared by the tests."""
+
+import pathlib
+import sys
+from datetime import datetime
+
+import pytest
+
+from aapp_runner.read_aapp_config import AappL1Config
+
+
+@pytest.fixture
+def aapp_dr_runner():
+    """Get the aapp_dr_runner script of the bin dir, imported as a module."""
+    bin_dir = str(pathlib.Path(__file__).parent.parent.parent / "bin")
+    if bin_dir not in sys.path:
+        sys.path.insert(0, bin_dir)
+    import aapp_dr_runner
+    return aapp_dr_runner
+
+
+@pytest.fixture
+def get_runner_config(tmp_path):
+    """Get a function making the config of a metop01 pass resumable by aapp_dr_runner, working in tmp_path.
+
+    A new config is made at each call, like for each run of the pass.
+    """
+    def _get_runner_config():
+        config = AappL1Config({'aapp_processes': {'test': {'aapp_workdir': str(tmp_path), 'use_dyn_work_dir': True,
+                                                           'resume_failed_passes': True}}}, 'test')
+        config['platform_name'] = 'metop01'
+        config['starttime'] = datetime(2021, 1, 19, 14, 8, 26)
+        config['endtime'] = datetime(2021, 1, 19, 14, 15)
+        return config
+    return _get_runner_config
@@ -26,6 +26,7 @@
 
 
 import inspect
+import os
 import pathlib
 import unittest.mock
 import logging
@@ -74,7 +75,10 @@ def test_ana(tmp_path, monkeypatch, caplog):
         '"uid": "20210119140826_NOAA_19.hmf", "sensor": '
         '["avhrr/3"], "orig_platform_name": "NOAA_19"}')
 
-    def fake_run_ana(cmd, stdin="", stdout_logfile=None, stderr_logfile=None):
+    def fake_run_ana(cmd, stdin="", stdout_logfile=None, stderr_logfile=None, my_cwd=None, my_env=None,
+                     tail_lines=None, accepted_return_codes=None):
+        assert my_cwd == str(ppp)
+        assert my_env["DIR_NAVIGATION"] == str(ppp / "navdir")
         if cmd == "ana_lmk_loc -D hrpt.l1b":
             (ppp / "navdir" / "ana" / "lmkloc_scabb_20210119_1408}_42.txt"
              ).touch()
@@ -82,7 +86,7 @@ def test_ana(tmp_path, monkeypatch, caplog):
         elif cmd == "l1bidf.exe":
             return (True, 0, "scabb 20210119 1408 42", "")
         elif cmd == "ana_estatt -s scabb -d 20210119 -h 1408 -n 00042":
-            with open("hrpt.l1b", "wt") as fp:
+            with open(os.path.join(my_cwd, "hrpt.l1b"), "wt") as fp:
                 fp.write("Que j'aime a faire connaitre un nombre "
                          "utile aux sages.\n")
             return (True, 0, "", "")
@@ -90,7 +94,7 @@ def test_ana(tmp_path, monkeypatch, caplog):
             breakpoint()
 
     def fake_calib_avhr(conf, msg, timestamp):
-        with open("hrpt.l1b", "at") as fp:
+        with open(conf.get_job_context().path("hrpt.l1b"), "at") as fp:
             fp.write("Now is the time for all good men to come to the "
                      "aid of the Party")
         return True
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test resuming a failed pass from the checkpoints of its steps."""
+
+import os
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from aapp_runner.checkpoint import CheckpointManifest
+from aapp_runner.job_context import JobContext
+from aapp_runner.read_aapp_config import AappL1Config
+
+SCENE_ID = "metop01_20210119140826_20210119141500"
+
+
+def _get_config(pth):
+    config = AappL1Config({'aapp_processes': {'test': {'working_dir': str(pth)}}}, 'test')
+    config['process_mhs'] = True
+    config['endtime'] = datetime(2021, 1, 19, 14, 15)
+    config.job_context = JobContext(str(pth), {'PAR_CALIBRATION_COEF': '/coef'})
+    return config
+
+
+def _run_pass(config, calls, ana_result=True, ana_writes=True):
+    """Run fake decom, avhrr and ana steps updating hrpt.l1b, like the real ones do."""
+    def decom(config):
+        calls.append('decom')
+        with open(config.get_job_context().path('hrpt.l1b'), 'w') as fd_:
+            fd_.write('decom')
+        with open(config.get_job_context().path('decom.log'), 'w') as fd_:
+            fd_.write('log')
+        config['process_mhs'] = False
+        config['endtime'] = datetime(2021, 1, 19, 14, 16)
+        config.get_job_context().setenv('FILE_COEF', '/coef/amsua')
+        return True
+
+    def avhrr(config):
+        calls.append('avhrr')
+        with open(config.get_job_context().path('hrpt.l1b'), 'a') as fd_:
+            fd_.write(' calibrated')
+        return True
+
+    def ana(config):
+        calls.append('ana')
+        if not ana_writes:
+            return False
+        with open(config.get_job_context().path('hrpt.l1b'), 'a') as fd_:
+            fd_.write(' corrected')
+        return ana_result
+
+    checkpoint = config.checkpoint
+    return all((checkpoint.checkpointed('decom', decom, config)(config),
+                checkpoint.checkpointed('avhrr', avhrr, config, ('decom',))(config),
+                checkpoint.checkpointed('ana', ana, config, ('avhrr',))(config)))
+
+
+def test_resume_from_first_incomplete_step(tmp_path):
+    """Test the steps completed before are not run again, and what they did is restored."""
+    calls = []
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), SCENE_ID)
+    # The ana step fails before touching the l1b file
+    assert not _run_pass(config, calls, ana_writes=False)
+    assert calls == ['decom', 'avhrr', 'ana']
+    (tmp_path / "decom.log").unlink()
+
+    calls = []
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), SCENE_ID)
+    assert _run_pass(config, calls)
+    assert calls == ['ana']
+    assert config['process_mhs'] is False
+    assert config['endtime'] == datetime(2021, 1, 19, 14, 16)
+    assert config.get_job_context().getenv('FILE_COEF') == '/coef/amsua'
+    assert (tmp_path / "hrpt.l1b").read_text() == 'decom calibrated corrected'
+
+    config.checkpoint.remove()
+    assert not list(tmp_path.glob("aapp_runner_checkpoint*"))
+
+
+def test_redo_steps_writing_a_corrupt_file(tmp_path):
+    """Test the steps are redone from the first one writing a file left corrupt by a failed step."""
+    calls = []
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), SCENE_ID)
+    assert not _run_pass(config, calls, ana_result=False)
+
+    calls = []
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), SCENE_ID)
+    assert _run_pass(config, calls)
+    assert calls == ['decom', 'avhrr', 'ana']
+    assert (tmp_path / "hrpt.l1b").read_text() == 'decom calibrated corrected'
+
+
+def test_checkpoint_of_other_pass_not_used(tmp_path):
+    """Test the checkpoints of another pass in the same working dir are not used."""
+    calls = []
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), SCENE_ID)
+    assert _run_pass(config, calls)
+
+    calls = []
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), "metop03_20210119140826_20210119141500")
+    assert _run_pass(config, calls)
+    assert calls == ['decom', 'avhrr', 'ana']
+
+
+def test_working_dir_without_checkpoints_cleaned(tmp_path, aapp_dr_runner, get_runner_config):
+    """Test the working dir of a pass is reused only when there are checkpoints to resume from."""
+    working_dir = tmp_path / SCENE_ID
+    working_dir.mkdir()
+    (working_dir / "fort.50").symlink_to("/coef/amsua")
+    with patch.object(aapp_dr_runner, 'setup_aapp_environment', return_value=None):
+        assert not aapp_dr_runner.setup_aapp_processing(get_runner_config())
+    assert working_dir.is_dir()
+    assert not list(working_dir.iterdir())
+
+    (working_dir / "hrpt.l1b").write_text("decom")
+    (working_dir / "aapp_runner_checkpoint.json").write_text("{}")
+    with patch.object(aapp_dr_runner, 'setup_aapp_environment', return_value=None):
+        assert not aapp_dr_runner.setup_aapp_processing(get_runner_config())
+    assert (working_dir / "hrpt.l1b").read_text() == "decom"
+
+
+def test_abandoned_working_dirs_removed(tmp_path, aapp_dr_runner, get_runner_config):
+    """Test the working dirs of the failed passes not resumed in time are removed."""
+    old_pass = tmp_path / "metop03_20210118140826_20210118141500"
+    recent_pass = tmp_path / SCENE_ID
+    other_dir = tmp_path / "tmpabcdef"
+    for working_dir in (old_pass, recent_pass, other_dir):
+        working_dir.mkdir()
+        (working_dir / "aapp_runner_checkpoint.json").write_text("{}")
+    two_days_ago = time.time() - 48 * 3600
+    for path in (old_pass / "aapp_runner_checkpoint.json", old_pass, other_dir):
+        os.utime(path, (two_days_ago, two_days_ago))
+
+    aapp_dr_runner.cleanup_abandoned_pass_dirs(get_runner_config())
+    assert sorted(path.name for path in tmp_path.iterdir()) == [SCENE_ID, "tmpabcdef"]
+
+    config = get_runner_config()
+    config['aapp_processes']['test']['resume_failed_passes_max_age'] = 0
+    aapp_dr_runner.cleanup_abandoned_pass_dirs(config)
+    assert [path.name for path in tmp_path.iterdir()] == ["tmpabcdef"]
+
+
+def test_working_dir_removed_after_pass(tmp_path, aapp_dr_runner, get_runner_config):
+    """Test the working dir kept to resume the pass is removed once the pass succeeded."""
+    working_dir = tmp_path / SCENE_ID
+
+    def setup(config):
+        working_dir.mkdir()
+        config['aapp_processes']['test']['working_dir'] = str(working_dir)
+        config.checkpoint = CheckpointManifest(str(working_dir), SCENE_ID)
+        return True
+
+    def run_pass(process_ok):
+        config = get_runner_config()
+        with patch.object(aapp_dr_runner, 'setup_aapp_processing', side_effect=setup), \
+                patch.object(aapp_dr_runner, 'process_aapp', return_value=process_ok), \
+                patch('aapp_runner.rename_aapp_filenames.rename_aapp_filenames', return_value=[]), \
+                patch.object(aapp_dr_runner, 'move_aapp_log_files'), \
+                patch.object(aapp_dr_runner, 'cleanup_aapp_logfiles_archive'):
+            return aapp_dr_runner.run_aapp_pass(None, config)
+
+    with pytest.raises(Exception, match="Process aapp failed"):
+        run_pass(False)
+    assert working_dir.is_dir()
+
+    working_dir.rmdir()
+    with patch.object(CheckpointManifest, 'remove') as remove:
+        assert run_pass(True) == []
+    remove.assert_called_once_with()
+    assert not working_dir.exists()
+
+
+def test_configured_working_dir_kept_after_pass(tmp_path, aapp_dr_runner, get_runner_config):
+    """Test a working dir given in the config is not removed after the pass."""
+    config = get_runner_config()
+    config['aapp_processes']['test']['working_dir'] = str(tmp_path)
+    assert not aapp_dr_runner.is_pass_working_dir(config)
+    config['aapp_processes']['test']['working_dir'] = str(tmp_path / SCENE_ID)
+    assert aapp_dr_runner.is_pass_working_dir(config)
+
+
+def test_concurrent_steps_not_checkpointed(tmp_path):
+    """Test the steps running at the same time as others are not checkpointed, the others are."""
+    from aapp_runner.step_graph import StepGraph
+
+    barrier = threading.Barrier(2, timeout=10)
+
+    def write(filename):
+        def step(config):
+            barrier.wait()
+            with open(config.get_job_context().path(filename), 'w') as fd_:
+                fd_.write(filename)
+            return True
+        return step
+
+    def atovpp(config):
+        with open(config.get_job_context().path('hirs.l1d'), 'w') as fd_:
+            fd_.write('atovpp')
+        return True
+
+    config = _get_config(tmp_path)
+    config.checkpoint = CheckpointManifest(str(tmp_path), SCENE_ID)
+    checkpoint = config.checkpoint
+    steps = StepGraph()
+    steps.add_step('hirs', checkpoint.checkpointed('hirs', write('hirs.l1c'), config), (config,))
+    steps.add_step('avhrr', checkpoint.checkpointed('avhrr', write('hrpt.l1b'), config), (config,))
+    steps.add_step('atovpp', checkpoint.checkpointed('atovpp', atovpp, config, ('hirs', 'avhrr')), (config,),
+                   depends_on=('hirs', 'avhrr'))
+    assert steps.run(max_workers=2).ok
+
+    resumed = CheckpointManifest(str(tmp_path), SCENE_ID)
+    assert [step['name'] for step in resumed._steps] == ['atovpp']
+    assert resumed._steps[0]['files'].keys() == {'hirs.l1d'}
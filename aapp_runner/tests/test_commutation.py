@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Unit tests for the decommutation."""
+
+import datetime
+import threading
+from unittest.mock import patch
+
+from aapp_runner.do_commutation import do_decommutation
+from aapp_runner.job_context import JobContext
+from aapp_runner.read_aapp_config import AappL1Config
+
+DECOMMUTATION_FILES = {'amsua_file': 'aman.l1b', 'amsub_file': 'ambn.l1b', 'mhs_file': 'mhsl1b',
+                       'hirs_file': 'hrsn.l1b', 'msu_file': 'msun.l1b', 'dcs_file': 'dcsn.l1b',
+                       'avhrr_file': 'hrpt.l1b'}
+
+
+def get_metop_config(pth):
+    """Get a config for processing all the metop instruments."""
+    conf = AappL1Config({'aapp_static_configuration': {'decommutation_files': DECOMMUTATION_FILES},
+                         'aapp_processes': {'test': {'working_dir': str(pth)}}},
+                        "test")
+    conf['platform_name'] = 'Metop-B'
+    for instrument in ('amsua', 'amsub', 'mhs', 'hirs', 'avhrr'):
+        conf['process_{}'.format(instrument)] = True
+    for instrument in ('amsua', 'mhs', 'hirs', 'avhrr'):
+        conf['input_{}_file'.format(instrument)] = '{}_xxx_eps'.format(instrument.upper())
+    return conf
+
+
+def test_metop_decommutations_run_concurrently(tmp_path):
+    """Test the metop decoms run at the same time, and a failing decom only disables its own instrument."""
+    config = get_metop_config(tmp_path)
+    barrier = threading.Barrier(4, timeout=5)
+
+    def fake_decom(cmd, stdout_logfile=None, my_cwd=None, my_env=None,
+                   tail_lines=None, accepted_return_codes=None):
+        barrier.wait()
+        decom, *args = cmd.split()
+        assert my_cwd == str(tmp_path)
+        assert stdout_logfile == "{}.log".format(decom)
+        if decom == 'decom-mhs-metop':
+            return (True, 1, "", "bad mdr")
+        (tmp_path / args[-1]).touch()
+        return (True, 0, "", "")
+
+    with patch('aapp_runner.do_commutation.run_shell_command') as mymock:
+        mymock.side_effect = fake_decom
+        assert do_decommutation(config, None, datetime.datetime(2021, 1, 19, 14, 8, 26))
+
+    assert mymock.call_count == 4
+    assert config['process_amsua'] and config['process_hirs'] and config['process_avhrr']
+    assert not config['process_mhs']
+    assert not config['process_amsub']
+
+
+def test_metop_decommutations_all_failing(tmp_path):
+    """Test the decommutation fails when all the metop decoms fail."""
+    config = get_metop_config(tmp_path)
+
+    with patch('aapp_runner.do_commutation.run_shell_command') as mymock:
+        mymock.return_value = False
+        assert not do_decommutation(config, None, datetime.datetime(2021, 1, 19, 14, 8, 26))
+
+
+def test_noaa_decommutation_outputs_checked(tmp_path):
+    """Test the fort files of the NOAA decommutation are renamed and checked, and the process flags updated."""
+    config = AappL1Config({'aapp_static_configuration': {'decommutation_files': DECOMMUTATION_FILES},
+                           'aapp_processes': {'test': {'working_dir': str(tmp_path)}}},
+                          "test")
+    config['platform_name'] = 'noaa19'
+    config['a_tovs'] = ['ATOVS']
+    config['orbit_number'] = 42
+    config['input_hrpt_file'] = '20210119140826_NOAA_19.hmf'
+    for instrument in ('amsua', 'amsub', 'hirs', 'avhrr', 'msu', 'dcs'):
+        config['process_{}'.format(instrument)] = True
+    config.job_context = JobContext(str(tmp_path), {'FORT': 'fort.', 'PAR_CALIBRATION_COEF': str(tmp_path)})
+    checked = []
+
+    def fake_run(cmd, stdin=None, stdout_logfile=None, stderr_logfile=None, my_cwd=None, my_env=None,
+                 tail_lines=None, accepted_return_codes=None):
+        if cmd == "decommutation.exe":
+            for unit in (14, 11, 15, 16):
+                (tmp_path / "fort.{}".format(unit)).touch()
+            return (True, 0, "", "")
+        assert cmd == "chk1btime.exe"
+        checked.append(stdin.strip())
+        assert (tmp_path / stdin.strip()).exists()
+        return (True, 1 if stdin.strip() == 'ambn.l1b' else 0, "", "")
+
+    with patch('aapp_runner.do_commutation.run_shell_command') as mymock:
+        mymock.side_effect = fake_run
+        assert do_decommutation(config, None, datetime.datetime(2021, 1, 19, 14, 8, 26))
+
+    assert sorted(checked) == ['aman.l1b', 'ambn.l1b', 'hrpt.l1b', 'hrsn.l1b']
+    assert config['process_avhrr'] and config['process_hirs'] and config['process_amsua']
+    assert not config['process_amsub']
+    assert not config['process_msu']
+    assert not config['process_dcs']
+    assert not list(tmp_path.glob("fort.1*"))
@@ -24,6 +24,7 @@
 """
 
 import logging
+import os
 import unittest
 from datetime import datetime
 from unittest.mock import patch
@@ -114,3 +115,205 @@ class TestProcessConfigChecking(unittest.TestCase):
 
         assert result
         self.assertEqual(len(cm.output), 1)
+
+
+def test_run_shell_command_in_job_context(tmp_path):
+    """Test running a command in the environment and working dir of a job."""
+    from aapp_runner.helper_functions import run_shell_command
+    from aapp_runner.job_context import JobContext
+
+    job = JobContext(str(tmp_path), {'PATH': os.environ['PATH']})
+    job.setenv('SATIMG', 'noaa19')
+
+    status, returncode, out, err = run_shell_command("sh -c 'echo $SATIMG; pwd'", stdout_logfile="my.log",
+                                                     my_cwd=job.cwd, my_env=job.env)
+
+    assert status
+    assert returncode == 0
+    assert out == ''
+    assert (tmp_path / "my.log").read_text().split() == ['noaa19', str(tmp_path)]
+    assert 'SATIMG' not in os.environ
+
+
+def test_source_aapp_environment_is_cached(tmp_path):
+    """Test the sourced AAPP environment is reused until the environment file changes."""
+    from aapp_runner import job_context
+    from aapp_runner.job_context import source_aapp_environment
+
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    (bindir / "atovpp").write_text("#!/bin/sh\n")
+    (bindir / "atovpp").chmod(0o755)
+    env_file = tmp_path / "ATOVS_ENV7"
+    env_file.write_text("export PATH={}:$PATH\nexport DIR_NAVIGATION=/nav\n".format(bindir))
+    env = {'PATH': os.environ['PATH'], 'AAPP_PREFIX': str(tmp_path)}
+
+    job_context.clear_aapp_environment_cache()
+    with patch.object(job_context, 'run_shell_command', wraps=job_context.run_shell_command) as mymock:
+        aapp_env, programs = source_aapp_environment(str(env_file), env, ['atovpp', 'atovin'])
+        assert aapp_env['DIR_NAVIGATION'] == '/nav'
+        assert programs == {'atovpp': str(bindir / "atovpp"), 'atovin': None}
+
+        aapp_env['DIR_NAVIGATION'] = '/changed/by/the/job'
+        aapp_env, programs = source_aapp_environment(str(env_file), env, ['atovpp'])
+        assert aapp_env['DIR_NAVIGATION'] == '/nav'
+        assert programs == {'atovpp': str(bindir / "atovpp")}
+        assert mymock.call_count == 1
+
+        env_file.write_text("export DIR_NAVIGATION=/new/nav\n")
+        os.utime(env_file, ns=(0, 0))
+        aapp_env, programs = source_aapp_environment(str(env_file), env, ['atovpp'])
+        assert aapp_env['DIR_NAVIGATION'] == '/new/nav'
+        assert programs == {'atovpp': None}
+        assert mymock.call_count == 2
+    job_context.clear_aapp_environment_cache()
+
+
+def _process_is_gone(pid):
+    """Check if the process is gone (or a zombie waiting to be reaped)."""
+    try:
+        with open("/proc/{}/stat".format(pid)) as fd:
+            return fd.read().rsplit(")", 1)[1].split()[0] == "Z"
+    except FileNotFoundError:
+        return True
+
+
+def test_run_shell_command_timeout_kills_process_group(tmp_path):
+    """Test a command taking too long is killed, together with the programs it started."""
+    import time
+
+    from aapp_runner.helper_functions import run_shell_command
+
+    start = time.monotonic()
+    result = run_shell_command("sh -c 'sleep 60 & echo $! > sleep.pid; wait'", my_cwd=str(tmp_path), my_timeout=1)
+
+    assert result == (False, None, "", "")
+    assert time.monotonic() - start < 30
+    pid = int((tmp_path / "sleep.pid").read_text())
+    for _ in range(50):
+        if _process_is_gone(pid):
+            break
+        time.sleep(0.1)
+    assert _process_is_gone(pid)
+
+
+def test_run_shell_command_timeout_output(tmp_path):
+    """Test the last lines of output of a command taking too long are returned."""
+    from aapp_runner.helper_functions import run_shell_command
+
+    result = run_shell_command("sh -c 'echo started; echo warning >&2; sleep 60'", my_cwd=str(tmp_path),
+                               my_timeout=2, tail_lines=5)
+    assert result == (False, None, "started\n", "warning\n")
+
+
+def test_run_shell_command_async_cancelled(tmp_path):
+    """Test cancelling a command kills it."""
+    import asyncio
+
+    from aapp_runner.helper_functions import run_shell_command_async
+
+    async def run_and_cancel():
+        task = asyncio.ensure_future(run_shell_command_async("sh -c 'echo $$ > sh.pid; sleep 60'",
+                                                             my_cwd=str(tmp_path)))
+        while not (tmp_path / "sh.pid").exists() or not (tmp_path / "sh.pid").read_text():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(asyncio.wait_for(run_and_cancel(), 30))
+    assert _process_is_gone(int((tmp_path / "sh.pid").read_text()))
+
+
+def test_run_shell_command_output(tmp_path):
+    """Test the output of a command is returned, or streamed to the log files."""
+    from aapp_runner.helper_functions import run_shell_command
+
+    cmd = "echo out; echo err >&2"
+    assert run_shell_command(cmd, use_shell=True, use_shlex=False) == (True, 0, "out\n", "err\n")
+
+    assert run_shell_command(cmd, use_shell=True, use_shlex=False, my_cwd=str(tmp_path),
+                             stdout_logfile="cmd.log", stderr_logfile="cmd.err") == (True, 0, "", "")
+    assert (tmp_path / "cmd.log").read_text() == "out\n"
+    assert (tmp_path / "cmd.err").read_text() == "err\n"
+
+    assert run_shell_command(cmd, use_shell=True, use_shlex=False, my_cwd=str(tmp_path),
+                             stdout_logfile="both.log", stderr_logfile="both.log") == (True, 0, "", "")
+    assert (tmp_path / "both.log").read_text() == "out\nerr\n"
+
+    assert run_shell_command(cmd, use_shell=True, use_shlex=False,
+                             stdout_logfile=str(tmp_path / "no" / "such" / "dir.log")) is False
+
+
+def test_run_shell_command_tail_lines(caplog):
+    """Test only the last lines of the output are kept, and logged when the command fails."""
+    from aapp_runner.helper_functions import run_shell_command
+
+    cmd = "seq 1 10000; seq 1 3 >&2; exit {}"
+    with caplog.at_level(logging.DEBUG, logger='aapp_runner.helper_functions'):
+        result = run_shell_command(cmd.format(0), use_shell=True, use_shlex=False, tail_lines=2)
+    assert result == (True, 0, "9999\n10000\n", "2\n3\n")
+    assert "9999" not in caplog.text
+
+    caplog.clear()
+    with caplog.at_level(logging.ERROR, logger='aapp_runner.helper_functions'):
+        result = run_shell_command(cmd.format(3), use_shell=True, use_shlex=False, tail_lines=2,
+                                   accepted_return_codes=[0, 1])
+    assert result == (True, 3, "9999\n10000\n", "2\n3\n")
+    assert "9999\n" in caplog.text
+    assert "9998" not in caplog.text
+
+
+def test_get_output_tail_lines():
+    """Test getting the number of output lines to keep per processing step."""
+    config = AappL1Config({'aapp_processes': {'test': {}}}, 'test')
+    assert config.get_output_tail_lines('hirs') is None
+
+    config.add_process_config_paramenter('output_tail_lines', 50)
+    assert config.get_output_tail_lines('hirs') == 50
+
+    config.add_process_config_paramenter('output_tail_lines', {'default': 100, 'avhrr': 20})
+    assert config.get_output_tail_lines('hirs') == 100
+    assert config.get_output_tail_lines('avhrr') == 20
+
+    config.add_process_config_paramenter('output_tail_lines', {'decommutation': 20})
+    assert config.get_output_tail_lines('hirs') is None
+
+
+def _try_lock_in_other_process(lock_filename, shared):
+    """Try to take the lock without waiting, in another process."""
+    import subprocess
+    import sys
+    code = ("import fcntl, sys\n"
+            "with open(sys.argv[1], 'a') as fd_:\n"
+            "    try:\n"
+            "        fcntl.flock(fd_, (fcntl.LOCK_SH if sys.argv[2] == 'shared' else fcntl.LOCK_EX) | fcntl.LOCK_NB)\n"
+            "    except BlockingIOError:\n"
+            "        sys.exit(1)\n")
+    return subprocess.call([sys.executable, "-c", code, lock_filename, "shared" if shared else "exclusive"]) == 0
+
+
+def test_file_lock(tmp_path):
+    """Test the file lock is exclusive for writers and shared by readers, between processes."""
+    from aapp_runner.helper_functions import file_lock
+    lock_filename = str(tmp_path / ".locks" / "tle_noaa19.index.lock")
+
+    with file_lock(lock_filename):
+        assert not _try_lock_in_other_process(lock_filename, shared=True)
+        assert not _try_lock_in_other_process(lock_filename, shared=False)
+    with file_lock(lock_filename, shared=True):
+        assert _try_lock_in_other_process(lock_filename, shared=True)
+        assert not _try_lock_in_other_process(lock_filename, shared=False)
+    assert _try_lock_in_other_process(lock_filename, shared=False)
+
+
+def test_replace_symlink(tmp_path):
+    """Test the link left by a previous attempt in a reused working dir is replaced."""
+    from aapp_runner.helper_functions import replace_symlink
+    link = tmp_path / "fort.50"
+    replace_symlink("/coef/old", str(link))
+    replace_symlink("/coef/new", str(link))
+    assert os.readlink(str(link)) == "/coef/new"
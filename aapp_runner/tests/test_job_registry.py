@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the register of the passes being processed."""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from aapp_runner.helper_functions import check_if_scene_is_unique
+from aapp_runner.job_registry import JobRegistry
+from aapp_runner.read_aapp_config import AappL1Config
+
+START = datetime(2022, 1, 8, 12, 49, 50)
+END = datetime(2022, 1, 8, 13, 0, 26)
+
+
+def test_find_overlap():
+    """Test finding a registered pass overlapping in time, on the same platform and area."""
+    registry = JobRegistry()
+    # A day of passes, every 100 minutes, before and after the one we look for
+    for i in range(-10, 10):
+        if i:
+            registry.add('metop03', (START + i * timedelta(minutes=100), END + i * timedelta(minutes=100), 'euron1'))
+    assert not registry.find_overlap('metop03', 'euron1', START, END)
+
+    registry.add('metop03', (START, END, 'euron1'))
+    assert registry.find_overlap('metop03', 'euron1', datetime(2022, 1, 8, 12, 50), datetime(2022, 1, 8, 13, 0)) == (
+        START, END)
+    assert registry.find_overlap('metop03', 'euron1', START - timedelta(minutes=5), START + timedelta(minutes=1))
+    assert not registry.find_overlap('metop03', 'other_area', START, END)
+    assert not registry.find_overlap('metop01', 'euron1', START, END)
+
+    # A long pass is also found from a time well after its start
+    registry.add('noaa19', (START, START + timedelta(hours=2), 'euron1'))
+    assert registry.find_overlap('noaa19', 'euron1', START + timedelta(minutes=90), START + timedelta(minutes=100))
+
+    assert registry.remove('metop03', (START, END, 'euron1'))
+    assert not registry.remove('metop03', (START, END, 'euron1'))
+    assert not registry.find_overlap('metop03', 'euron1', START, END)
+    assert len(registry) == 20
+
+
+def test_expire():
+    """Test passes are released from the registry when the lock time is up."""
+    registry = JobRegistry()
+    registry.add('metop03', (START, END, 'euron1'))
+    registry.add('metop01', (START, END, 'euron1'))
+
+    threads_before = threading.active_count()
+    registry.expire('metop03', (START, END, 'euron1'), 60)
+    registry.expire('metop01', (START, END, 'euron1'), 0.1)
+    for _ in range(50):
+        if not registry.find_overlap('metop01', 'euron1', START, END):
+            break
+        time.sleep(0.1)
+
+    assert not registry.find_overlap('metop01', 'euron1', START, END)
+    assert registry.find_overlap('metop03', 'euron1', START, END)
+    # One thread for all the passes to expire
+    assert threading.active_count() == threads_before + 1
+
+
+def test_check_if_scene_is_unique_with_registry():
+    """Test checking if a scene is unique with the job registry of the config."""
+    config = AappL1Config({'aapp_processes': {'test': {}}}, 'test')
+    config['platform_name'] = 'metop03'
+    config['collection_area_id'] = 'euron1'
+    config['starttime'] = datetime(2022, 1, 8, 12, 50)
+    config['endtime'] = datetime(2022, 1, 8, 13, 0)
+    assert check_if_scene_is_unique(config)
+
+    config.job_register.add('metop03', (START, END, 'euron1'))
+    assert not check_if_scene_is_unique(config)
+
+
+def test_persistent_registry(tmp_path):
+    """Test the passes blocked for rerun are still blocked after a restart."""
+    from aapp_runner.job_registry import PersistentJobRegistry
+
+    dbfile = str(tmp_path / "job_registry.db")
+    registry = PersistentJobRegistry(dbfile)
+    registry.add('metop03', (START, END, 'euron1'))
+    registry.add('metop01', (START, END, 'euron1'))
+    registry.add('noaa19', (START, END, None))
+    registry.expire('metop03', (START, END, 'euron1'), 60)
+    registry.expire('noaa19', (START, END, None), 0.1)
+
+    # Restart, metop01 was being processed
+    restarted = PersistentJobRegistry(dbfile)
+    assert restarted.find_overlap('metop03', 'euron1', START, END)
+    assert not restarted.find_overlap('metop01', 'euron1', START, END)
+
+    for _ in range(50):
+        if not restarted.find_overlap('noaa19', None, START, END):
+            break
+        time.sleep(0.1)
+    assert not restarted.find_overlap('noaa19', None, START, END)
+
+    time.sleep(0.2)
+    assert len(PersistentJobRegistry(dbfile)) == 1
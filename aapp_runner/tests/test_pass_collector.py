@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test gathering the per instrument messages of a pass."""
+
+from datetime import datetime
+from time import monotonic
+
+from posttroll.message import Message
+
+from aapp_runner.pass_collector import PassCollector
+
+PASS_KEY = "65913dde99d8537bb959453e23eb296f"
+
+
+def _make_message(instrument, sensor, start, end, pass_key=PASS_KEY):
+    uid = "{}_HRP_00_M02_20160617{}Z_20160617{}Z_N_O_20160617095305Z".format(instrument, start, end)
+    data = {"uid": uid, "uri": "file:///disk1/data/" + uid, "platform_name": "Metop-A", "sensor": sensor,
+            "start_time": datetime.strptime("20160617" + start, "%Y%m%d%H%M%S"),
+            "end_time": datetime.strptime("20160617" + end, "%Y%m%d%H%M%S")}
+    if pass_key:
+        data["pass_key"] = pass_key
+    return Message("/EPS/0", "file", data)
+
+
+def test_collect_messages_by_pass_key():
+    """Test the instrument messages of a pass are gathered in one dataset message."""
+    collector = PassCollector(60)
+    collector.add(_make_message("AVHR", "avhrr/3", "095302", "095954"))
+    collector.add(_make_message("MHSx", "mhs", "095255", "095944"))
+    collector.add(_make_message("HIRS", "hirs/4", "095255", "095939"))
+    # The same instrument from another antenna
+    collector.add(_make_message("HIRS", "hirs/4", "095256", "095939"))
+    collector.add(_make_message("AMSA", "amsu-a", "101502", "102200", pass_key="another_pass"))
+
+    assert collector.get_ready() == []
+    messages = collector.get_ready(monotonic() + 61)
+
+    assert len(messages) == 2
+    msg = messages[0]
+    assert msg.type == 'dataset'
+    assert msg.data['sensor'] == ['avhrr/3', 'mhs', 'hirs/4']
+    assert [dataset['uid'][:4] for dataset in msg.data['dataset']] == ['AVHR', 'MHSx', 'HIRS']
+    assert msg.data['start_time'] == datetime(2016, 6, 17, 9, 52, 55)
+    assert msg.data['end_time'] == datetime(2016, 6, 17, 9, 59, 54)
+    assert 'uri' not in msg.data
+    # A pass with one message only is passed on as it is
+    assert messages[1].type == 'file'
+    assert messages[1].data['sensor'] == 'amsu-a'
+    assert not len(collector)
+
+
+def test_collect_messages_by_time_overlap():
+    """Test messages without pass_key are gathered by platform and overlapping time."""
+    collector = PassCollector(60)
+    collector.add(_make_message("AVHR", "avhrr/3", "095302", "095954", pass_key=None))
+    collector.add(_make_message("AMSA", "amsu-a", "095255", "095936", pass_key=None))
+    collector.add(_make_message("AMSA", "amsu-a", "101502", "102200", pass_key=None))
+
+    messages = collector.get_ready(monotonic() + 61)
+
+    assert [msg.data['sensor'] for msg in messages] == [['avhrr/3', 'amsu-a'], 'amsu-a']
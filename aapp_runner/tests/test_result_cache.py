@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the cache of the results of processed passes."""
+
+from unittest.mock import patch
+
+from aapp_runner.read_aapp_config import AappL1Config
+from aapp_runner.result_cache import ResultCache, create_result_cache, get_cache_key
+
+
+def _get_config(pth, cache_file=None):
+    (pth / "ATOVS_ENV8").write_text("export AAPP_PREFIX\n")
+    (pth / "AVHR_xxx_eps").write_bytes(b"avhrr level 0")
+    (pth / "MHSx_xxx_eps").write_bytes(b"mhs level 0")
+    process_config = {'aapp_prefix': str(pth), 'aapp_environment_file': 'ATOVS_ENV8',
+                      'working_dir': str(pth / "work"), 'do_ana_correction': True}
+    if cache_file:
+        process_config['result_cache_file'] = cache_file
+    config = AappL1Config({'aapp_static_configuration': {'decommutation_files': {'avhrr_file': 'hrpt.l1b'}},
+                           'aapp_processes': {'test': process_config}}, 'test')
+    config['platform_name'] = 'Metop-B'
+    config['process_avhrr'] = True
+    config['input_avhrr_file'] = str(pth / "AVHR_xxx_eps")
+    config['input_mhs_file'] = str(pth / "MHSx_xxx_eps")
+    config['input_hrpt_file'] = str(pth / "MHSx_xxx_eps")
+    return config
+
+
+def test_cache_key(tmp_path):
+    """Test the cache key changes with the input, the config and the AAPP installation only."""
+    key = get_cache_key(_get_config(tmp_path))
+
+    config = _get_config(tmp_path)
+    config['aapp_processes']['test']['working_dir'] = '/another/working/dir'
+    config['orbit_number'] = 42
+    assert get_cache_key(config) == key
+
+    config = _get_config(tmp_path)
+    config['aapp_processes']['test']['do_ana_correction'] = False
+    assert get_cache_key(config) != key
+
+    config = _get_config(tmp_path)
+    config['process_avhrr'] = False
+    assert get_cache_key(config) != key
+
+    config = _get_config(tmp_path)
+    (tmp_path / "ATOVS_ENV8").write_text("export AAPP_PREFIX\nexport AAPP_VERSION=8.9\n")
+    assert get_cache_key(config) != key
+
+    config = _get_config(tmp_path)
+    (tmp_path / "MHSx_xxx_eps").write_bytes(b"other mhs level 0")
+    assert get_cache_key(config) != key
+
+
+def test_cached_files(tmp_path):
+    """Test getting the cached files, as long as these are still there."""
+    cache = ResultCache(str(tmp_path / "result_cache.db"))
+    outfile = tmp_path / "hirsl1c_metop01_20210119_1408_12345.l1c"
+    outfile.write_text("l1c")
+    cache.put("key", [{'file': str(outfile), 'sensor': 'hirs', 'level': 'l1c'}])
+    assert cache.get("other_key") is None
+
+    # A new cache on the same database, as after a restart
+    cache = ResultCache(str(tmp_path / "result_cache.db"))
+    assert cache.get("key") == [{'file': str(outfile), 'sensor': 'hirs', 'level': 'l1c'}]
+
+    outfile.unlink()
+    assert cache.get("key") is None
+
+
+def test_cache_pruned(tmp_path):
+    """Test the results expired, or of which files are gone, are removed when the cache is opened."""
+    cache = ResultCache(str(tmp_path / "result_cache.db"))
+    kept = tmp_path / "kept.l1c"
+    kept.write_text("l1c")
+    gone = tmp_path / "gone.l1c"
+    gone.write_text("l1c")
+    with patch("aapp_runner.result_cache._time", return_value=1000):
+        cache.put("old", [{'file': str(kept)}])
+    cache.put("kept", [{'file': str(kept)}])
+    cache.put("gone", [{'file': str(kept)}, {'file': str(gone)}])
+    gone.unlink()
+
+    cache = ResultCache(str(tmp_path / "result_cache.db"))
+    assert [key for key, in cache._db.execute("SELECT key FROM results ORDER BY key")] == ["kept", "old"]
+
+    cache = create_result_cache(str(tmp_path / "result_cache.db"), max_age="24")
+    assert [key for key, in cache._db.execute("SELECT key FROM results")] == ["kept"]
+    with patch("aapp_runner.result_cache._time", return_value=1000):
+        cache.put("old", [{'file': str(kept)}])
+    assert cache.get("old") is None
+    assert cache.get("kept") == [{'file': str(kept)}]
+
+
+def test_run_aapp_pass_from_cache(tmp_path, aapp_dr_runner):
+    """Test the files of the cache are returned, without processing the pass again."""
+    outfile = tmp_path / "hrpt_metop01_20210119_1408_12345.l1b"
+    outfile.write_text("l1b")
+    filelist = [{'file': str(outfile), 'sensor': 'avhrr', 'level': 'l1b'}]
+    config = _get_config(tmp_path, str(tmp_path / "result_cache.db"))
+    config.result_cache.put(get_cache_key(config), filelist)
+
+    with patch.object(aapp_dr_runner, 'setup_aapp_processing') as setup:
+        assert aapp_dr_runner.run_aapp_pass(None, config) == filelist
+    setup.assert_not_called()
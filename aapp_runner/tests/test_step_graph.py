@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test running the processing steps of a pass as a graph of dependencies."""
+
+import threading
+
+import pytest
+
+from aapp_runner.step_graph import StepGraph
+
+
+def test_independent_steps_run_concurrently():
+    """Test the independent steps run at the same time and the dependent step after them."""
+    barrier = threading.Barrier(3, timeout=5)
+    order = []
+
+    def calibration(name):
+        barrier.wait()
+        order.append(name)
+        return True
+
+    def calibration_after(name):
+        order.append(name)
+        return True
+
+    steps = StepGraph()
+    for name in ('hirs', 'atovs', 'avhrr'):
+        steps.add_step(name, calibration, (name,))
+    steps.add_step('atovpp', calibration_after, ('atovpp',), depends_on=('hirs', 'atovs', 'avhrr'))
+
+    report = steps.run(max_workers=3)
+
+    assert sorted(order[:3]) == ['atovs', 'avhrr', 'hirs']
+    assert order[3] == 'atovpp'
+    assert report.ok
+
+
+def test_failed_step_does_not_stop_dependent_steps():
+    """Test a step returning False is reported, and the steps depending on it are still run."""
+    steps = StepGraph()
+    steps.add_step('avhrr', lambda: False)
+    steps.add_step('ana', lambda: True, depends_on=('avhrr',))
+
+    report = steps.run()
+
+    assert report.failed() == ['avhrr']
+    assert report['ana'].status is True
+    assert report.first_exception() is None
+
+
+def test_steps_depending_on_a_raising_step_are_skipped():
+    """Test the steps depending on a step raising an exception are skipped."""
+    def raising():
+        raise KeyError('platform_name')
+
+    steps = StepGraph()
+    steps.add_step('avhrr', raising)
+    steps.add_step('hirs', lambda: True)
+    steps.add_step('atovpp', lambda: True, depends_on=('hirs', 'avhrr'))
+    steps.add_step('ana', lambda: True, depends_on=('atovpp',))
+
+    report = steps.run(max_workers=2)
+
+    assert isinstance(report.first_exception(), KeyError)
+    assert report['hirs'].status is True
+    assert report['atovpp'].skipped
+    assert report['ana'].skipped
+    assert "atovpp: skipped" in str(report)
+
+
+def test_unknown_dependency():
+    """Test a step can only depend on steps already added."""
+    steps = StepGraph()
+    with pytest.raises(ValueError):
+        steps.add_step('ana', lambda: True, depends_on=('avhrr',))
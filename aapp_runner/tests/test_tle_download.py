@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test downloading TLEs, from a local HTTP server."""
+
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from aapp_runner.job_context import JobContext
+from aapp_runner.read_aapp_config import AappL1Config
+from aapp_runner.tle_download import TleDownloader
+from aapp_runner.tle_satpos_prepare import download_tle
+
+WEATHER_TLES = b"NOAA 19\n1 33591U 09005A   21019.52 ...\n2 33591  99.1 ...\n"
+METOP_TLES = b"METOP-B\n1 38771U 12049A   21019.48 ...\n2 38771  98.7 ..."
+SPACETRACK_TLES = b"1 25338U 98030A   21019.50 ...\n2 25338  98.6 ...\n"
+
+
+class _TleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    feeds = {'/weather.txt': (WEATHER_TLES, '"weather-1"'),
+             '/latest_m01_tle.txt': (METOP_TLES, '"metop-1"')}
+    barrier = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, data=b'', headers=()):
+        self.server.requests.append((self.command, self.path, self.client_address, status))
+        self.server.headers.append(self.headers)
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/old/weather.txt':
+            return self._reply(301, headers=[('Location', '/weather.txt')])
+        if self.path == '/moved/weather.txt':
+            location = 'http://localhost:{}/weather.txt'.format(self.server.server_address[1])
+            return self._reply(302, headers=[('Location', location)])
+        if self.path.startswith('/space-track/basicspacedata/query/class/tle_latest/ORDINAL/1/NORAD_CAT_ID/25338,'):
+            if not self.headers.get('Cookie'):
+                return self._reply(401)
+            if self.headers.get('Cookie') != self.server.session:
+                return self._reply(302, headers=[('Location', '/space-track/auth/login')])
+            return self._reply(200, SPACETRACK_TLES)
+        if self.path == '/space-track/auth/login':
+            return self._reply(200, b'<html>Login</html>')
+        if self.path not in self.feeds:
+            return self._reply(404)
+        if self.server.barrier is not None:
+            self.server.barrier.wait()
+        data, etag = self.feeds[self.path]
+        if self.headers.get('If-None-Match') == etag:
+            return self._reply(304, headers=[('ETag', etag)])
+        self._reply(200, data, headers=[('ETag', etag)])
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/space-track/ajaxauth/login' and body == b'identity=me&password=secret':
+            return self._reply(200, b'""', headers=[('Set-Cookie', self.server.session + '; path=/; HttpOnly')])
+        self._reply(401)
+
+
+@pytest.fixture
+def tle_server():
+    """Run a local HTTP server with TLE feeds."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _TleHandler)
+    server.requests = []
+    server.headers = []
+    server.barrier = None
+    server.session = 'chocolatechip=42'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server, path):
+    return "http://127.0.0.1:{}{}".format(server.server_address[1], path)
+
+
+def test_download_concurrently_and_conditionally(tle_server, tmp_path):
+    """Test the feeds are downloaded at the same time, and not transferred again if not modified."""
+    downloader = TleDownloader()
+    tle_download = [{'url': _url(tle_server, '/weather.txt')},
+                    {'url': _url(tle_server, '/latest_m01_tle.txt') + ' ' + _url(tle_server, '/missing.txt')}]
+    # Both feeds have to be requested before any is answered
+    tle_server.barrier = threading.Barrier(2, timeout=5)
+
+    assert downloader.download(tle_download, str(tmp_path)) == [WEATHER_TLES, METOP_TLES, None]
+    assert sorted(status for _, _, _, status in tle_server.requests) == [200, 200, 404]
+
+    tle_server.requests.clear()
+    assert downloader.download(tle_download, str(tmp_path)) == [WEATHER_TLES, METOP_TLES, None]
+    assert sorted(status for _, _, _, status in tle_server.requests) == [304, 304, 404]
+    downloader.close()
+
+
+def test_connections_reused(tle_server, tmp_path):
+    """Test the connections to the server are reused, also after a redirect."""
+    downloader = TleDownloader(max_workers=1)
+    tle_download = [{'url': _url(tle_server, '/old/weather.txt')}]
+
+    for _ in range(3):
+        assert downloader.download(tle_download, str(tmp_path)) == [WEATHER_TLES]
+    assert len(tle_server.requests) == 6
+    assert len(set(client_address for _, _, client_address, _ in tle_server.requests)) == 1
+    downloader.close()
+
+
+def test_redirect_to_other_server(tle_server):
+    """Test the credentials and cache validators are only sent on when redirected to the same server."""
+    downloader = TleDownloader()
+    headers = {'Cookie': 'chocolatechip=42', 'Authorization': 'Basic bWU6c2VjcmV0', 'If-None-Match': '"weather-1"'}
+
+    status, response, data = downloader._request('GET', _url(tle_server, '/old/weather.txt'), headers)
+    assert status == 304
+    assert tle_server.headers[-1]['Cookie'] == 'chocolatechip=42'
+    assert tle_server.headers[-1]['Authorization'] == 'Basic bWU6c2VjcmV0'
+
+    status, response, data = downloader._request('GET', _url(tle_server, '/moved/weather.txt'), headers)
+    assert (status, data) == (200, WEATHER_TLES)
+    assert tle_server.headers[-1]['Host'].startswith('localhost:')
+    for header in ('Cookie', 'Authorization', 'If-None-Match'):
+        assert header not in tle_server.headers[-1]
+    assert headers['Cookie'] == 'chocolatechip=42'
+    downloader.close()
+
+
+def test_spacetrack_session_reused(tle_server, tmp_path):
+    """Test the login to space-track is only done again when the session expired."""
+    downloader = TleDownloader()
+    tle_download = [{'url': _url(tle_server, '/space-track'), 'user': 'me', 'passwd': 'secret',
+                     'catalogue': '25338,33591'}]
+
+    assert downloader.download(tle_download, str(tmp_path)) == [SPACETRACK_TLES]
+    assert downloader.download(tle_download, str(tmp_path)) == [SPACETRACK_TLES]
+    assert [method for method, _, _, _ in tle_server.requests].count('POST') == 1
+
+    # space-track redirects to its login page when the session expired
+    tle_server.session = 'chocolatechip=43'
+    tle_server.requests.clear()
+    assert downloader.download(tle_download, str(tmp_path)) == [SPACETRACK_TLES]
+    assert [(method, status) for method, _, _, status in tle_server.requests] == [
+        ('GET', 302), ('POST', 200), ('GET', 200)]
+    downloader.close()
+
+
+def test_download_tle(tle_server, tmp_path):
+    """Test the TLEs are written to a TLE file for the timestamp, which is not rewritten if unchanged."""
+    config = AappL1Config({'aapp_processes': {'test': {
+        'tle_infile_format': 'tle_{timestamp:%Y%m%d_%H%M}.txt',
+        'tle_download': [{'url': _url(tle_server, '/weather.txt')},
+                         {'url': _url(tle_server, '/latest_m01_tle.txt')}]}}}, 'test')
+    config.job_context = JobContext(str(tmp_path), {
+        'PAR_NAVIGATION_TLE_URL_DOWNLOAD': _url(tle_server, '/space-track'),
+        'PAR_NAVIGATION_TLE_USER': 'me', 'PAR_NAVIGATION_TLE_PASSWD': 'secret'})
+    timestamp = datetime.datetime(2021, 1, 19, 14, 8)
+
+    assert download_tle(config, timestamp, str(tmp_path)) == [str(tmp_path / "tle_20210119_1408.txt")]
+    assert (tmp_path / "tle_20210119_1408.txt").read_bytes() == WEATHER_TLES + METOP_TLES + b"\n" + SPACETRACK_TLES
+    mtime = (tmp_path / "tle_20210119_1408.txt").stat().st_mtime_ns
+
+    assert download_tle(config, timestamp, str(tmp_path)) == [str(tmp_path / "tle_20210119_1408.txt")]
+    assert (tmp_path / "tle_20210119_1408.txt").stat().st_mtime_ns == mtime
+    assert len(config['aapp_processes']['test']['tle_download']) == 2
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test reading the TLEs of TLE files."""
+
+from aapp_runner.tle_parser import (TleRecord, get_satnums, parse_tles,
+                                    select_satellite_tles)
+
+
+def make_tle(satnum, epoch, name=None):
+    """Make a TLE of the catalogue number and epoch."""
+    return TleRecord(name,
+                     "1 {}U 09005A   {}  .00000071  00000-0  63838-4 0  9997".format(satnum, epoch),
+                     "2 {}  99.1851  39.1853 0013683 193.8733 166.2111 14.12451888615346".format(satnum))
+
+
+def test_parse_tles():
+    """Test the TLEs are read with and without name line, skipping what is not a TLE."""
+    noaa19 = make_tle("33591", "21019.52289744", "NOAA 19")
+    metopb = make_tle("38771", "21019.48000000", "METOP-B")
+    no_name = make_tle("25338", "21019.50000000")
+    text = ("# from celestrak\r\n" + noaa19.format().replace("\n", "\r\n") + metopb.format() +
+            no_name.format() + "\n" + no_name.line1 + "\n" + metopb.line2 + "\n")
+
+    assert parse_tles(text) == [noaa19, metopb, no_name]
+    assert noaa19.satnum == "33591"
+    assert noaa19.epoch == "21019.52289744"
+
+
+def test_select_satellite_tles():
+    """Test the TLEs of a satellite are selected by name and catalogue number, once per epoch."""
+    records = [make_tle("33591", "21019.52289744", "NOAA 19"),
+               make_tle("38771", "21019.48000000", "METOP-B"),
+               make_tle("33591", "21019.52289744", "NOAA 19"),
+               make_tle("33591", "21020.10000000"),
+               make_tle("33591", "21018.90000000", "0 NOAA  19")]
+
+    satnums = get_satnums(records, ["noaa 19"])
+    assert satnums == {"33591"}
+    assert select_satellite_tles(records, satnums) == [records[0], records[3], records[4]]
+    assert select_satellite_tles(records, satnums, seen={("33591", "21019.52289744")}) == [records[3], records[4]]
+    assert get_satnums(records, ["NOAA 18"]) == set()
+
+
+def test_satnums_of_two_line_tles():
+    """Test the TLEs without name line are found by the catalogue number of the satellite."""
+    records = [make_tle("33591", "21019.52289744"), make_tle("05560", "21019.48000000")]
+
+    assert get_satnums(records, ["NOAA 19"]) == set()
+    assert get_satnums(records, ["NOAA 19", 33591]) == {"33591"}
+    assert get_satnums(records, ["5560"]) == {"05560"}
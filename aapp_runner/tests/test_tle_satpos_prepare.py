@@ -83,11 +83,13 @@ def test_tle(tmp_path, monkeypatch, caplog):
     config = get_config(p)
     mk_tle_files(p)
 
-    def fake_run_tleing(cmd, stdin="", stdout_logfile=None):
+    def fake_run_tleing(cmd, stdin="", stdout_logfile=None, my_cwd=None, my_env=None,
+                        tail_lines=None, accepted_return_codes=None):
         if cmd == "tleing.exe":
-            data_dir = stdin.split("\n")[0]
+            data_dir, tle_file = stdin.split("\n")[:2]
             assert data_dir == str(p)
-            (p / "tle_noaa19.index").touch()
+            with open(p / "tle_noaa19.index", 'a') as fd_:
+                fd_.write("2021 01 19.25 0.1 {}\n".format(tle_file))
             return (0, 0, "", "")
         elif stdout_logfile is not None:
             pathlib.Path(stdout_logfile).touch()
@@ -112,6 +114,17 @@ def test_tle(tmp_path, monkeypatch, caplog):
     assert len(list(exp_d.parent.iterdir())) == 1
     assert [f.name for f in exp_d.iterdir()] == ["weather202101190616.tle"]
 
+    # No new TLE in the index, nothing to archive
+    (p / "weather202101190616.tle").write_text("changed")
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as atr, \
+            unittest.mock.patch("aapp_runner.tle_satpos_prepare._archive_tles") as archive_tles:
+        atr.side_effect = fake_run_tleing
+        aapp_runner.tle_satpos_prepare.do_tleing(
+            config, datetime.datetime(2021, 1, 19, 14, 8, 26),
+            "noaa19")
+    assert atr.call_count == 1
+    archive_tles.assert_not_called()
+
 
 def test_fetch_realtime_tles(tmp_path):
     """Test fetching TLE files and copy them in under the data dir structure as expected by AAPP."""
@@ -128,8 +141,9 @@ def test_fetch_realtime_tles(tmp_path):
 
     assert os.path.exists(exp_subdir)
     assert os.path.isdir(exp_subdir)
-    # confirm no other directories created
-    assert len(list(outpath.iterdir())) == 1
+    # confirm no other directories created, next to the manifest of the synced files
+    assert len([d for d in outpath.iterdir() if d.is_dir()]) == 1
+    assert (outpath / ".tle_sync_manifest.json").exists()
 
     result_files = [os.path.basename(f) for f in glob(os.path.join(exp_subdir, 'weather*'))]
     expected_file_names = ["weather202101180325.tle",
@@ -140,3 +154,346 @@ def test_fetch_realtime_tles(tmp_path):
         assert item in expected_file_names
 
     assert len(result_files) == len(expected_file_names)
+
+
+def _fake_satpostle(cmd, my_cwd=None, my_env=None, stdout_logfile=None, tail_lines=None):
+    """Write satpos data to the satpos file of $DIR_NAVIGATION, like satpostle -o does."""
+    args = cmd.split()
+    assert args[:2] == ["satpostle", "-o"]
+    assert os.path.basename(my_env['DIR_NAVIGATION']).startswith(".satpos.")
+    day = datetime.datetime.strptime(args[args.index("-d") + 1], "%d/%m/%y")
+    satpos_file = os.path.join(my_env['DIR_NAVIGATION'], "satpos",
+                               "satpos_{}_{:%Y%m%d}.txt".format(args[args.index("-s") + 1], day))
+    with open(satpos_file, 'w') as fd_:
+        fd_.write("satpos data\n")
+    return (True, 0, "satpostle diagnostics\n", "")
+
+
+def test_tle_satpos_written_atomically(tmp_path):
+    """Test the satpos file is written in a temporary navigation dir and moved when complete."""
+    from aapp_runner.job_context import JobContext
+    from aapp_runner.tle_satpos_prepare import do_tle_satpos
+    config = get_config(tmp_path)
+    config.job_context = JobContext(str(tmp_path), {'DIR_NAVIGATION': str(tmp_path)})
+    timestamp = datetime.datetime(2021, 1, 19, 14, 8, 26)
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as mymock:
+        mymock.side_effect = _fake_satpostle
+        assert do_tle_satpos(config, timestamp, 'noaa19')
+        assert do_tle_satpos(config, timestamp, 'noaa19')
+    assert mymock.call_count == 1
+    assert [f.name for f in (tmp_path / "satpos").iterdir()] == ["satpos_noaa19_20210119.txt"]
+    assert (tmp_path / "satpos" / "satpos_noaa19_20210119.txt").read_text() == "satpos data\n"
+    assert not list(tmp_path.glob(".satpos.*"))
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as mymock:
+        mymock.return_value = (True, 1, "", "")
+        assert not do_tle_satpos(config, timestamp, 'noaa18')
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as mymock:
+        mymock.return_value = (True, 0, "satpostle diagnostics\n", "")
+        assert not do_tle_satpos(config, timestamp, 'noaa18')
+    assert [f.name for f in (tmp_path / "satpos").iterdir()] == ["satpos_noaa19_20210119.txt"]
+    assert not list(tmp_path.glob(".satpos.*"))
+
+
+def test_prepare_satpos_files(tmp_path):
+    """Test the satpos files of all the supported satellites are generated ahead."""
+    from aapp_runner.job_context import JobContext
+    from aapp_runner.tle_satpos_prepare import prepare_satpos_files
+    config = get_config(tmp_path)
+    config['aapp_static_configuration'] = {'supported_noaa_satellites': ['NOAA-19'],
+                                           'supported_metop_satellites': ['Metop-B', 'Metop-C'],
+                                           'platform_name_aliases': {'NOAA-19': 'noaa19', 'Metop-B': 'metop01',
+                                                                     'Metop-C': 'metop03'}}
+    config.job_context = JobContext(str(tmp_path), {'DIR_NAVIGATION': str(tmp_path), 'AAPP_PREFIX': '/opt/AAPP8'})
+    (tmp_path / "satpos").mkdir()
+    (tmp_path / "satpos" / "satpos_metop01_20210119.txt").write_text("satpos data\n")
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as mymock:
+        mymock.side_effect = _fake_satpostle
+        assert prepare_satpos_files(config, [datetime.datetime(2021, 1, 19, 23), datetime.datetime(2021, 1, 20, 23)])
+
+    assert mymock.call_count == 5
+    assert sorted(f.name for f in (tmp_path / "satpos").iterdir()) == [
+        "satpos_metop01_20210119.txt", "satpos_metop01_20210120.txt",
+        "satpos_metop03_20210119.txt", "satpos_metop03_20210120.txt",
+        "satpos_noaa19_20210119.txt", "satpos_noaa19_20210120.txt"]
+
+
+def test_tle_file_index(tmp_path):
+    """Test finding the closest TLE file, parsing only the names of new files."""
+    import aapp_runner.tle_satpos_prepare
+    from aapp_runner.tle_satpos_prepare import _TleFileIndex
+    mk_tle_files(tmp_path)
+    index = _TleFileIndex(str(tmp_path))
+    timestamp = datetime.datetime(2021, 1, 19, 14, 8, 26)
+
+    closest = index.find_closest(timestamp, 3 * 24 * 60 * 60)
+    assert closest == (str(tmp_path / "weather202101190616.tle"), 28346.0)
+    assert index.find_closest(timestamp, 60) is None
+    assert index.find_closest(datetime.datetime(2021, 1, 16, 1), 3 * 24 * 60 * 60) == (
+        str(tmp_path / "weather202101160000.tle-0"), 3600.0)
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare._get_tle_file_times",
+                             wraps=aapp_runner.tle_satpos_prepare._get_tle_file_times) as parse:
+        index.find_closest(timestamp, 3 * 24 * 60 * 60)
+        parse.assert_not_called()
+        (tmp_path / "weather202101191400.tle").touch()
+        os.utime(tmp_path, ns=(0, 0))
+        assert index.find_closest(timestamp, 3 * 24 * 60 * 60)[0] == str(tmp_path / "weather202101191400.tle")
+        parse.assert_called_once_with(str(tmp_path / "weather202101191400.tle"))
+
+
+def test_search_tle_files_none_close_enough(tmp_path):
+    """Test no TLE file is used when none is close enough to the data time."""
+    from aapp_runner.tle_satpos_prepare import _search_tle_files
+    mk_tle_files(tmp_path)
+    config = get_config(tmp_path)
+    config['aapp_processes']['test']['tle_file_to_data_diff_limit_days'] = 1
+
+    tle_dict, tle_file_list, tle_search_dir = _search_tle_files(
+        config, str(tmp_path), str(tmp_path / "tle_noaa19.index"), datetime.datetime(2021, 3, 1))
+    assert tle_file_list == []
+
+    tle_dict, tle_file_list, tle_search_dir = _search_tle_files(
+        config, str(tmp_path), str(tmp_path / "tle_noaa19.index"), datetime.datetime(2021, 1, 19, 12))
+    assert tle_file_list == [str(tmp_path / "weather202101190616.tle")]
+
+
+def test_search_tle_files_without_index(tmp_path):
+    """Test all the TLE files are used when there is no index yet, but not the files of the runner."""
+    from aapp_runner.tle_satpos_prepare import _search_tle_files
+    mk_tle_files(tmp_path)
+    config = get_config(tmp_path)
+    del config['aapp_processes']['test']['tle_file_to_data_diff_limit_days']
+    (tmp_path / ".tle_sync_manifest.json").write_text("{}")
+    (tmp_path / ".tle_archive_manifest.json").write_text("{}")
+    (tmp_path / "tle_noaa18.index.ingested").write_text("")
+    (tmp_path / "tle_noaa18.index.epochs").write_text("")
+
+    tle_dict, tle_file_list, tle_search_dir = _search_tle_files(
+        config, str(tmp_path), str(tmp_path / "tle_noaa19.index"), datetime.datetime(2021, 1, 19, 12))
+    assert sorted(tle_file_list) == ["weather202101160000.tle-0", "weather202101170000.tle-0",
+                                     "weather202101180008.tle", "weather202101180325.tle",
+                                     "weather202101190000.tle-0", "weather202101190616.tle"]
+
+
+def test_sort_index_file(tmp_path):
+    """Test the TLE index is sorted with one line per key, without the NaN lines."""
+    from aapp_runner.tle_satpos_prepare import (_INDEX_FAILED, _INDEX_UNCHANGED, _INDEX_UPDATED,
+                                                _read_tle_index_keys, _sort_index_file)
+    tle_index = tmp_path / "tle_noaa19.index"
+    tle_index.write_text("2021 01 19.25 0.1 weather202101190616.tle\n"
+                         "2021 01 18.00 0.1 weather202101180008.tle\n"
+                         "  2021 01 19.25 0.1 weather202101190616.tle-0\n"
+                         "2021 01 18.50 NaN weather202101180325.tle\n"
+                         "2021 01 18.00 0.2 weather202101180325.tle")
+
+    assert _sort_index_file(str(tle_index), [("2021", "01", "18.00")]) == _INDEX_UPDATED
+    assert tle_index.read_text() == ("2021 01 18.00 0.1 weather202101180008.tle\n"
+                                     "2021 01 19.25 0.1 weather202101190616.tle\n")
+
+    # Nothing to change, the file is not rewritten
+    os.utime(tle_index, ns=(0, 0))
+    assert _sort_index_file(str(tle_index), _read_tle_index_keys(str(tle_index))) == _INDEX_UNCHANGED
+    assert tle_index.stat().st_mtime_ns == 0
+    assert [f.name for f in tmp_path.iterdir()] == ["tle_noaa19.index"]
+
+    assert _sort_index_file(str(tmp_path / "tle_noaa18.index")) == _INDEX_FAILED
+
+
+def test_fetch_realtime_tles_only_new_or_changed(tmp_path):
+    """Test only the new or changed TLE files are synced, by hard link when possible."""
+    mypath = tmp_path / "input"
+    mk_tle_files(mypath)
+    outpath = tmp_path / "output"
+    outpath.mkdir()
+    tle_infile_format = 'weather{timestamp:%Y%m%d%H%M}.tle'
+
+    fetch_realtime_tles(mypath, outpath, tle_infile_format)
+    synced = outpath / "2021_01" / "weather202101180325.tle"
+    assert os.path.samefile(synced, mypath / "weather202101180325.tle")
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare._link_or_copy") as link:
+        fetch_realtime_tles(mypath, outpath, tle_infile_format)
+        link.assert_not_called()
+
+        (mypath / "weather202101200000.tle").write_text("new tle")
+        link.side_effect = lambda src, dst: pathlib.Path(dst).write_text("new tle")
+        fetch_realtime_tles(mypath, outpath, tle_infile_format)
+        link.assert_called_once()
+        assert link.call_args[0][0] == str(mypath / "weather202101200000.tle")
+
+    # On another filesystem the files are copied
+    (mypath / "weather202101210000.tle").write_text("newer tle")
+    with unittest.mock.patch("os.link", side_effect=OSError(18, "Invalid cross-device link")):
+        fetch_realtime_tles(mypath, outpath, tle_infile_format)
+    assert (outpath / "2021_01" / "weather202101210000.tle").read_text() == "newer tle"
+
+
+def test_ingest_prefiltered_tles(tmp_path, monkeypatch):
+    """Test tleing is only given the new TLEs of the satellite."""
+    from aapp_runner.tests.test_tle_parser import make_tle
+    from aapp_runner.tle_satpos_prepare import do_tleing
+    monkeypatch.setenv("AAPP_PREFIX", "invalid")
+    monkeypatch.setenv("DIR_DATA_TLE", str(tmp_path))
+    monkeypatch.setenv("DIR_NAVIGATION", "nav")
+    config = get_config(tmp_path)
+    del config['aapp_processes']['test']['tle_archive_dir']
+    config['aapp_processes']['test']['prefilter_tle_files'] = True
+    config['aapp_static_configuration'] = {'platform_name_aliases': {'NOAA-19': 'noaa19'},
+                                           'tle_platform_name_aliases': {'NOAA-19': 'NOAA 19'}}
+    noaa19 = make_tle("33591", "21019.52289744", "NOAA 19")
+    metopb = make_tle("38771", "21019.48000000", "METOP-B")
+    (tmp_path / "weather202101190616.tle").write_text(noaa19.format() + metopb.format() + noaa19.format())
+    tleing_input = []
+
+    def fake_run_tleing(cmd, stdin="", stdout_logfile=None, my_cwd=None, my_env=None,
+                        tail_lines=None, accepted_return_codes=None):
+        tle_dir, tle_file = stdin.split("\n")[:2]
+        tleing_input.append((tle_file, (pathlib.Path(tle_dir) / tle_file).read_text()))
+        (tmp_path / "tle_noaa19.index").touch()
+        return (0, 0, "", "")
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as atr:
+        atr.side_effect = fake_run_tleing
+        do_tleing(config, datetime.datetime(2021, 1, 19, 14, 8, 26), "noaa19")
+        assert tleing_input == [(os.path.join(".tle_split", "noaa19", "weather202101190616.tle"), noaa19.format())]
+
+        # The same TLEs in a new file
+        tleing_input.clear()
+        (tmp_path / "weather202101191200.tle").write_text(metopb.format() + noaa19.format())
+        do_tleing(config, datetime.datetime(2021, 1, 19, 14, 8, 26), "noaa19")
+        assert tleing_input == []
+        assert (tmp_path / "tle_noaa19.index.ingested").read_text().count("weather202101191200.tle") == 1
+
+
+def test_prune_ingested_records(tmp_path):
+    """Test the records of the TLE files and TLEs out of the TLE search window are dropped."""
+    from aapp_runner.tle_satpos_prepare import (_prune_ingested_records, _read_ingested_epochs,
+                                                _read_ingested_tle_files)
+    config = get_config(tmp_path)
+    config['aapp_processes']['test']['tle_file_to_data_diff_limit_days'] = 10
+    tle_index = tmp_path / "tle_noaa19.index"
+    tle_index.write_text("2021 01 19.52 0.1 weather202101190616.tle\n")
+    (tmp_path / "weather202012010000.tle").write_text("old")
+    (tmp_path / "weather202101190616.tle").write_text("recent")
+    mtime_ns = (tmp_path / "weather202101190616.tle").stat().st_mtime_ns
+    (tmp_path / "tle_noaa19.index.ingested").write_text(
+        "1 {}\n".format(tmp_path / "weather202012010000.tle") +
+        "2 {}\n".format(tmp_path / "weather202101180325.tle") +
+        "{} {}\n".format(mtime_ns, tmp_path / "weather202101190616.tle"))
+    (tmp_path / "tle_noaa19.index.epochs").write_text("33591 20336.50000000\n33591 21019.52289744\n")
+
+    _prune_ingested_records(config, str(tle_index), datetime.datetime(2021, 1, 19, 14, 8, 26))
+    assert _read_ingested_tle_files(str(tle_index)) == {str(tmp_path / "weather202101190616.tle"): mtime_ns}
+    assert _read_ingested_epochs(str(tle_index)) == {("33591", "21019.52289744")}
+    assert not list(tmp_path.glob(".tle_noaa19.index.*"))
+
+
+def test_ingest_tle_from_store(tmp_path, monkeypatch):
+    """Test tleing is given the TLE with the epoch closest to the data, from the TLE store."""
+    from aapp_runner.tests.test_tle_parser import make_tle
+    from aapp_runner.tle_satpos_prepare import do_tleing
+    monkeypatch.setenv("AAPP_PREFIX", "invalid")
+    monkeypatch.setenv("DIR_DATA_TLE", str(tmp_path))
+    monkeypatch.setenv("DIR_NAVIGATION", "nav")
+    config = get_config(tmp_path)
+    config['aapp_processes']['test']['tle_store_file'] = str(tmp_path / "tle_store.db")
+    config['aapp_static_configuration'] = {'platform_name_aliases': {'NOAA-19': 'noaa19'},
+                                           'tle_platform_name_aliases': {'NOAA-19': 'NOAA 19'}}
+    stale = make_tle("33591", "21010.50000000", "NOAA 19")
+    recent = make_tle("33591", "21019.25000000", "NOAA 19")
+    # The TLE file named closest to the data has stale TLEs only
+    (tmp_path / "2021_01").mkdir()
+    (tmp_path / "2021_01" / "weather202101191200.tle").write_text(stale.format())
+    archive = tmp_path / "archive" / "tle-20210118"
+    archive.mkdir(parents=True)
+    (archive / "weather202101180325.tle").write_text(recent.format())
+    tleing_input = []
+
+    def fake_run_tleing(cmd, stdin="", stdout_logfile=None, my_cwd=None, my_env=None,
+                        tail_lines=None, accepted_return_codes=None):
+        tle_dir, tle_file = stdin.split("\n")[:2]
+        tleing_input.append((tle_file, (pathlib.Path(tle_dir) / tle_file).read_text()))
+        (tmp_path / "tle_noaa19.index").touch()
+        return (0, 0, "", "")
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as atr:
+        atr.side_effect = fake_run_tleing
+        do_tleing(config, datetime.datetime(2021, 1, 19, 14, 8, 26), "noaa19")
+        assert tleing_input == [(os.path.join(".tle_store", "noaa19", "tle_noaa19_21019.25000000.txt"),
+                                 recent.format())]
+
+        tleing_input.clear()
+        do_tleing(config, datetime.datetime(2021, 1, 19, 14, 8, 26), "noaa19")
+        assert tleing_input == []
+
+
+def test_satpos_generated_once_by_concurrent_jobs(tmp_path):
+    """Test a job needing a satpos file being generated waits for it, instead of generating it again."""
+    import threading
+    import time
+    from aapp_runner.job_context import JobContext
+    from aapp_runner.tle_satpos_prepare import do_tle_satpos
+    timestamp = datetime.datetime(2021, 1, 19, 14, 8, 26)
+    results = []
+
+    def slow_satpostle(*args, **kwargs):
+        time.sleep(0.2)
+        return _fake_satpostle(*args, **kwargs)
+
+    def run_job():
+        config = get_config(tmp_path)
+        config.job_context = JobContext(str(tmp_path), {'DIR_NAVIGATION': str(tmp_path)})
+        results.append(do_tle_satpos(config, timestamp, 'noaa19'))
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.run_shell_command") as mymock:
+        mymock.side_effect = slow_satpostle
+        jobs = [threading.Thread(target=run_job) for _ in range(3)]
+        for job in jobs:
+            job.start()
+        for job in jobs:
+            job.join()
+    assert results == [True, True, True]
+    assert mymock.call_count == 1
+    assert [f.name for f in (tmp_path / "satpos").iterdir()] == ["satpos_noaa19_20210119.txt"]
+
+
+def test_archive_tles_by_content(tmp_path):
+    """Test TLE files are archived once per content, hard linked, and not read again when unchanged."""
+    from aapp_runner.job_context import JobContext
+    from aapp_runner.tle_satpos_prepare import _archive_tles
+    config = get_config(tmp_path)
+    config.job_context = JobContext(str(tmp_path), {'DIR_DATA_TLE': str(tmp_path), 'DIR_NAVIGATION': str(tmp_path)})
+    (tmp_path / "weather202101190616.tle").write_text("tles of the 19th\n")
+    (tmp_path / "weather202101191200.tle").write_text("tles of the 19th\n")
+    (tmp_path / "weather202101200616.tle").write_text("tles of the 20th\n")
+    tle_files = ["weather202101190616.tle", "weather202101191200.tle", "weather202101200616.tle"]
+
+    _archive_tles(config, tle_files)
+    archive = tmp_path / "archive"
+    assert sorted(str(f.relative_to(archive)) for f in archive.glob("*/*")) == [
+        os.path.join("tle-20210119", "weather202101190616.tle"),
+        os.path.join("tle-20210120", "weather202101200616.tle")]
+    assert os.path.samefile(archive / "tle-20210120" / "weather202101200616.tle",
+                            tmp_path / "weather202101200616.tle")
+
+    with unittest.mock.patch("aapp_runner.tle_satpos_prepare.hash_file") as hash_file:
+        _archive_tles(config, tle_files)
+    hash_file.assert_not_called()
+
+    # New TLEs in a TLE file archived already
+    (tmp_path / "weather202101191200.tle").unlink()
+    (tmp_path / "weather202101191200.tle").write_text("new tles of the 19th\n")
+    _archive_tles(config, tle_files)
+    assert (archive / "tle-20210119" / "weather202101191200.tle").read_text() == "new tles of the 19th\n"
+    assert len(list(archive.glob("*/*"))) == 3
+
+    # The archived file of the 20th is overwritten, its old content is not in the archive anymore
+    (tmp_path / "weather202101200616.tle").unlink()
+    (tmp_path / "weather202101200616.tle").write_text("new tles of the 20th\n")
+    (tmp_path / "weather202101201200.tle").write_text("tles of the 20th\n")
+    _archive_tles(config, ["weather202101200616.tle", "weather202101201200.tle"])
+    assert (archive / "tle-20210120" / "weather202101200616.tle").read_text() == "new tles of the 20th\n"
+    assert (archive / "tle-20210120" / "weather202101201200.tle").read_text() == "tles of the 20th\n"
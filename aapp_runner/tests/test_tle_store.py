@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the store of TLEs indexed by satellite and epoch."""
+
+import datetime
+import os
+from unittest.mock import patch
+
+from aapp_runner.tests.test_tle_parser import make_tle
+from aapp_runner.tle_store import TleStore
+
+
+def test_find_closest_epoch(tmp_path):
+    """Test the TLE with the closest epoch is found, whatever the name of its TLE file."""
+    old = make_tle("33591", "21010.50000000", "NOAA 19")
+    new = make_tle("33591", "21019.25000000")
+    (tmp_path / "weather202101190000.tle").write_text(old.format() + make_tle("38771", "21019.00000000").format())
+    (tmp_path / "weather202101010000.tle").write_text(new.format() + old.format())
+    store = TleStore(str(tmp_path / "tle_store.db"))
+    assert store.add_tle_dir(str(tmp_path), is_tle_file=lambda name: name.endswith(".tle")) == 3
+
+    satnums = store.get_satnums(["noaa 19"])
+    assert satnums == {"33591"}
+    assert store.find_closest(satnums, datetime.datetime(2021, 1, 19, 14)) == (
+        (new, str(tmp_path / "weather202101010000.tle")), 8 * 3600)
+    assert store.find_closest(satnums, datetime.datetime(2021, 1, 11)) == (
+        (old, str(tmp_path / "weather202101010000.tle")), 12 * 3600)
+    assert store.find_closest(satnums, datetime.datetime(2021, 1, 19, 14), max_seconds=3600) is None
+    assert store.find_closest(set(), datetime.datetime(2021, 1, 19, 14)) is None
+
+
+def test_files_added_once(tmp_path):
+    """Test the TLE files are only read again when changed, also after a restart."""
+    tle_file = tmp_path / "weather202101190000.tle"
+    tle_file.write_text(make_tle("33591", "21019.25000000", "NOAA 19").format())
+    store = TleStore(str(tmp_path / "tle_store.db"))
+    assert store.add_tle_files([str(tle_file)]) == 1
+
+    store = TleStore(str(tmp_path / "tle_store.db"))
+    with patch("aapp_runner.tle_store.read_tles") as read_tles:
+        assert store.add_tle_files([str(tle_file)]) == 0
+    read_tles.assert_not_called()
+
+    tle_file.write_text(make_tle("33591", "21019.75000000", "NOAA 19").format())
+    assert store.add_tle_files([str(tle_file)]) == 1
+    assert store.add_tle_files([str(tmp_path / "missing.tle")]) == 0
+
+
+def test_find_two_line_tles_by_catalogue_number(tmp_path):
+    """Test the TLEs of TLE files without names are found by the catalogue number of the satellite."""
+    tle = make_tle("33591", "21019.25000000")
+    (tmp_path / "spacetrack202101190000.tle").write_text(tle.format())
+    store = TleStore(str(tmp_path / "tle_store.db"))
+    assert store.add_tle_dir(str(tmp_path), is_tle_file=lambda name: name.endswith(".tle")) == 1
+
+    assert store.get_satnums(["NOAA 19"]) == set()
+    satnums = store.get_satnums(["NOAA 19", "33591"])
+    assert satnums == {"33591"}
+    assert store.find_closest(satnums, datetime.datetime(2021, 1, 19, 14)) == (
+        (tle, str(tmp_path / "spacetrack202101190000.tle")), 8 * 3600)
+
+
+def test_tle_file_rewritten_in_place(tmp_path):
+    """Test a TLE file rewritten in place is read again, though the directory and its mtime are unchanged."""
+    tle_file = tmp_path / "weather202101190000.tle"
+    tle_file.write_text(make_tle("33591", "21019.25000000", "NOAA 19").format())
+    store = TleStore(str(tmp_path / "tle_store.db"))
+    assert store.add_tle_dir(str(tmp_path), is_tle_file=lambda name: name.endswith(".tle")) == 1
+    assert store.add_tle_dir(str(tmp_path), is_tle_file=lambda name: name.endswith(".tle")) == 0
+
+    stat = os.stat(tle_file)
+    dir_stat = os.stat(tmp_path)
+    tle_file.write_text(make_tle("33591", "21019.25000000", "NOAA 19").format() +
+                        make_tle("33591", "21019.75000000", "NOAA 19").format())
+    os.utime(tle_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.utime(tmp_path, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+    assert store.add_tle_dir(str(tmp_path), is_tle_file=lambda name: name.endswith(".tle")) == 1
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test ingesting the new TLE files in the background."""
+
+import datetime
+import pathlib
+from unittest.mock import patch
+
+from aapp_runner.job_context import JobContext
+from aapp_runner.read_aapp_config import AappL1Config
+from aapp_runner.tle_satpos_prepare import do_tleing
+from aapp_runner.tle_watcher import TleWatcher
+
+
+def _get_config(pth):
+    config = AappL1Config({
+        'aapp_static_configuration': {'supported_noaa_satellites': ['NOAA-19'],
+                                      'supported_metop_satellites': ['Metop-B'],
+                                      'platform_name_aliases': {'NOAA-19': 'noaa19', 'Metop-B': 'metop01'}},
+        'aapp_processes': {
+            'test': {
+                'tle_indir': str(pth),
+                'tle_infile_format': 'weather{timestamp:%Y%m%d%H%M}.tle',
+                'download_tle_files': False,
+                'tle_file_to_data_diff_limit_days': 3,
+                'tle_watch_interval': 600,
+                'working_dir': str(pth)}},
+    }, "test")
+    config.job_context = JobContext(str(pth), {'AAPP_PREFIX': '/opt/AAPP8', 'DIR_NAVIGATION': str(pth)})
+    return config
+
+
+def _fake_tleing(ingested):
+    def fake_run(cmd, stdin="", stdout_logfile=None, my_cwd=None, my_env=None,
+                 tail_lines=None, accepted_return_codes=None):
+        assert cmd == "tleing.exe"
+        tle_dir, tle_file, satellite, tle_index = stdin.split("\n")[:4]
+        ingested.append((satellite, pathlib.Path(tle_file).name))
+        pathlib.Path(tle_index).touch()
+        return (True, 0, "", "")
+    return fake_run
+
+
+def test_watcher_ingests_new_tles_for_all_satellites(tmp_path):
+    """Test the watcher ingests the new TLE files, and the passes then do not run tleing."""
+    (tmp_path / "weather202101190616.tle").touch()
+    config = _get_config(tmp_path)
+    watcher = TleWatcher(config, 600)
+    timestamp = datetime.datetime(2021, 1, 19, 14, 8, 26)
+    ingested = []
+
+    with patch("aapp_runner.tle_satpos_prepare.run_shell_command") as mymock:
+        mymock.side_effect = _fake_tleing(ingested)
+        watcher.update_tle_indexes(timestamp)
+        assert sorted(ingested) == [('metop01', 'weather202101190616.tle'), ('noaa19', 'weather202101190616.tle')]
+
+        ingested.clear()
+        watcher.update_tle_indexes(timestamp)
+        assert do_tleing(_get_config(tmp_path), timestamp, 'noaa19')
+        assert ingested == []
+
+        # A new TLE file closer to the pass
+        (tmp_path / "weather202101191200.tle").touch()
+        assert do_tleing(_get_config(tmp_path), timestamp, 'noaa19')
+        assert ingested == [('noaa19', 'weather202101191200.tle')]
+
+
+def test_watcher_thread(tmp_path):
+    """Test the watcher thread updates the TLE indexes, until stopped."""
+    config = _get_config(tmp_path)
+    watcher = TleWatcher(config, 600)
+
+    with patch.object(watcher, 'update_tle_indexes') as update:
+        watcher.start()
+        watcher.stop()
+    update.assert_called_once_with()
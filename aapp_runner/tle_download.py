@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Download TLEs from the tle_download URLs.
+
+All the URLs are fetched at the same time, over HTTP connections kept open
+and reused for the next downloads from the same server. The ETag and
+Last-Modified of each download are kept with its content in a cache dir, and
+sent as If-None-Match and If-Modified-Since the next time: a feed not
+changed since is not transferred again, the cached content is used.
+
+space-track.org needs a login first, with the user and passwd of its
+tle_download entry, and the TLEs of the satellites in catalogue are queried.
+The session cookie is kept for the next downloads, and the login is only
+done again when space-track answers 401 or redirects to its login page.
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urljoin, urlsplit
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60
+MAX_REDIRECTS = 5
+SPACETRACK_QUERY = "{}/basicspacedata/query/class/tle_latest/ORDINAL/1/NORAD_CAT_ID/{}/orderby/TLE_LINE1"
+# Not sent on when redirected to another server: the credentials, and the validators of our cached copy
+_CROSS_ORIGIN_HEADERS = ('authorization', 'cookie', 'if-none-match', 'if-modified-since')
+
+
+class TleDownloadError(RuntimeError):
+    """Failed to download TLEs."""
+    pass
+
+
+class _HttpStatusError(TleDownloadError):
+    """A download answered with an HTTP status other than 200."""
+
+    def __init__(self, url, status, location=None):
+        super(_HttpStatusError, self).__init__("Download of {} failed with HTTP status {}".format(url, status))
+        self.status = status
+        self.location = location
+
+
+def _is_login_page(url):
+    return "/auth/login" in urlsplit(url).path
+
+
+class _ConnectionPool(object):
+    """Idle HTTP connections, by scheme and server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def get(self, scheme, netloc, timeout):
+        """Get an idle connection to the server, or None."""
+        with self._lock:
+            connections = self._idle.get((scheme, netloc))
+            if not connections:
+                return None
+            connection = connections.pop()
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    @staticmethod
+    def connect(scheme, netloc, timeout):
+        """Get a new connection to the server."""
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=timeout)
+        if scheme == 'http':
+            return http.client.HTTPConnection(netloc, timeout=timeout)
+        raise TleDownloadError("Unsupported url scheme: {}".format(scheme))
+
+    def put(self, scheme, netloc, connection):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(connection)
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+
+class TleDownloader(object):
+    """Download TLEs concurrently, with up to *max_workers* downloads at the same time."""
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = _ConnectionPool()
+        self._session_lock = threading.Lock()
+        self._session_cookies = {}
+
+    def _request(self, method, url, headers=None, body=None, timeout=DEFAULT_TIMEOUT, stop_redirect=None):
+        """Make a request on a pooled connection, following redirects. Return (status, response, data).
+
+        The redirects to an url for which *stop_redirect* is True are not
+        followed, the redirect is returned.
+        """
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            connection = self._pool.get(parts.scheme, parts.netloc, timeout)
+            try:
+                if connection is None:
+                    connection = self._pool.connect(parts.scheme, parts.netloc, timeout)
+                    response, data = _send(connection, method, path, headers, body)
+                else:
+                    try:
+                        response, data = _send(connection, method, path, headers, body)
+                    except (http.client.HTTPException, OSError):
+                        # The server closed the idle connection, try on a new one
+                        connection.close()
+                        connection = self._pool.connect(parts.scheme, parts.netloc, timeout)
+                        response, data = _send(connection, method, path, headers, body)
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._pool.put(parts.scheme, parts.netloc, connection)
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                url = urljoin(url, response.getheader('Location'))
+                if stop_redirect is not None and stop_redirect(url):
+                    return response.status, response, data
+                if response.status == 303:
+                    method, body = 'GET', None
+                redirect_parts = urlsplit(url)
+                if (redirect_parts.scheme, redirect_parts.netloc) != (parts.scheme, parts.netloc):
+                    headers = dict((key, value) for key, value in headers.items()
+                                   if key.lower() not in _CROSS_ORIGIN_HEADERS)
+                continue
+            return response.status, response, data
+        raise TleDownloadError("Too many redirects for {}".format(url))
+
+    def _download(self, url, cache_dir, timeout=DEFAULT_TIMEOUT, headers=None, stop_redirect=None):
+        """Download *url*, or get it from the cache dir if not modified since. Return the content."""
+        cache_name = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())
+        headers = dict(headers or {})
+        cached = None
+        try:
+            with open(cache_name + ".json") as fd_:
+                cached = json.load(fd_)
+            with open(cache_name + ".txt", 'rb') as fd_:
+                cached_data = fd_.read()
+        except (OSError, ValueError):
+            cached = None
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        status, response, data = self._request('GET', url, headers=headers, timeout=timeout,
+                                               stop_redirect=stop_redirect)
+        if status == 304 and cached is not None:
+            LOG.debug("TLEs of {} not modified.".format(url))
+            return cached_data
+        if status != 200:
+            location = response.getheader('Location') and urljoin(url, response.getheader('Location'))
+            raise _HttpStatusError(url, status, location)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_atomically(cache_name + ".txt", data)
+        _write_atomically(cache_name + ".json", json.dumps({'url': url,
+                                                            'etag': response.getheader('ETag'),
+                                                            'last_modified': response.getheader('Last-Modified')
+                                                            }).encode())
+        LOG.debug("Downloaded {} bytes of TLEs from {}".format(len(data), url))
+        return data
+
+    def _login_spacetrack(self, cnf, url, timeout, expired_cookie=None):
+        """Get the session cookie of space-track, logging in if there is none or it is *expired_cookie*."""
+        session = (url.rstrip('/'), cnf.get('user'))
+        with self._session_lock:
+            cookie = self._session_cookies.get(session)
+            if cookie is not None and cookie != expired_cookie:
+                return cookie
+            self._session_cookies.pop(session, None)
+            login = urlencode({'identity': cnf.get('user'), 'password': cnf.get('passwd')})
+            status, response, data = self._request('POST', "{}/ajaxauth/login".format(url.rstrip('/')),
+                                                   headers={'Content-Type': 'application/x-www-form-urlencoded'},
+                                                   body=login, timeout=timeout)
+            if status != 200:
+                raise TleDownloadError("Login to {} failed with HTTP status {}".format(url, status))
+            cookies = [cookie.split(';', 1)[0] for cookie in response.msg.get_all('Set-Cookie') or []]
+            cookie = self._session_cookies[session] = '; '.join(cookies)
+            LOG.debug("Logged in to {}".format(url))
+        return cookie
+
+    def _download_spacetrack(self, cnf, url, cache_dir):
+        """Download the TLEs of the catalogue satellites from space-track, logging in when needed."""
+        timeout = cnf.get('timeout', DEFAULT_TIMEOUT)
+        query = SPACETRACK_QUERY.format(url.rstrip('/'), cnf.get('catalogue', ''))
+        cookie = self._login_spacetrack(cnf, url, timeout)
+        try:
+            return self._download(query, cache_dir, timeout=timeout, headers={'Cookie': cookie},
+                                  stop_redirect=_is_login_page)
+        except _HttpStatusError as err:
+            if err.status != 401 and not (err.location and _is_login_page(err.location)):
+                raise
+            LOG.debug("Session of {} expired, log in again.".format(url))
+        cookie = self._login_spacetrack(cnf, url, timeout, expired_cookie=cookie)
+        return self._download(query, cache_dir, timeout=timeout, headers={'Cookie': cookie},
+                              stop_redirect=_is_login_page)
+
+    def _download_entry(self, cnf, url, cache_dir):
+        try:
+            if "space-track" in url:
+                return self._download_spacetrack(cnf, url, cache_dir)
+            return self._download(url, cache_dir, timeout=cnf.get('timeout', DEFAULT_TIMEOUT))
+        except (TleDownloadError, http.client.HTTPException, OSError) as err:
+            LOG.error("Failed to download TLEs from {}: {}".format(url, err))
+            return None
+
+    def download(self, tle_download, cache_dir):
+        """Download the TLEs of all the *tle_download* entries, in the order of the entries.
+
+        An entry is a dict with a url (or several, separated by spaces) and
+        for space-track user, passwd, timeout and catalogue. Return a list of
+        the contents downloaded, with None for the failed downloads.
+        """
+        jobs = [(cnf, url) for cnf in tle_download for url in cnf['url'].split()]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._download_entry, cnf, url, cache_dir) for cnf, url in jobs]
+            return [future.result() for future in futures]
+
+    def close(self):
+        """Close the idle connections."""
+        self._pool.close()
+
+
+def _send(connection, method, path, headers, body):
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def _write_atomically(filename, data):
+    fd_, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                         prefix=".{}.".format(os.path.basename(filename)))
+    with os.fdopen(fd_, 'wb') as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_filename, filename)
+
+
+def write_tle_file(filename, contents):
+    """Write the TLE *contents* one after the other to *filename*, atomically.
+
+    Return True if the file changed, the file is not touched if it has the same
+    TLEs already.
+    """
+    data = b''
+    for content in contents:
+        if content and not content.endswith(b'\n'):
+            content += b'\n'
+        data += content
+    try:
+        with open(filename, 'rb') as fd_:
+            if fd_.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    _write_atomically(filename, data)
+    return True
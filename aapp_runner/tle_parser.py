@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Read the TLEs of a TLE file, and select the TLEs of a satellite.
+
+TLE files have the TLEs of many objects, with a name line before the two
+lines of each TLE (celestrak), or only the two lines (space-track). When
+TLEs of several sources are put in one file, the same TLE can be there
+several times.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+
+class TleRecord(namedtuple('TleRecord', ['name', 'line1', 'line2'])):
+    """A TLE: the name line (or None) and the two lines of the TLE."""
+
+    __slots__ = ()
+
+    @property
+    def satnum(self):
+        """The NORAD catalogue number."""
+        return self.line1[2:7].strip()
+
+    @property
+    def epoch(self):
+        """The epoch, as in the TLE: two digit year and day of the year."""
+        return self.line1[18:32].strip()
+
+    @property
+    def epoch_time(self):
+        """The epoch, as a datetime. Raise ValueError if not a valid epoch."""
+        return parse_tle_epoch(self.epoch)
+
+    def format(self):
+        """Get the TLE as in a TLE file."""
+        lines = [self.line1, self.line2]
+        if self.name is not None:
+            lines.insert(0, self.name)
+        return "\n".join(lines) + "\n"
+
+
+def parse_tle_epoch(epoch):
+    """Get the TLE epoch *epoch*, two digit year and day of the year, as a datetime.
+
+    Raise ValueError if not a valid epoch.
+    """
+    year = int(epoch[:2])
+    year += 1900 if year >= 57 else 2000
+    return datetime(year, 1, 1) + timedelta(days=float(epoch[2:]) - 1)
+
+
+def normalize_tle_name(name):
+    """Normalize a satellite name of a TLE file, for comparisons.
+
+    The name line of the space-track three line format starts with "0 ".
+    """
+    name = name.strip()
+    if name.startswith("0 "):
+        name = name[2:]
+    return " ".join(name.upper().split())
+
+
+def get_catalogue_number(name):
+    """Get the NORAD catalogue number *name*, as in a TLE, or None if *name* is not a catalogue number."""
+    name = str(name).strip()
+    if not name.isdigit():
+        return None
+    return name.zfill(5)
+
+
+def _is_tle_line(line, number):
+    return len(line) >= 69 and line.startswith("{} ".format(number))
+
+
+def parse_tles(text):
+    """Get the TLE records of *text*, in the order of the text.
+
+    Lines not part of a TLE are skipped, a TLE of which the two lines are not
+    for the same satellite as well.
+    """
+    lines = [line.rstrip() for line in text.splitlines()]
+    records = []
+    name = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _is_tle_line(line, 1) and i + 1 < len(lines) and _is_tle_line(lines[i + 1], 2):
+            if line[2:7] == lines[i + 1][2:7]:
+                records.append(TleRecord(name, line, lines[i + 1]))
+            name = None
+            i += 2
+            continue
+        name = line if line.strip() else None
+        i += 1
+    return records
+
+
+def read_tles(filename):
+    """Get the TLE records of the TLE file *filename*."""
+    with open(filename, errors='replace') as fd_:
+        return parse_tles(fd_.read())
+
+
+def get_satnums(records, names):
+    """Get the catalogue numbers of the TLE records with a name in *names*.
+
+    The catalogue numbers in *names* match the TLE records without name too.
+    """
+    catalogue_numbers = set(get_catalogue_number(name) for name in names)
+    names = set(normalize_tle_name(str(name)) for name in names)
+    return set(record.satnum for record in records
+               if record.satnum in catalogue_numbers or
+               (record.name is not None and normalize_tle_name(record.name) in names))
+
+
+def select_satellite_tles(records, satnums, seen=()):
+    """Get the TLE records with a catalogue number in *satnums*, one per epoch.
+
+    The first TLE of an epoch is kept, and the TLEs with a (catalogue number,
+    epoch) in *seen* are skipped.
+    """
+    seen = set(seen)
+    selected = []
+    for record in records:
+        if record.satnum not in satnums or (record.satnum, record.epoch) in seen:
+            continue
+        seen.add((record.satnum, record.epoch))
+        selected.append(record)
+    return selected
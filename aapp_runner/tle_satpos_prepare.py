@@ -30,24 +30,59 @@ will try to find the correct one.
 If data is reprocessed it should use the closest tle
 If data is from Direct Broadcast the only newer tle files than the
 timestamp if the index file should be processed.
+
+Several runners may share the TLE dir and satpos files. The TLE index of a
+satellite is updated under an exclusive lock and read by satpostle under a
+shared lock, and one job at a time generates the satpos files of a
+satellite. The lock files are in the .locks directory of the TLE dir.
 """
 
+import json
 import logging
 import os
 import re
 import shutil
 import tempfile
+import threading
 import time
-from datetime import datetime
+from bisect import bisect_left
+from datetime import datetime, timedelta
 from glob import glob
-from shutil import copy
 
 from trollsift.parser import Parser, compose, globify
 
-from aapp_runner.helper_functions import run_shell_command
+from aapp_runner.helper_functions import (file_lock, hash_file,
+                                          run_shell_command)
+from aapp_runner.tle_download import TleDownloader, write_tle_file
+from aapp_runner.tle_parser import get_satnums, parse_tle_epoch, read_tles, select_satellite_tles
+from aapp_runner.tle_store import TleStore
 
 LOG = logging.getLogger(__name__)
 
+# The TLE index files are updated by the passes and the TLE watcher, one at a time
+_TLE_INDEX_LOCKS = {}
+_TLE_INDEX_LOCKS_LOCK = threading.Lock()
+
+# The TLE files synced from recent_tlefiles_ext_dir are listed in this file in the TLE dir
+_TLE_SYNC_MANIFEST = ".tle_sync_manifest.json"
+_TLE_SYNC_LOCK = threading.Lock()
+
+# The digests of the archived TLE files are kept in this manifest in the TLE dir
+_TLE_ARCHIVE_MANIFEST = ".tle_archive_manifest.json"
+
+# The downloads of TLEs keep their connections open, and the last TLEs in this cache dir of the TLE dir
+_TLE_DOWNLOADER = TleDownloader()
+_TLE_DOWNLOAD_CACHE = ".tle_download_cache"
+
+# The TLEs of each satellite, taken from the TLE files for tleing, are put here in the TLE dir
+_TLE_SPLIT_DIR = ".tle_split"
+
+# The TLEs selected from the TLE store for tleing are put here in the TLE dir
+_TLE_STORE_DIR = ".tle_store"
+
+# The lock files of the TLE indexes and satpos files are put here in the TLE dir
+_LOCK_DIR = ".locks"
+
 
 def _do_6_matches(m):
     return datetime.strptime(m.group(1) + m.group(2) + m.group(3) + m.group(4) + m.group(5) + m.group(6), "%Y%m%d%H%M%S")
@@ -76,11 +111,104 @@ tle_match_tests = ((r'.*(\d{4})(\d{2})(\d{2})_?-?T?(\d{2})(\d{2})(\d{2}).*', _do
                    (r'.*(\d{2})(\d{2})(\d{2}).*', _do_3_matchesYY))
 
 
+_TLE_MATCH_TESTS = [(re.compile(regex), test) for regex, test in tle_match_tests]
+
+
+def _get_tle_file_times(tle_file_name):
+    """Get the times of a TLE file, from all the tle_match_tests matching its name."""
+    times = []
+    for regex, test in _TLE_MATCH_TESTS:
+        m = regex.match(tle_file_name)
+        if m:
+            try:
+                times.append(test(m))
+            except ValueError:
+                pass
+    return times
+
+
+class _TleFileIndex(object):
+    """The TLE files of a directory sorted by time, updated when the directory changes.
+
+    Only the names of new files are matched against tle_match_tests, so an
+    archive of years of TLE files is not parsed again for every pass.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._file_times = {}
+        self._entries = []
+        self._times = []
+
+    def _refresh(self):
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        if mtime_ns == self._mtime_ns:
+            return
+        file_times = {}
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            if name not in self._file_times:
+                file_times[name] = _get_tle_file_times(os.path.join(self.directory, name))
+            else:
+                file_times[name] = self._file_times[name]
+        self._file_times = file_times
+        self._entries = sorted((file_time, os.path.join(self.directory, name))
+                               for name, times in file_times.items() for file_time in times)
+        self._times = [file_time for file_time, name in self._entries]
+        self._mtime_ns = mtime_ns
+
+    def find_closest(self, timestamp, max_seconds):
+        """Get the TLE file closest in time to *timestamp* and the offset in seconds, or None.
+
+        Only files less than *max_seconds* from *timestamp* are considered.
+        """
+        with self._lock:
+            self._refresh()
+            pos = bisect_left(self._times, timestamp)
+            candidates = self._entries[max(pos - 1, 0):pos + 1]
+        closest = None
+        for file_time, tle_file_name in candidates:
+            offset = abs((timestamp - file_time).total_seconds())
+            if offset < max_seconds:
+                max_seconds = offset
+                closest = (tle_file_name, offset)
+        return closest
+
+
+_TLE_FILE_INDEXES = {}
+_TLE_FILE_INDEXES_LOCK = threading.Lock()
+
+
+def _get_tle_file_index(directory):
+    with _TLE_FILE_INDEXES_LOCK:
+        return _TLE_FILE_INDEXES.setdefault(directory, _TleFileIndex(directory))
+
+
+_TLE_STORES = {}
+_TLE_STORES_LOCK = threading.Lock()
+
+
+def _get_tle_store(filename):
+    with _TLE_STORES_LOCK:
+        if filename not in _TLE_STORES:
+            _TLE_STORES[filename] = TleStore(filename)
+        return _TLE_STORES[filename]
+
+
 def download_tle(config, timestamp, dir_data_tle):
+    """Download the TLEs of the tle_download URLs into a TLE file for *timestamp* in *dir_data_tle*.
 
-    user = os.getenv("PAR_NAVIGATION_TLE_USER", "xxxxxx")
-    passwd = os.getenv("PAR_NAVIGATION_TLE_PASSWD", "xxxxxx")
-    url = os.getenv("PAR_NAVIGATION_TLE_URL_DOWNLOAD")
+    The URL in PAR_NAVIGATION_TLE_URL_DOWNLOAD of the AAPP environment is
+    used as well, with the space-track login from the environment. Return the
+    list of TLE files, empty if nothing could be downloaded.
+    """
+    job = config.get_job_context()
+    user = job.getenv("PAR_NAVIGATION_TLE_USER", "xxxxxx")
+    passwd = job.getenv("PAR_NAVIGATION_TLE_PASSWD", "xxxxxx")
+    url = job.getenv("PAR_NAVIGATION_TLE_URL_DOWNLOAD")
     timeout = 60
     catalogue = "25338,26536,27453,28654,33591,37849,29499,38771,27431,32958,37214,25994,27424"
 
@@ -88,184 +216,402 @@ def download_tle(config, timestamp, dir_data_tle):
     tle_dict = {}
     tle_dict['timestamp'] = timestamp
 
-    tle_cnf = []
-    try:
-        tle_cnf = config['aapp_processes'][config.process_name]['tle_download']
-    except KeyError as ke:
+    tle_cnf = list(config['aapp_processes'][config.process_name].get('tle_download') or [])
+    if not tle_cnf:
         LOG.info("No tle_download config found. Using the default.")
-        pass
-    finally:
+    if url:
         tle_cnf.append({'url': url, 'user': user, 'passwd': passwd, 'timeout': timeout, 'catalogue': catalogue})
 
     try:
         tle_infile = compose(config['aapp_processes'][config.process_name]['tle_infile_format'], tle_dict)
     except KeyError as ke:
-        if 'tle_infile_format' in ke:
+        if 'tle_infile_format' in ke.args:
             tle_infile = compose('tle_{timestamp:%Y%m%d_%H%M}.txt', tle_dict)
             LOG.warning("Using default TLE file name format: %s", tle_infile)
-            pass
         else:
             LOG.error("Key error: {}".format(ke))
             LOG.error("Valid keys :")
             for key in tle_dict.keys():
                 LOG.error("{}".format(key))
             raise
-    except:
-        raise
 
-    tle_file_list = []
     for cnf in tle_cnf:
-        for cnf_url in cnf['url'].split():
-            LOG.debug("Will try to download TLE from {}.".format(cnf_url))
-
-            if "space-track" in cnf_url:
-                # Do the special space-track login
-                status = False
-                returncode = 0
-                stdout = ""
-                stderr = ""
-                cmd = "wget -T {} --post-data=\"identity={}&password={}\" --cookies=on ",
-                "--keep-session-cookies --save-cookies=cookies_spacetrack \"{}/ajaxauth/login\" -olog".format(
-                    cnf['timeout'], cnf['user'], cnf['passwd'], cnf_url)
-                try:
-                    status, returncode, stdout, stderr = run_shell_command(cmd)
-                except:
-                    LOG.error("Failed running command: {} with return code: {}".format(cmd, returncode))
-                    LOG.error("stdout: {}".format(stdout))
-                    LOG.error("stderr: {}".format(stderr))
-                    return_status = False
-                else:
-                    if returncode != 0:
-                        LOG.debug("Running command: {} with return code: {}".format(cmd, returncode))
-                        LOG.debug("stdout: {}".format(stdout))
-                        LOG.debug("stderr: {}".format(stderr))
-                    else:
-                        cmd = "wget -T {} --keep-session-cookies --load-cookies=cookies_spacetrack -O weather.txt ",
-                        "\"{}/basicspacedata/query/class/tle_latest/ORDINAL/1/NORAD_CAT_ID/{}/orderby/TLE_LINE1\"".format(
-                            cnf['timeout'], cnf_url, cnf['catalogue'])
-                        try:
-                            status, returncode, stdout, stderr = run_shell_command(cmd)
-                        except:
-                            LOG.error("Failed running command: {} with return code: {}".format(cmd, returncode))
-                            LOG.error("stdout: {}".format(stdout))
-                            LOG.error("stderr: {}".format(stderr))
-                        else:
-                            if returncode != 0:
-                                LOG.debug("Running command: {} with return code: {}".format(cmd, returncode))
-                                LOG.debug("stdout: {}".format(stdout))
-                                LOG.debug("stderr: {}".format(stderr))
-                            else:
-                                LOG.debug("TLE download ok")
-                if os.path.exists("weather.txt"):
-                    try:
-                        tle_file = open("weather.txt", 'r')
-                        tle_string = tle_file.read()
-                        tle_file.close()
-                        tle_file_out = os.path.join(dir_data_tle, tle_infile)
-                        with open(tle_file_out, "a") as tle_file:
-                            tle_file.write(tle_string)
-
-                        if tle_file_out not in tle_file_list:
-                            tle_file_list.append(tle_file_out)
-                    except Exception as ex:
-                        LOG.debug("Failed rename tle download file: {}".format(ex))
-                        raise
-            else:
-                import urllib2
-                f = urllib2.urlopen(cnf_url)
-                tle_string = f.read()
-                f.close()
-                tle_file_out = os.path.join(dir_data_tle, tle_infile)
-                with open(tle_file_out, "a") as tle_file:
-                    tle_file.write(tle_string)
-                if tle_file_out not in tle_file_list:
-                    tle_file_list.append(tle_file_out)
-
-    return tle_file_list
+        LOG.debug("Will try to download TLE from {}.".format(cnf['url']))
+    contents = [content for content in
+                _TLE_DOWNLOADER.download(tle_cnf, os.path.join(dir_data_tle, _TLE_DOWNLOAD_CACHE))
+                if content is not None]
+    if not contents:
+        LOG.error("Could not download any TLEs.")
+        return []
+
+    tle_file_out = os.path.join(dir_data_tle, tle_infile)
+    if write_tle_file(tle_file_out, contents):
+        LOG.info("Downloaded TLEs to {}".format(tle_file_out))
+    else:
+        LOG.info("Downloaded TLEs not changed since last time, in {}".format(tle_file_out))
+    return [tle_file_out]
 
 
 def fetch_realtime_tles(tle_input_path, tle_output_path, tle_infile_format):
-    """Get the recent TLEs and copy them into the AAPP data structure."""
-    infiles = glob(os.path.join(tle_input_path, globify(tle_infile_format)))
-    p__ = Parser(tle_infile_format)
-    for filepath in infiles:
-        filename = os.path.basename(filepath)
-        res = p__.parse(filename)
-        dtobj = res['timestamp']
-
-        subdirname = dtobj.strftime('%Y_%m')
-        subdirpath = os.path.join(tle_output_path, subdirname)
-        outfile = os.path.join(subdirpath, filename)
-        LOG.debug("OUTPUT file = %s", str(outfile))
-
-        if not os.path.exists(subdirpath):
-            os.mkdir(subdirpath)
-        tmp_filepath = tempfile.mktemp(suffix='_' + os.path.basename(outfile),
-                                       dir=os.path.dirname(outfile))
-        LOG.debug("tmp-filepath = %s", tmp_filepath)
-        shutil.copy(filepath, tmp_filepath)
-        LOG.debug("File copied: %s -> %s", filepath, tmp_filepath)
-        os.rename(tmp_filepath, outfile)
-        LOG.debug("Rename: %s -> %s", tmp_filepath, outfile)
+    """Get the recent TLEs and copy them into the AAPP data structure.
 
+    The size and modification time of the files synced already are kept in
+    a manifest in tle_output_path, and only new or changed files are synced.
+    Files are hard linked if possible, otherwise copied.
+    """
+    with _TLE_SYNC_LOCK:
+        manifest_file = os.path.join(tle_output_path, _TLE_SYNC_MANIFEST)
+        synced = _read_manifest(manifest_file)
+        new_synced = {}
+
+        infiles = glob(os.path.join(tle_input_path, globify(tle_infile_format)))
+        p__ = Parser(tle_infile_format)
+        for filepath in infiles:
+            filename = os.path.basename(filepath)
+            res = p__.parse(filename)
+            dtobj = res['timestamp']
+
+            subdirname = dtobj.strftime('%Y_%m')
+            subdirpath = os.path.join(tle_output_path, subdirname)
+            outfile = os.path.join(subdirpath, filename)
+
+            stat = os.stat(filepath)
+            new_synced[filepath] = [stat.st_size, stat.st_mtime_ns]
+            if synced.get(filepath) == new_synced[filepath] and os.path.exists(outfile):
+                continue
+            LOG.debug("OUTPUT file = %s", str(outfile))
 
-def do_tleing(config, timestamp, satellite):
-    """Get the tle-file and copy them to the AAPP data structure
-       and run the AAPP tleing script and executable"""
+            if not os.path.exists(subdirpath):
+                os.makedirs(subdirpath, exist_ok=True)
+            tmp_filepath = tempfile.mktemp(suffix='_' + os.path.basename(outfile),
+                                           dir=os.path.dirname(outfile))
+            LOG.debug("tmp-filepath = %s", tmp_filepath)
+            _link_or_copy(filepath, tmp_filepath)
+            LOG.debug("File copied: %s -> %s", filepath, tmp_filepath)
+            os.rename(tmp_filepath, outfile)
+            LOG.debug("Rename: %s -> %s", tmp_filepath, outfile)
 
-    return_status = True
+        if new_synced != synced:
+            _write_manifest(manifest_file, new_synced)
 
-    # This function relies on beeing in a working directory
+
+def _link_or_copy(src, dst):
+    """Hard link *src* to *dst*, or copy it if on another filesystem (or links are not supported)."""
     try:
-        current_dir = os.getcwd()  # Store the dir to change back to after function complete
-    except OSError as ose:
-        LOG.error("Failed to get current working dir: {}".format(ose))
-        raise
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
 
-    os.chdir(config['aapp_processes'][config.process_name]['working_dir'])
+def _read_manifest(manifest_file):
+    try:
+        with open(manifest_file) as fd_:
+            return json.load(fd_)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as err:
+        LOG.warning("Can not read the manifest {}, starting over: {}".format(manifest_file, err))
+        return {}
 
-    _maybe_update_env(config)
 
-    # variables for the TLE HOME directory
-    DIR_DATA_TLE = os.getenv('DIR_DATA_TLE', os.path.join(os.getenv('DIR_NAVIGATION'), 'orb_elem'))
+def _write_manifest(manifest_file, content):
+    fd_, tmp_manifest = tempfile.mkstemp(dir=os.path.dirname(manifest_file),
+                                         prefix=os.path.basename(manifest_file) + ".")
+    with os.fdopen(fd_, 'w') as tmp_file:
+        json.dump(content, tmp_file)
+    os.replace(tmp_manifest, manifest_file)
 
-    _ensure_tledir(DIR_DATA_TLE)
 
-    # Fetch TLE files from central real-time repo and place them under the AAPP orbelems structure:
-    if 'recent_tlefiles_ext_dir' in config['aapp_processes'][config.process_name]:
+def do_tleing(config, timestamp, satellite):
+    """Get the tle-file and copy them to the AAPP data structure
+       and run the AAPP tleing script and executable"""
+
+    return_status = True
+
+    # variables for the TLE HOME directory
+    DIR_DATA_TLE = setup_tle_dir(config)
+
+    # Fetch TLE files from central real-time repo and place them under the AAPP orbelems structure.
+    # With the TLE watcher this is done in the background.
+    if ('recent_tlefiles_ext_dir' in config['aapp_processes'][config.process_name] and
+            not config.get_parameter('tle_watch_interval')):
         extdir = config['aapp_processes'][config.process_name]['recent_tlefiles_ext_dir']
         LOG.debug("Fetch TLEs from %s to %s", extdir, DIR_DATA_TLE)
         tle_file_format = config['aapp_processes'][config.process_name]['tle_infile_format']
         fetch_realtime_tles(extdir, DIR_DATA_TLE, tle_file_format)
 
+    update_tle_index(config, timestamp, satellite)
+
+    return return_status
+
+
+def setup_tle_dir(config):
+    """Set up the environment of the job for the TLEs, and make sure the TLE dir exists. Return the TLE dir."""
+    job = config.get_job_context()
+    _maybe_update_env(config, job)
+    tle_dir = _get_tle_dir(job)
+    _ensure_tledir(tle_dir)
+    return tle_dir
+
+
+def update_tle_index(config, timestamp, satellite):
+    """Ingest the TLE files for *timestamp* in the TLE index of *satellite*, if not done before.
+
+    Usually the TLE files were ingested already, by the TLE watcher or for an
+    earlier pass, and then tleing.exe is not run at all.
+    """
+    job = config.get_job_context()
+    DIR_DATA_TLE = _get_tle_dir(job)
     TLE_INDEX = os.path.join(DIR_DATA_TLE, "tle_{}.index".format(satellite))
 
-    (tle_dict, tle_file_list, tle_search_dir) = _search_tle_files(config, DIR_DATA_TLE, TLE_INDEX,
-                                                                  timestamp)
+    with _get_tle_index_lock(TLE_INDEX), file_lock(_get_lock_filename(job, os.path.basename(TLE_INDEX))):
+        archive_file_list = None
+        if config.get_parameter('tle_store_file'):
+            tle_dict, tle_search_dir = {'timestamp': timestamp}, DIR_DATA_TLE
+            tle_file_list, archive_file_list = _select_tle_from_store(config, DIR_DATA_TLE, timestamp, satellite)
+        else:
+            (tle_dict, tle_file_list, tle_search_dir) = _search_tle_files(config, DIR_DATA_TLE, TLE_INDEX,
+                                                                          timestamp)
 
-    if not tle_file_list and config['aapp_processes'][config.process_name]['download_tle_files']:
-        LOG.warning("Found no tle files. Try to download ... ")
-        tle_file_list = download_tle(config, timestamp, DIR_DATA_TLE)
+        if not tle_file_list and config['aapp_processes'][config.process_name]['download_tle_files']:
+            LOG.warning("Found no tle files. Try to download ... ")
+            tle_file_list = download_tle(config, timestamp, DIR_DATA_TLE)
+            archive_file_list = None
 
-    _ingest_and_archive_tle_files(config, tle_file_list, DIR_DATA_TLE, tle_dict,
-                                  tle_search_dir, satellite, TLE_INDEX)
+        new_tle_files = _get_new_tle_files(DIR_DATA_TLE, TLE_INDEX, tle_file_list)
+        if tle_file_list and not new_tle_files:
+            LOG.info("TLE index {} is up to date with {}".format(TLE_INDEX, tle_file_list))
 
-    # Change back after this is done
-    os.chdir(current_dir)
+        if _ingest_and_archive_tle_files(config, new_tle_files, DIR_DATA_TLE, tle_dict,
+                                         tle_search_dir, satellite, TLE_INDEX, archive_file_list):
+            _prune_ingested_records(config, TLE_INDEX, timestamp)
+
+
+def _fill_tle_store(config, tle_store, tle_dir):
+    """Add the TLE files of the TLE dir, its month dirs and the TLE archive to the TLE store."""
+    tle_dirs = [tle_dir] + sorted(glob(os.path.join(tle_dir, "[0-9][0-9][0-9][0-9]_[0-9][0-9]")))
+    tle_archive_dir = config.get_parameter('tle_archive_dir')
+    if tle_archive_dir:
+        tle_indir = config.get_parameter('tle_indir')
+        tle_dirs += sorted(glob(globify(tle_archive_dir, {'tle_indir': tle_indir} if tle_indir else {})))
+    for directory in tle_dirs:
+        tle_store.add_tle_dir(directory, is_tle_file=lambda name: bool(_get_tle_file_times(name)))
+
+
+def _select_tle_from_store(config, tle_dir, timestamp, satellite):
+    """Put the TLE of *satellite* with the epoch closest to *timestamp* in a TLE file of its own.
+
+    The TLE is taken from the TLE store, filled with the TLE files first.
+    Returns (tle_files, source_files): the TLE file for tleing, relative to
+    *tle_dir*, and the TLE file the TLE comes from, or two empty lists.
+    """
+    tle_store = _get_tle_store(config.get_parameter('tle_store_file'))
+    _fill_tle_store(config, tle_store, tle_dir)
+
+    names = _get_tle_names(config, satellite)
+    if not names:
+        LOG.error("No tle_platform_name_aliases or tle_platform_catalogue_numbers for {}, "
+                  "can not find its TLEs.".format(satellite))
+        return [], []
+    max_seconds = None
+    if config.get_parameter('tle_file_to_data_diff_limit_days'):
+        max_seconds = int(config.get_parameter('tle_file_to_data_diff_limit_days')) * 24 * 60 * 60
+    closest = tle_store.find_closest(tle_store.get_satnums(names), timestamp, max_seconds)
+    if closest is None:
+        LOG.error("Could not find a TLE of {} close enough to timestamp {} with limit {}".format(
+            satellite, timestamp, max_seconds))
+        return [], []
+
+    (record, source_file), offset = closest
+    LOG.debug("Use TLE of {} with epoch {} from {}, offset {}s".format(satellite, record.epoch, source_file, offset))
+    tle_filename = os.path.join(_TLE_STORE_DIR, satellite, "tle_{}_{}.txt".format(satellite, record.epoch))
+    os.makedirs(os.path.dirname(os.path.join(tle_dir, tle_filename)), exist_ok=True)
+    write_tle_file(os.path.join(tle_dir, tle_filename), [record.format().encode()])
+    return [tle_filename], [source_file]
+
+
+def _get_tle_dir(job):
+    return job.getenv('DIR_DATA_TLE', os.path.join(job.getenv('DIR_NAVIGATION'), 'orb_elem'))
+
+
+def _get_lock_filename(job, name):
+    """Get the lock file of *name*, in the lock dir of the TLE dir shared by all the jobs."""
+    return os.path.join(_get_tle_dir(job), _LOCK_DIR, "{}.lock".format(name))
+
+
+def _get_tle_index_lock(tle_index):
+    """Get the lock of *tle_index*, so one thread at a time updates it."""
+    with _TLE_INDEX_LOCKS_LOCK:
+        return _TLE_INDEX_LOCKS.setdefault(tle_index, threading.Lock())
+
+
+def _get_ingested_filename(tle_index):
+    return "{}.ingested".format(tle_index)
+
+
+def _read_ingested_tle_files(tle_index):
+    """Get the TLE files ingested in *tle_index*, with their modification time."""
+    if not os.path.exists(tle_index):
+        return {}
+    ingested = {}
+    try:
+        with open(_get_ingested_filename(tle_index)) as fd_:
+            for line in fd_:
+                mtime_ns, tle_file = line.rstrip('\n').split(' ', 1)
+                ingested[tle_file] = int(mtime_ns)
+    except FileNotFoundError:
+        pass
+    return ingested
+
+
+def _record_ingested_tle_file(tle_dir, tle_index, tle_file):
+    tle_file = os.path.join(tle_dir, tle_file)
+    with open(_get_ingested_filename(tle_index), 'a') as fd_:
+        fd_.write("{} {}\n".format(os.stat(tle_file).st_mtime_ns, tle_file))
+
+
+def _get_epochs_filename(tle_index):
+    return "{}.epochs".format(tle_index)
+
+
+def _read_ingested_epochs(tle_index):
+    """Get the (catalogue number, epoch) of the TLEs ingested in *tle_index*."""
+    if not os.path.exists(tle_index):
+        return set()
+    try:
+        with open(_get_epochs_filename(tle_index)) as fd_:
+            return set(tuple(line.split()) for line in fd_ if line.strip())
+    except FileNotFoundError:
+        return set()
 
-    return return_status
 
+def _record_ingested_epochs(tle_index, records):
+    with open(_get_epochs_filename(tle_index), 'a') as fd_:
+        for record in records:
+            fd_.write("{} {}\n".format(record.satnum, record.epoch))
 
-def _maybe_update_env(config):
+
+def _rewrite_lines(filename, lines):
+    fd_, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                         prefix=".{}.".format(os.path.basename(filename)))
+    with os.fdopen(fd_, 'w') as tmp_file:
+        tmp_file.writelines(lines)
+    os.replace(tmp_filename, filename)
+
+
+def _prune_ingested_records(config, tle_index, timestamp):
+    """Forget the TLE files and TLEs ingested in *tle_index* which will not be searched for again.
+
+    These are the TLE files gone, and with tle_file_to_data_diff_limit_days,
+    the TLE files named with a time and the TLEs with an epoch older than that
+    before *timestamp*. Should these come again, they are given to tleing
+    again, which keeps one line per TLE in the index.
+    """
+    limit_days = config.get_parameter('tle_file_to_data_diff_limit_days')
+    oldest = timestamp - timedelta(days=int(limit_days)) if limit_days else None
+
+    ingested = _read_ingested_tle_files(tle_index)
+    kept_files = {}
+    for tle_file, mtime_ns in ingested.items():
+        if not os.path.exists(tle_file):
+            continue
+        times = _get_tle_file_times(os.path.basename(tle_file))
+        if oldest is not None and times and max(times) < oldest:
+            continue
+        kept_files[tle_file] = mtime_ns
+    if len(kept_files) < len(ingested):
+        _rewrite_lines(_get_ingested_filename(tle_index),
+                       ["{} {}\n".format(mtime_ns, tle_file) for tle_file, mtime_ns in kept_files.items()])
+
+    if oldest is None:
+        return
+    epochs = _read_ingested_epochs(tle_index)
+    kept_epochs = set()
+    for satnum, epoch in epochs:
+        try:
+            if parse_tle_epoch(epoch) >= oldest:
+                kept_epochs.add((satnum, epoch))
+        except ValueError:
+            pass
+    if len(kept_epochs) < len(epochs):
+        _rewrite_lines(_get_epochs_filename(tle_index),
+                       ["{} {}\n".format(satnum, epoch) for satnum, epoch in sorted(kept_epochs)])
+    LOG.debug("Forgot {} TLE files and {} TLEs ingested in {}".format(
+        len(ingested) - len(kept_files), len(epochs) - len(kept_epochs), tle_index))
+
+
+def _get_tle_names(config, satellite):
+    """Get the names of *satellite* in the TLE files, from the tle_platform_name_aliases.
+
+    The catalogue number of the satellite in tle_platform_catalogue_numbers is
+    added, for the TLE files without names.
+    """
+    static_config = config['aapp_static_configuration']
+    aliases = static_config.get('platform_name_aliases', {})
+    names = set()
+    for option in ('tle_platform_name_aliases', 'tle_platform_catalogue_numbers'):
+        names.update(str(tle_name) for platform_name, tle_name in static_config.get(option, {}).items()
+                     if platform_name == satellite or aliases.get(platform_name) == satellite)
+    return names
+
+
+def _prefilter_tle_file(config, tle_dir, tle_filename, satellite, tle_index):
+    """Put the TLEs of *satellite* not ingested in *tle_index* yet in a TLE file of their own.
+
+    Returns (tle_filename, tle_records): the TLE file for tleing, relative to
+    *tle_dir*, and the TLEs in it. The TLE file is None if there are no new
+    TLEs of the satellite. The whole TLE file is used if the TLEs of the
+    satellite can not be told from the others.
+    """
+    names = _get_tle_names(config, satellite)
+    if not names:
+        LOG.warning("No tle_platform_name_aliases or tle_platform_catalogue_numbers for {}, "
+                    "using the whole TLE file.".format(satellite))
+        return tle_filename, []
+    try:
+        records = read_tles(os.path.join(tle_dir, tle_filename))
+    except OSError:
+        return tle_filename, []
+    seen = _read_ingested_epochs(tle_index)
+    satnums = get_satnums(records, names) | set(satnum for satnum, _ in seen)
+    if not records or (not satnums and any(record.name is None for record in records)):
+        return tle_filename, []
+
+    selected = select_satellite_tles(records, satnums, seen)
+    if not selected:
+        return None, []
+    split_filename = os.path.join(_TLE_SPLIT_DIR, satellite, tle_filename)
+    os.makedirs(os.path.dirname(os.path.join(tle_dir, split_filename)), exist_ok=True)
+    write_tle_file(os.path.join(tle_dir, split_filename), ["".join(record.format() for record in selected).encode()])
+    LOG.debug("{} new TLEs of {} from {} in {}".format(len(selected), satellite, tle_filename, split_filename))
+    return split_filename, selected
+
+
+def _get_new_tle_files(tle_dir, tle_index, tle_file_list):
+    """Get the files of *tle_file_list* not ingested in *tle_index*, or changed since."""
+    ingested = _read_ingested_tle_files(tle_index)
+    new_tle_files = []
+    for tle_file in tle_file_list:
+        path = os.path.join(tle_dir, tle_file)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if ingested.get(path) != mtime_ns:
+            new_tle_files.append(tle_file)
+    return new_tle_files
+
+
+def _maybe_update_env(config, job):
     """Potentially update environment based on config.
 
     Based on the configuration for aapp-runner, potentially update some
-    environment variables as expected by AAPP.
+    environment variables of the job as expected by AAPP.
     """
 
-    if '7' in os.getenv('AAPP_PREFIX'):
+    if '7' in job.getenv('AAPP_PREFIX'):
         aapp_env = 'AAPP_ENV7'
-    elif '8' in os.getenv('AAPP_PREFIX'):
+    elif '8' in job.getenv('AAPP_PREFIX'):
         aapp_env = 'AAPP_ENV8'
     else:
         aapp_env = 'AAPP_ENV'
@@ -273,17 +619,17 @@ def _maybe_update_env(config):
     if 'dir_navigation' in config['aapp_processes'][config.process_name]:
         LOG.warning("Override the env variable set in {} DIR_NAVIGATION from {} to {}.".format(
             aapp_env,
-            os.environ['DIR_NAVIGATION'], config['aapp_processes'][config.process_name]['dir_navigation']))
-        os.environ['DIR_NAVIGATION'] = config['aapp_processes'][config.process_name]['dir_navigation']
+            job.getenv('DIR_NAVIGATION'), config['aapp_processes'][config.process_name]['dir_navigation']))
+        job.setenv('DIR_NAVIGATION', config['aapp_processes'][config.process_name]['dir_navigation'])
         # Need to update DIR_DATA_TLE dir to be sure this is corect if not tle_indir is given
-        os.environ['DIR_DATA_TLE'] = os.path.join(os.getenv('DIR_NAVIGATION'), 'tle_db')
+        job.setenv('DIR_DATA_TLE', os.path.join(job.getenv('DIR_NAVIGATION'), 'tle_db'))
 
     if 'tle_indir' in config['aapp_processes'][config.process_name]:
         tle_indir = config['aapp_processes'][config.process_name]['tle_indir']
         LOG.warning("Override the env variable set in {} DIR_DATA_TLE from {} to {}.".format(
             aapp_env,
-            os.environ['DIR_DATA_TLE'], tle_indir))
-        os.environ['DIR_DATA_TLE'] = tle_indir
+            job.getenv('DIR_DATA_TLE'), tle_indir))
+        job.setenv('DIR_DATA_TLE', tle_indir)
 
 
 def _ensure_tledir(tledir):
@@ -338,7 +684,9 @@ def _search_tle_files(config, tle_dir, tle_index, timestamp):
             LOG.warning("index file does not exist. If this is the first run of AAPP tleing.exe it is ok,"
                         " otherwise it is a bit suspicious.")
             try:
+                # Not the hidden manifests, nor the lists of ingested TLEs of the other TLE indexes
                 tle_files = [s for s in os.listdir(tle_dir) if
+                             not s.startswith('.') and not s.endswith(('.index.ingested', '.index.epochs')) and
                              os.path.isfile(os.path.join(tle_dir, s))]
                 tle_files.sort(key=lambda s:
                                os.path.getctime(os.path.join(tle_dir, s)))
@@ -380,27 +728,11 @@ def _search_tle_files(config, tle_dir, tle_index, timestamp):
                     pass
             except IOError as e:
                 LOG.warning("Could not find tle file: {}. Try find closest ... ".format(infile))
-                tle_file_list = glob(os.path.join(tle_search_dir, '*'))
-                LOG.debug("tle file list: {}".format(tle_file_list))
-                LOG.debug(tle_file_list)
-                infile_closest = ""
-
-                for tle_file_name in tle_file_list:
-                    for regex, test in tle_match_tests:
-                        m = re.match(regex, tle_file_name)
-                        if m:
-                            try:
-                                LOG.debug("{} {}".format(tle_file_name, test(m)))
-                                delta = timestamp - test(m)
-                                if (abs(delta.total_seconds()) < min_closest_tle_file):
-                                    min_closest_tle_file = abs(delta.total_seconds())
-                                    # infile_closest = os.path.basename(tle_file_name)
-                                    infile_closest = tle_file_name
-                                    LOG.debug("Closest tle infile so far: {}".format(infile_closest))
-                            except ValueError:
-                                pass
-
-                if infile_closest:
+                closest = _get_tle_file_index(tle_search_dir).find_closest(timestamp, min_closest_tle_file)
+
+                if closest:
+                    infile_closest, min_closest_tle_file = closest
+                    LOG.debug("Closest tle infile: {}".format(infile_closest))
                     del tle_file_list[:]
                     tle_file_list.append(infile_closest)
                     break
@@ -421,19 +753,29 @@ def _search_tle_files(config, tle_dir, tle_index, timestamp):
 
 
 def _ingest_and_archive_tle_files(config, tle_file_list, tle_dir, tle_dict,
-                                  tle_search_dir, satellite, tle_index):
+                                  tle_search_dir, satellite, tle_index, archive_file_list=None):
+    job = config.get_job_context()
+    archive = False
     for tle_file in tle_file_list:
-        archive = False
-
         # SATellite IDentification mandatory
         # so take care of default values
-        os.environ['SATID_FILE'] = os.getenv('SATID_FILE', 'satid.txt')
+        job.setenv('SATID_FILE', job.getenv('SATID_FILE', 'satid.txt'))
 
         """Don't use the tle_indir because this is handeled by the tleing script"""
         if (tle_dir != tle_search_dir):
             tle_filename = compose(os.path.join("{timestamp:%Y_%m}", os.path.basename(tle_file)), tle_dict)
         else:
-            tle_filename = os.path.basename(tle_file)
+            tle_filename = os.path.relpath(os.path.join(tle_dir, tle_file), tle_dir)
+
+        # Only give tleing the TLEs of the satellite it has not seen yet
+        new_tles = []
+        if config.get_parameter('prefilter_tle_files'):
+            tle_filename, new_tles = _prefilter_tle_file(config, tle_dir, tle_filename, satellite, tle_index)
+            if tle_filename is None:
+                LOG.info("No new TLEs of {} in {}".format(satellite, tle_file))
+                _record_ingested_tle_file(tle_dir, tle_index, tle_file)
+                continue
+        index_keys = _read_tle_index_keys(tle_index)
         status = False
         returncode = 0
         stdout = ""
@@ -443,7 +785,8 @@ def _ingest_and_archive_tle_files(config, tle_file_list, tle_dir, tle_dict,
                                           tle_index)
         LOG.debug('stdin arguments to command: ' + str(stdin))
         try:
-            status, returncode, stdout, stderr = run_shell_command(cmd, stdin=stdin)
+            status, returncode, stdout, stderr = run_shell_command(cmd, stdin=stdin, my_cwd=job.cwd, my_env=job.env,
+                                                                   tail_lines=config.get_output_tail_lines('tle'))
 
         except:
             LOG.error("Failed running command: {} with return code: {}".format(cmd, returncode))
@@ -468,143 +811,325 @@ def _ingest_and_archive_tle_files(config, tle_file_list, tle_dir, tle_dict,
                 LOG.debug("tle_file : {}".format(os.path.basename(tle_file)))
                 LOG.debug("satellite : {}".format(satellite))
                 LOG.debug("TLE_INDEX : {}".format(tle_index))
+                _record_ingested_tle_file(tle_dir, tle_index, tle_file)
+                _record_ingested_epochs(tle_index, new_tles)
 
                 # When a index file is generated above one line is added for each tle file.
                 # If several tle files contains equal TLEs each of these TLEs generate one line in the index file
                 # To avoid this, sort the index file keeping only unique lines(skipping the tle filename at the end
-
-                # The sort options +0b -3b is guessed to be sort from column 0 to 3, but this is not documented
-                # Could cause problems with future version of sort.
-                # See eg. http://search.cpan.org/~sdague/ppt-0.12/bin/sort
-                # cmd="sort -u -o {} +0b -3b {}".format(os.path.join(DIR_DATA_TLE, "{}.sort".format(TLE_INDEX)),
-                # os.path.join(DIR_DATA_TLE, TLE_INDEX))
+                # This was done with "sort -u +0b -3b" and "grep -v NaN", now in _sort_index_file.
                 if os.path.exists(tle_index):
-                    archive = _sort_index_file(tle_index)
+                    # Only archive when tleing added TLEs to the index
+                    if _sort_index_file(tle_index, index_keys) == _INDEX_UPDATED:
+                        archive = True
                 else:
                     LOG.error("tle index file: {} does not exists after tleing before sort. This can not happen.")
 
-        # If a new tle is used and archive dir is given in config, copy TLEs to archive
-        if archive and ('tle_archive_dir' in config['aapp_processes'][config.process_name]):
-            _archive_tles(config, tle_file_list)
+    # If a new tle is used and archive dir is given in config, copy TLEs to archive
+    if archive and ('tle_archive_dir' in config['aapp_processes'][config.process_name]):
+        _archive_tles(config, tle_file_list if archive_file_list is None else archive_file_list)
+    return archive
 
 
-def _sort_index_file(tle_index):
-    archive = False
-    cmd = "sort -u +0b -3b {}".format(tle_index)
+# The results of _sort_index_file
+_INDEX_FAILED = 'failed'
+_INDEX_UNCHANGED = 'unchanged'
+_INDEX_UPDATED = 'updated'
+
+
+def _tle_index_key(line):
+    """Get the key of a TLE index line, like the old "sort -u +0b -3b": the first three fields."""
+    return tuple(line.split()[:3])
+
+
+def _read_tle_index_keys(tle_index):
+    """Get the keys of the lines of the TLE index, without the lines with NaN."""
     try:
-        status, returncode, stdout, stderr = run_shell_command(
-            cmd, stdout_logfile="{}.sort1".format(tle_index))
-    except:
-        LOG.error("Failed running command: {} with return code: {}".format(cmd, returncode))
-        LOG.error("stdout: {}".format(stdout))
-        LOG.error("stderr: {}".format(stderr))
-        return_status = False
-    else:
-        if returncode == 0 and os.path.exists("{}.sort1".format(tle_index)):
-            cmd = "grep -v NaN {}.sort1".format(tle_index)
-            try:
-                status, returncode, stdout, stderr = run_shell_command(
-                    cmd,
-                    stdout_logfile="{}.sort".format(tle_index))
-            except:
-                LOG.error("Failed running command: {} with return code: {}".format(cmd, returncode))
-                LOG.error("stdout: {}".format(stdout))
-                LOG.error("stderr: {}".format(stderr))
-                return_status = False
-            else:
+        with open(tle_index) as fd_:
+            return set(_tle_index_key(line) for line in fd_ if 'NaN' not in line)
+    except OSError:
+        return set()
 
-                try:
-                    os.remove(tle_index)
-                    os.remove("{}.sort1".format(tle_index))
-                except OSError as e:
-                    LOG.error("Failed to remove unsorted and duplicated index file: {} with {}"
-                              .format(tle_index, e))
-                else:
-                    try:
-                        os.rename("{}.sort".format(tle_index), tle_index)
-                        archive = True
-                    except:
-                        LOG.error("Failed to rename sorted index file to original name.")
-        else:
-            LOG.error("Returncode other than 0: {} or tle index sort file does exists.".format(
-                returncode, "{}.sort".format(tle_index)))
-    return archive
+
+def _sort_index_file(tle_index, known_keys=()):
+    """Sort the lines of the TLE index, keeping one line per key and removing the lines with NaN.
+
+    When several tle files contain the same TLEs, tleing adds one line for
+    each to the index. The first line of each key is kept. The index is only
+    rewritten (atomically) if this changes it.
+
+    Return _INDEX_UPDATED if the index has keys not in *known_keys*, the keys
+    of the index before tleing, _INDEX_UNCHANGED if not, or _INDEX_FAILED.
+
+    The lines are sorted by the bytes of their key fields, not with the
+    collation of the locale as sort did. tleing writes these fields as fixed
+    width numbers, the epoch of the TLE, for which both orders are the same:
+    chronological, as satpostle needs it to find the TLE of a date.
+    """
+    try:
+        with open(tle_index) as fd_:
+            lines = fd_.readlines()
+    except OSError as err:
+        LOG.error("Failed to read the tle index file {}: {}".format(tle_index, err))
+        return _INDEX_FAILED
+
+    unique_lines = {}
+    for line in lines:
+        if 'NaN' in line:
+            continue
+        if not line.endswith('\n'):
+            line += '\n'
+        unique_lines.setdefault(_tle_index_key(line), line)
+    sorted_lines = [unique_lines[key] for key in sorted(unique_lines)]
+    result = _INDEX_UPDATED if set(unique_lines) - set(known_keys) else _INDEX_UNCHANGED
+
+    if sorted_lines == lines:
+        LOG.debug("tle index file {} already sorted and unique.".format(tle_index))
+        return result
+
+    tmp_index = None
+    try:
+        fd_, tmp_index = tempfile.mkstemp(dir=os.path.dirname(tle_index),
+                                          prefix=".{}.".format(os.path.basename(tle_index)))
+        with os.fdopen(fd_, 'w') as tmp_file:
+            tmp_file.writelines(sorted_lines)
+        os.chmod(tmp_index, os.stat(tle_index).st_mode)
+        os.replace(tmp_index, tle_index)
+    except OSError as err:
+        LOG.error("Failed to write the sorted tle index file {}: {}".format(tle_index, err))
+        if tmp_index is not None and os.path.exists(tmp_index):
+            os.remove(tmp_index)
+        return _INDEX_FAILED
+    LOG.debug("Sorted tle index file {}, {} lines removed.".format(tle_index, len(lines) - len(sorted_lines)))
+    return result
 
 
 def _archive_tles(config, tle_file_list):
-    """Archive TLEs according to configuration."""
+    """Archive the TLE files in the tle_archive_dir of the time in their names.
 
+    The archive is content addressed: the sha256 of the archived TLE files
+    are kept in a manifest in the TLE dir, and a TLE file with the content of
+    an archived one is not archived again. The TLE files already hashed are
+    listed with their size and modification time, so these are not read
+    again. The files are hard linked when possible, otherwise copied.
+    """
+    job = config.get_job_context()
+    tle_dir = _get_tle_dir(job)
     archive_dict = {}
     archive_dict['tle_indir'] = config['aapp_processes'][config.process_name]['tle_indir']
-    for tle_file_name in tle_file_list:
-        for regex, test in tle_match_tests:
-            m = re.match(regex, tle_file_name)
-            if m:
-                try:
-                    archive_dict['timestamp'] = test(m)
-                    tle_archive_dir = compose(
-                        config['aapp_processes'][config.process_name]['tle_archive_dir'], archive_dict)
-                    if not os.path.exists(tle_archive_dir):
-                        try:
-                            os.makedirs(tle_archive_dir)
-                        except:
-                            LOG.error("Failed to make archive dir: {}".format(tle_archive_dir))
-                except ValueError:
-                    LOG.exception('Failed in archive step...')
-                    pass
+    archive_format = config['aapp_processes'][config.process_name]['tle_archive_dir']
+
+    with file_lock(_get_lock_filename(job, "tle_archive")):
+        manifest_file = os.path.join(tle_dir, _TLE_ARCHIVE_MANIFEST)
+        manifest = _read_manifest(manifest_file)
+        hashed = manifest.setdefault('files', {})
+        archived = manifest.setdefault('digests', {})
+        old_manifest = json.dumps(manifest, sort_keys=True)
+
+        to_archive = {}
+        in_archive = {}
+        for tle_file_name in tle_file_list:
+            tle_file = os.path.join(tle_dir, tle_file_name)
+            # The first time found is from the most greedy match
+            times = _get_tle_file_times(tle_file_name)
+            if not times:
+                LOG.warning("No time in the name of TLE file {}, not archived.".format(tle_file_name))
+                continue
+            try:
+                digest = _get_tle_file_digest(tle_file, hashed)
+            except OSError as err:
+                LOG.error("Failed to read TLE file: {} to archive: {}".format(tle_file, err))
+                continue
+            archive_dict['timestamp'] = times[0]
+            archive_file = os.path.join(compose(archive_format, archive_dict), os.path.basename(tle_file))
+            if digest in to_archive:
+                continue
+            if digest in archived and os.path.exists(archived[digest]):
+                LOG.debug("TLEs of {} are in the archive already.".format(tle_file_name))
+                in_archive[digest] = (tle_file, archive_file)
+                continue
+            to_archive[digest] = (tle_file, archive_file)
 
-                try:
-                    copy(tle_file_name, tle_archive_dir)
-                    LOG.debug("Copied {} to {}.".format(tle_file_name, tle_archive_dir))
-                    archive = False
-                except IOError as ioe:
-                    LOG.error("Failed to copy TLE file: {} to archive: {} because {}".format(
-                        tle_file_name, tle_archive_dir, ioe))
-                    LOG.error("CWD: {}".format(os.getcwd()))
-                else:
-                    # 2021-01-20 added by Gerrit Holl <gerrit.holl@dwd.de>
-                    # to ensure only the most greedy match is used and files
-                    # don't get copied multiple times.  I hope it doesn't
-                    # break anybody's workflow!
-                    break
+        _archive_tle_files(to_archive, archived)
+        # The archived files of these may have been overwritten by other TLEs with the same name
+        _archive_tle_files(dict((digest, files) for digest, files in in_archive.items() if digest not in archived),
+                           archived)
 
+        if json.dumps(manifest, sort_keys=True) != old_manifest:
+            _write_manifest(manifest_file, manifest)
 
-def do_tle_satpos(config, timestamp, satellite):
 
-    return_status = True
+def _archive_tle_files(to_archive, archived):
+    """Archive the TLE files of *to_archive*, {digest: (tle_file, archive_file)}, listing them in *archived*."""
+    for tle_archive_dir in set(os.path.dirname(archive_file) for _, archive_file in to_archive.values()):
+        try:
+            os.makedirs(tle_archive_dir, exist_ok=True)
+        except OSError:
+            LOG.error("Failed to make archive dir: {}".format(tle_archive_dir))
 
-    LOG.info("satpos files is stored under the dir_navigation/satpos")
-    satpos_dir = os.path.join(os.environ['DIR_NAVIGATION'], "satpos")
+    for digest, (tle_file, archive_file) in to_archive.items():
+        try:
+            _archive_tle_file(tle_file, archive_file, digest)
+        except OSError as err:
+            LOG.error("Failed to archive TLE file: {} to archive: {} because {}".format(
+                tle_file, os.path.dirname(archive_file), err))
+            continue
+        # Another content archived with the same name was overwritten
+        for stale_digest in [known for known, known_file in archived.items()
+                             if known_file == archive_file and known != digest]:
+            del archived[stale_digest]
+        archived[digest] = archive_file
+        LOG.debug("Archived {} as {}.".format(tle_file, archive_file))
+
+
+def _get_tle_file_digest(tle_file, hashed):
+    """Get the sha256 of *tle_file*, from *hashed* if it did not change since hashed."""
+    stat = os.stat(tle_file)
+    known = hashed.get(tle_file)
+    if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known[2]
+    digest = hash_file(tle_file)
+    hashed[tle_file] = [stat.st_size, stat.st_mtime_ns, digest]
+    return digest
+
+
+def _archive_tle_file(tle_file, archive_file, digest):
+    """Link or copy *tle_file* to *archive_file*, unless it has the same content already."""
+    if os.path.exists(archive_file) and (os.path.samefile(tle_file, archive_file) or
+                                         hash_file(archive_file) == digest):
+        return
+    tmp_archive_file = tempfile.mktemp(prefix=".{}.".format(os.path.basename(archive_file)),
+                                       dir=os.path.dirname(archive_file))
+    _link_or_copy(tle_file, tmp_archive_file)
+    os.replace(tmp_archive_file, archive_file)
+
+
+def get_satpos_filename(job, satellite, timestamp):
+    """Get the name of the satpos file of *satellite* for the day of *timestamp*."""
+    satpos_dir = os.path.join(job.getenv('DIR_NAVIGATION'), "satpos")
+    return os.path.join(satpos_dir, "satpos_{}_{:%Y%m%d}.txt".format(satellite, timestamp))
+
+
+def generate_satpos_file(config, job, satellite, timestamp):
+    """Generate the satpos file of *satellite* for the day of *timestamp* with satpostle.
+
+    satpostle -o writes the satpos file in $DIR_NAVIGATION/satpos. It is run
+    with DIR_NAVIGATION set to a temporary navigation dir, and the satpos file
+    is moved to the satpos dir when complete. So a pass needing the file at
+    the same time never reads a partial satpos file.
+
+    Usage is: satpostle  [ -o] [-s satellite] [-S station] [-d start date] [-n number of days]
+    [-i increment in seconds] [-c search criteria]
+
+    -o -s -S -d -n -i –c are optional.
+
+    If no parameter is specified as an option, defaults are : noaa14, Lannion, today 0h, 1.0, 120.0,
+    n (n= nearest, p = preceding).
+
+    The option -o specifies that the data will be stored in the file satpos_noaxx_yyyymmdd.txt.
+
+    Output default is the standard output..
+    """
+    file_satpos = get_satpos_filename(job, satellite, timestamp)
+    os.makedirs(os.path.dirname(file_satpos), exist_ok=True)
+    tmp_navigation = _make_satpos_navigation_dir(job)
+    tmp_satpos = os.path.join(tmp_navigation, "satpos", os.path.basename(file_satpos))
+    env = dict(job.env)
+    env['DIR_NAVIGATION'] = tmp_navigation
+    cmd = "satpostle -o -s {} -d {:%d/%m/%y} -n 1.2".format(satellite, timestamp)
+    try:
+        # satpostle reads the TLE index, which must not change meanwhile
+        with file_lock(_get_lock_filename(job, "tle_{}.index".format(satellite)), shared=True):
+            status, returncode, std, err = run_shell_command(cmd, my_cwd=job.cwd, my_env=env,
+                                                             tail_lines=config.get_output_tail_lines('tle'))
+    except:
+        LOG.error("Failed to run command: {}".format(cmd))
+        return_status = False
+    else:
+        if returncode != 0:
+            LOG.error("cmd: {} failed with returncode: {}".format(cmd, returncode))
+            return_status = False
+        elif not os.path.exists(tmp_satpos) or os.stat(tmp_satpos).st_size == 0:
+            LOG.error("cmd: {} gave no satpos file {}.".format(cmd, os.path.basename(file_satpos)))
+            return_status = False
+        else:
+            os.replace(tmp_satpos, file_satpos)
+            return_status = True
+    finally:
+        shutil.rmtree(tmp_navigation, ignore_errors=True)
 
-    file_satpos = os.path.join(satpos_dir, "satpos_{}_{:%Y%m%d}.txt".format(satellite, timestamp))
+    return return_status
 
-    if (not os.path.exists(file_satpos) or os.stat(file_satpos).st_size == 0) and return_status:
-        """Usage is: satpostle  [ -o] [-s satellite] [-S station] [-d start date] [-n number of days]
-        [-i increment in seconds] [-c search criteria]
 
-        -o -s -S -d -n -i –c are optional.
+def _make_satpos_navigation_dir(job):
+    """Make a temporary navigation dir for satpostle, in DIR_NAVIGATION.
 
-        If no parameter is specified as an option, defaults are : noaa14, Lannion, today 0h, 1.0, 120.0,
-        n (n= nearest, p = preceding).
+    The entries of DIR_NAVIGATION are linked there, but the satpos dir is one
+    of its own, where satpostle -o writes the satpos file.
+    """
+    dir_navigation = job.getenv('DIR_NAVIGATION')
+    tmp_navigation = tempfile.mkdtemp(dir=dir_navigation, prefix=".satpos.")
+    for name in os.listdir(dir_navigation):
+        if name != "satpos" and not name.startswith(".satpos."):
+            os.symlink(os.path.join(dir_navigation, name), os.path.join(tmp_navigation, name))
+    os.mkdir(os.path.join(tmp_navigation, "satpos"))
+    return tmp_navigation
 
-        The option -o specifies that the data will be stored in the file satpos_noaxx_yyyymmdd.txt.
 
-        Output default is the standard output..
-        """
-        cmd = "satpostle -o -s {} -d {:%d/%m/%y} -n 1.2".format(satellite, timestamp)
-        try:
-            status, returncode, std, err = run_shell_command(cmd)
-        except:
-            LOG.error("Failed to run command: {}".format(cmd))
-            return_status = False
-        else:
-            if returncode != 0:
-                LOG.error("cmd: {} failed with returncode: {}".format(cmd, returncode))
-                return_status = False
-            elif not os.path.exists(file_satpos):
-                LOG.error("file: {} does not exists after satpostle run.".format(file_satpos))
-                return_status = False
-    else:
+def _satpos_file_exists(file_satpos):
+    return os.path.exists(file_satpos) and os.stat(file_satpos).st_size > 0
+
+
+def ensure_satpos_file(config, job, satellite, timestamp):
+    """Generate the satpos file of *satellite* for the day of *timestamp*, if not there.
+
+    One job at a time generates the satpos files of a satellite, the other
+    jobs wait and use the satpos file it generated. Return False if the satpos
+    file could not be generated.
+    """
+    file_satpos = get_satpos_filename(job, satellite, timestamp)
+    if _satpos_file_exists(file_satpos):
         LOG.info("satpos file already there. Use this")
+        return True
+    with file_lock(_get_lock_filename(job, "satpos_{}".format(satellite))):
+        if _satpos_file_exists(file_satpos):
+            LOG.info("satpos file {} generated by another job. Use this".format(file_satpos))
+            return True
+        if generate_satpos_file(config, job, satellite, timestamp):
+            LOG.info("Generated satpos file {}".format(file_satpos))
+            return True
+    return False
+
 
+def do_tle_satpos(config, timestamp, satellite):
+
+    job = config.get_job_context()
+    LOG.info("satpos files is stored under the dir_navigation/satpos")
+    return ensure_satpos_file(config, job, satellite, timestamp)
+
+
+def get_supported_satellites(config):
+    """Get the AAPP names of the supported NOAA and Metop satellites."""
+    static_config = config['aapp_static_configuration']
+    aliases = static_config.get('platform_name_aliases', {})
+    return [aliases.get(platform_name, platform_name) for platform_name in
+            static_config.get('supported_noaa_satellites', []) +
+            static_config.get('supported_metop_satellites', [])]
+
+
+def prepare_satpos_files(config, timestamps):
+    """Generate the missing satpos files of all the supported satellites for the days of *timestamps*.
+
+    Run ahead of midnight UTC for the next day, the passes of the day then only
+    find an existing satpos file. Return False if any satpos file could not be
+    generated.
+    """
+    job = config.get_job_context()
+    _maybe_update_env(config, job)
+
+    return_status = True
+    for satellite in get_supported_satellites(config):
+        for timestamp in timestamps:
+            if not ensure_satpos_file(config, job, satellite, timestamp):
+                return_status = False
     return return_status
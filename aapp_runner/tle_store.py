@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Store of the TLEs of the TLE files, indexed by satellite and epoch.
+
+The time in the name of a TLE file tells when it was made, not the epoch of
+its TLEs. The store keeps every TLE of the TLE files added to it in an SQLite
+database, with the catalogue number and epoch as primary key, so the TLE of
+a satellite with the epoch closest to a time is found with an index lookup,
+without reading the TLE files again.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from aapp_runner.tle_parser import TleRecord, get_catalogue_number, normalize_tle_name, read_tles
+
+LOG = logging.getLogger(__name__)
+
+_UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_seconds(timestamp):
+    return (timestamp - _UNIX_EPOCH).total_seconds()
+
+
+class TleStore(object):
+    """The TLEs of TLE files, kept in the SQLite database *filename*."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS tles (satnum TEXT, epoch REAL, name TEXT, "
+                         "line1 TEXT, line2 TEXT, path TEXT, PRIMARY KEY (satnum, epoch))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS names (name TEXT, satnum TEXT, PRIMARY KEY (name, satnum))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)")
+        if "size" not in [column[1] for column in self._db.execute("PRAGMA table_info(files)")]:
+            # Made before the size was kept, the files are read again once
+            self._db.execute("ALTER TABLE files ADD COLUMN size INTEGER")
+
+    def add_tle_files(self, filenames):
+        """Add the TLEs of the TLE files *filenames* not added yet, or changed since.
+
+        A TLE file changed if its modification time or size changed. The first
+        TLE of an epoch added is kept. Return the number of TLEs added.
+        """
+        with self._lock:
+            added_files = {path: (mtime_ns, size) for path, mtime_ns, size in
+                           self._db.execute("SELECT path, mtime_ns, size FROM files")}
+            count = 0
+            for filename in filenames:
+                try:
+                    stat = os.stat(filename)
+                    if added_files.get(filename) == (stat.st_mtime_ns, stat.st_size):
+                        continue
+                    records = read_tles(filename)
+                except OSError as err:
+                    LOG.warning("Could not read TLE file {}: {}".format(filename, err))
+                    continue
+                count += self._add_records(records, filename, stat)
+        if count:
+            LOG.debug("Added {} TLEs to {}".format(count, self.filename))
+        return count
+
+    def _add_records(self, records, filename, stat):
+        rows = []
+        names = set()
+        for record in records:
+            try:
+                epoch = _to_seconds(record.epoch_time)
+            except ValueError:
+                LOG.debug("Invalid TLE epoch in {}: {}".format(filename, record.line1))
+                continue
+            rows.append((record.satnum, epoch, record.name, record.line1, record.line2, filename))
+            if record.name is not None:
+                names.add((normalize_tle_name(record.name), record.satnum))
+        with self._db:
+            self._db.execute("BEGIN")
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO tles VALUES (?, ?, ?, ?, ?, ?)", rows)
+            count = self._db.total_changes - before
+            self._db.executemany("INSERT OR IGNORE INTO names VALUES (?, ?)", names)
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                             (filename, stat.st_mtime_ns, stat.st_size))
+        return count
+
+    def add_tle_dir(self, directory, is_tle_file=None):
+        """Add the TLE files of *directory* not added yet, or changed since.
+
+        Hidden files are skipped, and the files for which *is_tle_file* of the
+        file name is False. The TLE files are checked one by one, as a TLE file
+        rewritten in place does not change the modification time of the
+        directory. Return the number of TLEs added.
+        """
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return 0
+        filenames = [os.path.join(directory, name) for name in sorted(names)
+                     if not name.startswith('.') and (is_tle_file is None or is_tle_file(name))]
+        return self.add_tle_files([filename for filename in filenames if os.path.isfile(filename)])
+
+    def get_satnums(self, names):
+        """Get the catalogue numbers of the satellite called one of *names* in the TLE files.
+
+        The catalogue numbers in *names* are kept, for the TLE files without
+        names (space-track two line format).
+        """
+        catalogue_numbers = set(get_catalogue_number(name) for name in names) - {None}
+        names = [normalize_tle_name(str(name)) for name in names]
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT satnum FROM names WHERE name IN ({})".format(
+                ", ".join("?" * len(names))), names).fetchall()
+        return set(satnum for satnum, in rows) | catalogue_numbers
+
+    def find_closest(self, satnums, timestamp, max_seconds=None):
+        """Get the TLE of *satnums* with the epoch closest to *timestamp*, and the offset in seconds, or None.
+
+        The TLE is a (TleRecord, path) tuple, with the TLE file the TLE was
+        first added from. Only TLEs less than *max_seconds* from *timestamp*
+        are considered.
+        """
+        seconds = _to_seconds(timestamp)
+        candidates = []
+        with self._lock:
+            for satnum in satnums:
+                candidates.extend(self._db.execute(
+                    "SELECT epoch, name, line1, line2, path FROM tles WHERE satnum = ? AND epoch <= ? "
+                    "ORDER BY epoch DESC LIMIT 1", (satnum, seconds)))
+                candidates.extend(self._db.execute(
+                    "SELECT epoch, name, line1, line2, path FROM tles WHERE satnum = ? AND epoch > ? "
+                    "ORDER BY epoch LIMIT 1", (satnum, seconds)))
+        closest = None
+        for epoch, name, line1, line2, path in candidates:
+            offset = abs(epoch - seconds)
+            if max_seconds is not None and offset >= max_seconds:
+                continue
+            if closest is None or offset < closest[1]:
+                closest = ((TleRecord(name, line1, line2), path), offset)
+        return closest
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026 Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Ingest new TLE files in the background, for all the supported satellites.
+
+TLE files change a few times a day, but passes come every few minutes. The
+watcher looks for new TLE files every tle_watch_interval seconds and keeps
+the TLE index files of all the satellites up to date, so the processing of a
+pass only finds the TLE files ingested already.
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+from aapp_runner.tle_satpos_prepare import (fetch_realtime_tles,
+                                            get_supported_satellites,
+                                            setup_tle_dir, update_tle_index)
+
+LOG = logging.getLogger(__name__)
+
+
+class TleWatcher(object):
+    """Thread ingesting the new TLE files every *interval* seconds.
+
+    The *config* must have a job context with the AAPP environment.
+    """
+
+    def __init__(self, config, interval):
+        self.config = config
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching for new TLE files."""
+        self._thread = threading.Thread(target=self._run, name="TleWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching, and wait for an ongoing ingestion to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.update_tle_indexes()
+            except Exception:
+                LOG.exception("Failed to update the TLE indexes.")
+            self._stop_event.wait(self.interval)
+
+    def update_tle_indexes(self, timestamp=None):
+        """Fetch the recent TLE files and ingest the new ones for all the satellites."""
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        config = self.config
+        tle_dir = setup_tle_dir(config)
+
+        extdir = config.get_parameter('recent_tlefiles_ext_dir')
+        if extdir:
+            LOG.debug("Fetch TLEs from %s to %s", extdir, tle_dir)
+            fetch_realtime_tles(extdir, tle_dir, config.get_parameter('tle_infile_format'))
+
+        for satellite in get_supported_satellites(config):
+            update_tle_index(config, timestamp, satellite)
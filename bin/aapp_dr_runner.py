@@ -30,15 +30,18 @@ granules at the moment).
 
 """
 
+import copy
 import logging
 import logging.config
 import os
+import re
 import shutil
 import socket
 import sys
 import tempfile
 import threading
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from glob import glob
 from logging import handlers
 from time import time as _time
@@ -52,13 +55,21 @@ from posttroll.publisher import Publish
 from trollsift.parser import compose
 
 from aapp_runner.aapp_runner_tools import set_collection_area_id
+from aapp_runner.checkpoint import MANIFEST_NAME as CHECKPOINT_MANIFEST_NAME
+from aapp_runner.checkpoint import CheckpointManifest
 from aapp_runner.config_helpers import generate_process_config
 from aapp_runner.do_commutation import do_decommutation
 from aapp_runner.exceptions import DecommutationError, SatposError, TleError
 from aapp_runner.helper_functions import (check_if_scene_is_unique,
-                                          create_scene_id, run_shell_command)
+                                          create_scene_id)
+from aapp_runner.job_context import JobContext, source_aapp_environment
+from aapp_runner.pass_collector import PassCollector
 from aapp_runner.read_aapp_config import AappL1Config, AappRunnerConfig
-from aapp_runner.tle_satpos_prepare import do_tle_satpos, do_tleing
+from aapp_runner.result_cache import get_cache_key
+from aapp_runner.step_graph import StepGraph
+from aapp_runner.tle_satpos_prepare import (do_tle_satpos, do_tleing,
+                                            prepare_satpos_files)
+from aapp_runner.tle_watcher import TleWatcher
 
 LOG = logging.getLogger(__name__)
 
@@ -68,24 +79,27 @@ LOG = logging.getLogger(__name__)
 _DEFAULT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 _DEFAULT_LOG_FORMAT = '[%(levelname)s: %(asctime)s : %(name)s] %(message)s'
 
+# Passes are processed in a pool of workers, so the job registry and the
+# publisher are shared between the main loop and the worker callbacks.
+# The lock makes checking and registering a pass one operation.
+JOB_REGISTER_LOCK = threading.Lock()
+PUBLISH_LOCK = threading.Lock()
+
 """
 These are the standard names used by the various AAPP decommutation scripts.
 If you change these, you will also have to change the decommutation scripts.
 """
 
 
-def reset_job_registry(objdict, key, start_end_times_area):
+def reset_job_registry(registry, key, start_end_times_area):
     """Remove job key from registry."""
-    LOG.debug("Register: " + str(objdict))
     starttime, endtime, area_id = start_end_times_area
-    if key in objdict:
-        if objdict[key] and len(objdict[key]) > 0:
-            objdict[key].remove(start_end_times_area)
-            LOG.debug("Release/reset job-key " + str(key) + " " +
-                      str(starttime) + " " + str(endtime) + " " +
-                      str(area_id) + " from job registry")
-            LOG.debug("Register: " + str(objdict))
-            return
+    if registry.remove(key, start_end_times_area):
+        LOG.debug("Release/reset job-key " + str(key) + " " +
+                  str(starttime) + " " + str(endtime) + " " +
+                  str(area_id) + " from job registry")
+        LOG.debug("Register: " + str(registry))
+        return
 
     LOG.warning("Nothing to reset/release - " +
                 "Register didn't contain any entry matching: " +
@@ -146,6 +160,43 @@ def cleanup_aapp_workdir(config):
     return True
 
 
+# The working dirs of the passes which may be resumed are named by create_scene_id
+_PASS_WORKING_DIR = re.compile(r'.+_\d{14}_\d{14}$')
+
+# Hours to keep the working dir of a failed pass, to resume it
+DEFAULT_RESUME_MAX_AGE = 24
+
+
+def cleanup_abandoned_pass_dirs(config):
+    """Remove the working dirs of failed passes not resumed within resume_failed_passes_max_age hours.
+
+    The age of a working dir is the time since its checkpoint manifest, or
+    the dir itself, last changed.
+    """
+    aapp_workdir = config['aapp_processes'][config.process_name]['aapp_workdir']
+    max_age = config.get_parameter('resume_failed_passes_max_age')
+    max_age = DEFAULT_RESUME_MAX_AGE if max_age is None else float(max_age)
+    oldest = _time() - max_age * 3600
+    try:
+        entries = list(os.scandir(aapp_workdir))
+    except OSError as err:
+        LOG.warning("Can not look for abandoned working dirs in {}: {}".format(aapp_workdir, err))
+        return
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False) or not _PASS_WORKING_DIR.match(entry.name):
+            continue
+        try:
+            mtime = entry.stat(follow_symlinks=False).st_mtime
+            manifest = os.path.join(entry.path, CHECKPOINT_MANIFEST_NAME)
+            if os.path.exists(manifest):
+                mtime = max(mtime, os.stat(manifest).st_mtime)
+            if mtime < oldest:
+                LOG.info("Remove the working dir {} of a failed pass not resumed.".format(entry.path))
+                shutil.rmtree(entry.path)
+        except OSError as err:
+            LOG.warning("Failed to remove abandoned working dir {}: {}".format(entry.path, err))
+
+
 def move_aapp_log_files(config):
     """ Move AAPP processing log files from AAPP working directory in to a sub-directory.
 
@@ -205,25 +256,35 @@ def move_aapp_log_files(config):
     return True
 
 
-def block_before_rerun(config, msg):
-    """Add run to registry to block this from rerun if that is configured."""
-    if config['platform_name'] not in config.job_register.keys():
-        config.job_register[config['platform_name']] = []
+def get_job_key(config):
+    """Get the registry entry of the pass in config."""
+    return (config['starttime'], config['endtime'], config['collection_area_id'])
 
-    config.job_register[config['platform_name']].append(
-        (config['starttime'], config['endtime'], config['collection_area_id']))
-    LOG.debug("End: job register = " + str(config.job_register))
 
+def register_pass(config):
+    """Check that the pass is unique and, if so, add it to the registry.
+
+    The pass is registered already when it is handed over to a worker, so that
+    an overlapping pass arriving while this one is still processed is skipped.
+    Return False if the pass is not unique.
+    """
+    with JOB_REGISTER_LOCK:
+        if not check_if_scene_is_unique(config):
+            return False
+
+        config.job_register.add(config['platform_name'], get_job_key(config))
+        LOG.debug("Start: job register = " + str(config.job_register))
+
+    return True
+
+
+def block_before_rerun(config, msg):
+    """Keep the registered run in the registry to block this from rerun if that is configured."""
     try:
         # Block any future run on this scene for time_to_block_before_rerun
-        # (e.g. 10) minutes from now:
-        t__ = threading.Timer(config['aapp_processes'][config.process_name]['locktime_before_rerun'],
-                              reset_job_registry, args=(config.job_register,
-                                                        config['platform_name'],
-                                                        (config['starttime'],
-                                                         config['endtime'],
-                                                         config['collection_area_id'])))
-        t__.start()
+        # (e.g. 10) minutes from now. The registry releases it by itself.
+        config.job_register.expire(config['platform_name'], get_job_key(config),
+                                   config['aapp_processes'][config.process_name]['locktime_before_rerun'])
 
         LOG.debug(
             "After timer call: job register = " + str(config.job_register))
@@ -274,6 +335,10 @@ def read_arguments():
     parser.add_argument("-l", "--log", help="File to log to",
                         type=str,
                         default=None)
+    parser.add_argument("--prepare-satpos",
+                        help=("Generate the satpos files of all the supported satellites for today "
+                              "and tomorrow (UTC) and exit. Run this before midnight UTC."),
+                        action="store_true")
 
     args = parser.parse_args()
 
@@ -487,24 +552,57 @@ def check_pass_length(msg, config):
     return True
 
 
-def which(program):
-    """Check if executable is available in the system environment path."""
-    # Check if needed executable are available in the
-    # environment search path.
-    # Taken from https://stackoverflow.com/questions/377017/test-if-executable-exists-in-python
-    def is_exe(fpath):
-        return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+LIST_OF_NEEDED_PROGRAMS = ['tleing.exe', 'satpostle', 'decommutation.exe', 'chk1btime.exe',
+                           'decom-amsua-metop', 'decom-mhs-metop', 'decom-hirs-metop',
+                           'decom-avhrr-metop', 'hirs_historic_file_manage', 'hcalcb1_algoV4',
+                           'msucl', 'amsuacl', 'amsubcl', 'mhscl', 'avhrcl',
+                           'atovin', 'atovpp', 'l1didf']
 
-    fpath, fname = os.path.split(program)
-    if fpath:
-        if is_exe(program):
-            return(program)
-    else:
-        for path in os.environ['PATH'].split(os.pathsep):
-            exe_file = os.path.join(path, program)
-            if is_exe(exe_file):
-                return exe_file
-    return None
+
+def setup_aapp_environment(config, working_dir):
+    """Set up the job context of config with the AAPP environment, running in *working_dir*.
+
+    Return the paths of the needed AAPP programs, or None if the AAPP
+    environment could not be read.
+    """
+    job = JobContext(working_dir)
+    config.job_context = job
+    job.setenv("AAPP_PREFIX", config['aapp_processes'][
+        config.process_name]['aapp_prefix'])
+
+    aapp_atovs_conf = os.path.join(job.getenv("AAPP_PREFIX"), config[
+        'aapp_processes'][config.process_name]['aapp_environment_file'])
+    aapp_env = source_aapp_environment(aapp_atovs_conf, job.env, LIST_OF_NEEDED_PROGRAMS)
+    if aapp_env is None:
+        return None
+    job.env, program_paths = aapp_env
+    return program_paths
+
+
+def prepare_satpos(config):
+    """Generate the satpos files of all the supported satellites for today and tomorrow (UTC)."""
+    working_dir = config.get_parameter('working_dir') or config.get_parameter('aapp_workdir')
+    if setup_aapp_environment(config, working_dir) is None:
+        return False
+    now = datetime.utcnow()
+    return prepare_satpos_files(config, [now, now + timedelta(days=1)])
+
+
+def start_tle_watcher(config):
+    """Start ingesting the new TLE files in the background, if tle_watch_interval is given."""
+    interval = config.get_parameter('tle_watch_interval')
+    if not interval:
+        return None
+    # The watcher has a config and an AAPP environment of its own
+    watch_config = copy.copy(config)
+    working_dir = config.get_parameter('working_dir') or config.get_parameter('aapp_workdir')
+    if setup_aapp_environment(watch_config, working_dir) is None:
+        LOG.error("Can not set up the AAPP environment for the TLE watcher, the TLEs are ingested per pass.")
+        return None
+    tle_watcher = TleWatcher(watch_config, interval)
+    tle_watcher.start()
+    LOG.info("Watching for new TLE files every {}s".format(interval))
+    return tle_watcher
 
 
 def setup_aapp_processing(config):
@@ -513,8 +611,21 @@ def setup_aapp_processing(config):
             'use_dyn_work_dir' in config['aapp_processes'][config.process_name] and
             config['aapp_processes'][config.process_name]['use_dyn_work_dir']):
         try:
-            config['aapp_processes'][config.process_name]['working_dir'] = tempfile.mkdtemp(
-                dir=config['aapp_processes'][config.process_name]['aapp_workdir'])
+            if config.get_parameter('resume_failed_passes'):
+                cleanup_abandoned_pass_dirs(config)
+                # The same pass gets the same working dir, to resume from the checkpoints there.
+                # Without checkpoints, what is left there is of an attempt that can not be resumed.
+                working_dir = os.path.join(config['aapp_processes'][config.process_name]['aapp_workdir'],
+                                           create_scene_id(config))
+                if (os.path.isdir(working_dir) and
+                        not os.path.exists(os.path.join(working_dir, CHECKPOINT_MANIFEST_NAME))):
+                    LOG.info("No checkpoints in {}, start the pass from a clean working dir".format(working_dir))
+                    shutil.rmtree(working_dir)
+                os.makedirs(working_dir, exist_ok=True)
+                config['aapp_processes'][config.process_name]['working_dir'] = working_dir
+            else:
+                config['aapp_processes'][config.process_name]['working_dir'] = tempfile.mkdtemp(
+                    dir=config['aapp_processes'][config.process_name]['aapp_workdir'])
             LOG.debug("working dir set based on aapp_workdir and tmp " +
                       str(config['aapp_processes'][config.process_name]['working_dir']))
         except OSError:
@@ -536,27 +647,16 @@ def setup_aapp_processing(config):
     LOG.info("Working dir = " +
              str(config['aapp_processes'][config.process_name]['working_dir']))
 
-    os.environ["AAPP_PREFIX"] = config['aapp_processes'][
-        config.process_name]['aapp_prefix']
-
-    aapp_atovs_conf = os.path.join(os.environ["AAPP_PREFIX"], config[
-        'aapp_processes'][config.process_name]['aapp_environment_file'])
-    status, returncode, out, err = run_shell_command(
-        "bash -c \"source {}\";env".format(aapp_atovs_conf))
-    if not status:
-        LOG.error(
-            "Failed to run the bash source env command for " + str(aapp_atovs_conf))
+    # The AAPP environment is set up for this job only, and the job runs in its own working dir
+    program_paths = setup_aapp_environment(config, config['aapp_processes'][config.process_name]['working_dir'])
+    if program_paths is None:
         return False
-    else:
-        for line in out.splitlines():
-            if line:
-                (key, _, value) = line.partition("=")
-                os.environ[key] = value
+    job = config.job_context
 
     # Default AAPP config for PAR_NAVIGATION_DEFAULT_LISTESAT Metop platform is M01, M02, M04
     # but needed names are metop01 etc. Replace this inside the processing
     # from now on.
-    aapp_satellite_list = os.getenv('PAR_NAVIGATION_DEFAULT_LISTESAT').split()
+    aapp_satellite_list = job.getenv('PAR_NAVIGATION_DEFAULT_LISTESAT').split()
     if config['platform_name'] not in aapp_satellite_list:
         LOG.warning(
             "Can not find this platform in AAPP config variable PAR_NAVIGATION_DEFAULT_LISTESAT. "
@@ -566,7 +666,7 @@ def setup_aapp_processing(config):
             config['platform_name'], aapp_satellite_list))
         if 'metop' in config['platform_name'] and (('M01' or 'M02' or 'M03' or 'M04') in aapp_satellite_list):
             LOG.debug("Replace in this processing")
-            PAR_NAVIGATION_DEFAULT_LISTESAT = os.getenv(
+            PAR_NAVIGATION_DEFAULT_LISTESAT = job.getenv(
                 'PAR_NAVIGATION_DEFAULT_LISTESAT')
             PAR_NAVIGATION_DEFAULT_LISTESAT = PAR_NAVIGATION_DEFAULT_LISTESAT.replace(
                 'M01', 'metop01')
@@ -576,32 +676,53 @@ def setup_aapp_processing(config):
                 'M03', 'metop03')
             PAR_NAVIGATION_DEFAULT_LISTESAT = PAR_NAVIGATION_DEFAULT_LISTESAT.replace(
                 'M04', 'metop04')
-            os.environ[
-                'PAR_NAVIGATION_DEFAULT_LISTESAT'] = PAR_NAVIGATION_DEFAULT_LISTESAT
+            job.setenv('PAR_NAVIGATION_DEFAULT_LISTESAT', PAR_NAVIGATION_DEFAULT_LISTESAT)
             LOG.debug("New LISTESAT: {}".format(
-                os.getenv('PAR_NAVIGATION_DEFAULT_LISTESAT')))
-
-    list_of_needed_programs = ['tleing.exe', 'satpostle', 'decommutation.exe', 'chk1btime.exe',
-                               'decom-amsua-metop', 'decom-mhs-metop', 'decom-hirs-metop',
-                               'decom-avhrr-metop', 'hirs_historic_file_manage', 'hcalcb1_algoV4',
-                               'msucl', 'amsuacl', 'amsubcl', 'mhscl', 'avhrcl',
-                               'atovin', 'atovpp', 'l1didf']
-    for program in list_of_needed_programs:
-        if not which(program):
+                job.getenv('PAR_NAVIGATION_DEFAULT_LISTESAT')))
+
+    for program in LIST_OF_NEEDED_PROGRAMS:
+        if not program_paths[program]:
             LOG.error("Can not find needed AAPP program '{}' in environment. Please check.".format(program))
             return False
 
     return True
 
 
+STEP_DESCRIPTIONS = {'hirs': "The hirs calibration and location",
+                     'atovs': "The (A)TOVS calibration and location",
+                     'avhrr': "The avhrr calibration and location",
+                     'atovpp': "The preprocessing atovin, atopp and/or avh2hirs",
+                     'ana': "The ana attitude correction"}
+
+
+def is_pass_working_dir(config):
+    """Check if the working dir is the one made for the pass, to resume it after a failure."""
+    working_dir = config['aapp_processes'][config.process_name].get('working_dir')
+    return (working_dir is not None and
+            os.path.dirname(os.path.normpath(working_dir)) == os.path.normpath(
+                config['aapp_processes'][config.process_name].get('aapp_workdir', '')) and
+            os.path.basename(os.path.normpath(working_dir)) == create_scene_id(config))
+
+
+def checkpointed_step(config, name, func, depends_on=()):
+    """Get the step function *func*, checkpointed if failed passes are resumed."""
+    if config.checkpoint is None:
+        return func
+    return config.checkpoint.checkpointed(name, func, config, depends_on)
+
+
 def process_aapp(msg, config):
     """Do the various processing steps of aapp for each instruments."""
     try:
         starttime = config['starttime']
         platform_name = config['platform_name']
 
+        config.checkpoint = None
+        if config.get_parameter('resume_failed_passes'):
+            config.checkpoint = CheckpointManifest(config.get_job_context().cwd, create_scene_id(config))
+
         # DO tle
-        if not do_tleing(config, starttime, platform_name):
+        if not checkpointed_step(config, 'tleing', do_tleing)(config, starttime, platform_name):
             LOG.warning(
                 "Tleing failed for some reason. It might be that the processing can continue")
             LOG.warning(
@@ -609,7 +730,7 @@ def process_aapp(msg, config):
             raise TleError("Tleing failed for some reason")
 
         # DO tle satpos
-        if not do_tle_satpos(config, starttime, platform_name):
+        if not checkpointed_step(config, 'satpos', do_tle_satpos, ('tleing',))(config, starttime, platform_name):
             LOG.warning(
                 "Tle satpos failed for some reason. It might be that the processing can continue")
             LOG.warning(
@@ -617,7 +738,7 @@ def process_aapp(msg, config):
             raise SatposError("Tle satpos failed for some reason")
 
         # DO decom
-        if not do_decommutation(config, msg, starttime):
+        if not checkpointed_step(config, 'decom', do_decommutation, ('satpos',))(config, msg, starttime):
             LOG.warning(
                 "The decommutation failed for some reason. It might be that the processing can continue")
             LOG.warning(
@@ -625,50 +746,46 @@ def process_aapp(msg, config):
             raise DecommutationError(
                 "The decommutation failed for some reason")
 
-        # DO HIRS
-        from aapp_runner.do_hirs_calibration import do_hirs_calibration
-        if not do_hirs_calibration(config, msg, starttime):
-            LOG.warning(
-                "Tle hirs calibration and location failed for some reason. " +
-                "It might be that the processing can continue")
-            LOG.warning(
-                "Please check the previous log carefully to see if this is an error you can accept.")
-
-        # DO ATOVS
-        from aapp_runner.do_atovs_calibration import do_atovs_calibration
-        if not do_atovs_calibration(config, starttime):
-            LOG.warning(
-                "The (A)TOVS calibration and location failed for some reason. " +
-                "It might be that the processing can continue")
-            LOG.warning(
-                "Please check the previous log carefully to see if this is an error you can accept.")
-
-        # DO AVHRR
-        from aapp_runner.do_avhrr_calibration import do_avhrr_calibration
-        if not do_avhrr_calibration(config, msg, starttime):
-            LOG.warning(
-                "The avhrr calibration and location failed for some reason. " +
-                "It might be that the processing can continue")
-            LOG.warning(
-                "Please check the previous log carefully to see if this is an error you can accept.")
-
-        # Do Preprocessing
+        # The calibrations use independent l1b files and may run at the same time,
+        # the preprocessing and ANA are run when the files they use are done.
+        from aapp_runner.do_ana_correction import do_ana_correction
         from aapp_runner.do_atovpp_and_avh2hirs_processing import \
             do_atovpp_and_avh2hirs_processing
-        if not do_atovpp_and_avh2hirs_processing(config, starttime):
-            LOG.warning(
-                "The preprocessing atovin, atopp and/or avh2hirs failed for some reason. " +
-                "It might be that the processing can continue")
-            LOG.warning(
-                "Please check the previous log carefully to see if this is an error you can accept.")
-
-        # DO ANA
-        from aapp_runner.do_ana_correction import do_ana_correction
-        if not do_ana_correction(config, msg, starttime):
-            LOG.warning(
-                "The ana attitude correction failed for some reason. It might be that the processing can continue")
+        from aapp_runner.do_atovs_calibration import do_atovs_calibration
+        from aapp_runner.do_avhrr_calibration import do_avhrr_calibration
+        from aapp_runner.do_hirs_calibration import do_hirs_calibration
+        max_concurrent_steps = get_max_concurrent_steps(config)
+        if max_concurrent_steps > 1 and config.checkpoint is not None:
+            LOG.warning("With max_concurrent_steps {} and resume_failed_passes, the steps running at the same "
+                        "time as other steps are not checkpointed, and are run again when the pass is "
+                        "resumed.".format(max_concurrent_steps))
+        steps = StepGraph()
+        steps.add_step('hirs', checkpointed_step(config, 'hirs', do_hirs_calibration, ('decom',)),
+                       (config, msg, starttime))
+        steps.add_step('atovs', checkpointed_step(config, 'atovs', do_atovs_calibration, ('decom',)),
+                       (config, starttime))
+        steps.add_step('avhrr', checkpointed_step(config, 'avhrr', do_avhrr_calibration, ('decom',)),
+                       (config, msg, starttime))
+        atovpp_depends_on = ('hirs', 'atovs', 'avhrr')
+        steps.add_step('atovpp', checkpointed_step(config, 'atovpp', do_atovpp_and_avh2hirs_processing,
+                                                   atovpp_depends_on),
+                       (config, starttime), depends_on=atovpp_depends_on)
+        # avh2hirs reads the avhrr l1b file which is updated by ANA
+        ana_depends_on = ('avhrr', 'atovpp') if config.get_parameter('do_avh2hirs') else ('avhrr',)
+        steps.add_step('ana', checkpointed_step(config, 'ana', do_ana_correction, ana_depends_on),
+                       (config, msg, starttime), depends_on=ana_depends_on)
+
+        report = steps.run(max_concurrent_steps)
+        config.pass_report = report
+        LOG.info("Processing steps: {}".format(report))
+
+        for name in report.failed():
+            LOG.warning("{} failed for some reason. It might be that the processing can continue".format(
+                STEP_DESCRIPTIONS[name]))
             LOG.warning(
                 "Please check the previous log carefully to see if this is an error you can accept.")
+        if report.first_exception() is not None:
+            raise report.first_exception()
 
     except KeyError as ke:
         LOG.exception("Process aapp failed: {}".format(ke))
@@ -747,6 +864,141 @@ def publish_level1(publisher, config, msg, filelist, station_name, environment):
         publisher.send(message)
 
 
+def get_max_concurrent_passes(config):
+    """Get the number of passes which may be processed at the same time.
+
+    Concurrent passes need a working dir of their own, so without
+    use_dyn_work_dir only one pass at the time is processed.
+    """
+    max_concurrent_passes = config.get_parameter('max_concurrent_passes') or 1
+    try:
+        max_concurrent_passes = int(max_concurrent_passes)
+    except ValueError:
+        LOG.error("max_concurrent_passes must be an integer: {}".format(max_concurrent_passes))
+        return 1
+
+    if max_concurrent_passes > 1 and (config.get_parameter('working_dir') or
+                                      not config.get_parameter('use_dyn_work_dir')):
+        LOG.warning("Concurrent passes need use_dyn_work_dir and no fixed working_dir. "
+                    "Will process one pass at the time.")
+        return 1
+
+    return max(max_concurrent_passes, 1)
+
+
+def get_max_concurrent_steps(config):
+    """Get the number of processing steps of a pass which may run at the same time."""
+    max_concurrent_steps = config.get_parameter('max_concurrent_steps') or 1
+    try:
+        return max(int(max_concurrent_steps), 1)
+    except ValueError:
+        LOG.error("max_concurrent_steps must be an integer: {}".format(max_concurrent_steps))
+        return 1
+
+
+def collect_pass_messages(msg, config, pass_collector):
+    """Get the messages to process now.
+
+    Without a pass collector this is just the message itself. Else the Metop
+    file messages are added to the collector, and the messages of the passes
+    collected for the whole window are returned, one dataset message per pass.
+    """
+    if pass_collector is None:
+        return [msg]
+
+    messages = []
+    if msg is not None and msg.type == 'file' and 'uri' in msg.data:
+        try:
+            is_metop = msg.data['platform_name'] in config['aapp_static_configuration']['supported_metop_satellites']
+        except (KeyError, TypeError):
+            is_metop = False
+        if is_metop and 'start_time' in msg.data:
+            pass_collector.add(msg)
+        else:
+            messages.append(msg)
+    elif msg is not None:
+        messages.append(msg)
+
+    return messages + pass_collector.get_ready()
+
+
+def get_receive_timeout(pass_collector):
+    """Get the timeout waiting for messages, short enough to release the collected passes in time."""
+    if pass_collector is None:
+        return 90
+    return 1
+
+
+def run_aapp_pass(msg, config):
+    """Set up and run the AAPP processing of one pass, and rename the resulting files.
+
+    This is run in a worker thread of the pass pool, with the environment and
+    working dir of the pass in config.job_context. Return the renamed files.
+    If the same input was processed before, the files of the result cache are
+    returned instead.
+    """
+    cache_key = None
+    if config.result_cache is not None:
+        try:
+            cache_key = get_cache_key(config)
+        except OSError as err:
+            LOG.warning("Can not make the result cache key, process the pass: {}".format(err))
+        else:
+            cached_files = config.result_cache.get(cache_key)
+            if cached_files:
+                LOG.info("The same input was processed before, publish the files of that processing.")
+                return cached_files
+
+    succeeded = False
+    try:
+        if not setup_aapp_processing(config):
+            raise Exception("setup_aapp_processing returned False. See above lines for details.")
+
+        if not process_aapp(msg, config):
+            raise Exception("Process aapp failed. See above lines for details.")
+
+        # Rename standard AAPP output file names to usefull ones
+        # and move files to final location.
+        from aapp_runner.rename_aapp_filenames import rename_aapp_filenames
+        renamed_files = rename_aapp_filenames(config)
+        succeeded = True
+        if config.checkpoint is not None:
+            # The pass is done, it is not to be resumed
+            config.checkpoint.remove()
+        if renamed_files and cache_key is not None:
+            config.result_cache.put(cache_key, renamed_files)
+        if not renamed_files:
+            LOG.warning(
+                "The rename of standard aapp filenames to practical ones " +
+                "returned an empty file list")
+            LOG.warning(
+                "This means there are no files to publish")
+        return renamed_files
+    finally:
+        # Want to take care of log files to possible debug.
+        move_aapp_log_files(config)
+        cleanup_aapp_logfiles_archive(config)
+        if succeeded and config.checkpoint is not None and is_pass_working_dir(config):
+            # The working dir of the pass is kept only to resume it after a failure
+            cleanup_aapp_workdir(config)
+
+
+def finish_aapp_pass(future, publisher, config, msg, station_name, environment):
+    """Publish the result of a pass processed in the pass pool and update the job registry."""
+    try:
+        renamed_files = future.result()
+    except Exception:
+        LOG.exception("AAPP processing failed.")
+        reset_job_registry(config.job_register, config['platform_name'], get_job_key(config))
+    else:
+        if renamed_files:
+            with PUBLISH_LOCK:
+                publish_level1(publisher, config, msg, renamed_files, station_name, environment)
+        block_before_rerun(config, msg)
+    finally:
+        LOG.info("AAPP dr runner is complete.")
+
+
 if __name__ == "__main__":
     """
     Call the various functions that make up the parts of the AAPP processing
@@ -787,6 +1039,10 @@ if __name__ == "__main__":
         LOG.error("Failed to init AAPP L1 Config object: {}".format(err))
         sys.exit()
 
+    if args.prepare_satpos:
+        sys.exit(0 if prepare_satpos(aapp_config) else 1)
+
+    tle_watcher = start_tle_watcher(aapp_config)
     try:
         services = aapp_config.get_parameter('services')
         if not services:
@@ -794,68 +1050,51 @@ if __name__ == "__main__":
         LOG.debug('Subscribe: {services} {topics}'.format(services=services,
                                                           topics=aapp_config.get_parameter('subscribe_topics')))
 
+        pass_collector = None
+        if aapp_config.get_parameter('pass_collect_window'):
+            pass_collector = PassCollector(aapp_config.get_parameter('pass_collect_window'))
+
         with posttroll.subscriber.Subscribe(services,
                                             aapp_config.get_parameter('subscribe_topics'),
                                             True) as subscr:
             with Publish('aapp_runner', port=publish_port,
-                         nameservers=nameservers) as publisher:
+                         nameservers=nameservers) as publisher, \
+                    ThreadPoolExecutor(max_workers=get_max_concurrent_passes(aapp_config)) as pass_pool:
                 while True:
-                    for msg in subscr.recv(timeout=90):
+                    for msg in subscr.recv(timeout=get_receive_timeout(pass_collector)):
                         if msg:
                             LOG.debug("New message: {}".format(msg))
-                        aapp_config.reset()
-                        if not check_message(msg, aapp_config.get_parameter('message_providing_server')):
-                            LOG.debug("Message providing server: {}".format(
-                                aapp_config.get_parameter('message_providing_server')))
-                            continue
-
-                        if not check_satellite(msg, aapp_config):
-                            continue
-
-                        if not check_pass_length(msg, aapp_config):
-                            continue
-
-                        if not generate_process_config(msg, aapp_config):
-                            continue
-
-                        scene_is_unique = check_if_scene_is_unique(aapp_config)
-                        if not scene_is_unique:
-                            continue
-
-                        scene_id = create_scene_id(aapp_config)
-                        try:
-                            if not setup_aapp_processing(aapp_config):
-                                raise Exception("setup_aapp_processing returned False. See above lines for details.")
-
-                            if not process_aapp(msg, aapp_config):
-                                raise Exception("Process aapp failed. See above lines for details.")
-
-                            # Rename standard AAPP output file names to usefull ones
-                            # and move files to final location.
-                            from aapp_runner.rename_aapp_filenames import \
-                                rename_aapp_filenames
-                            renamed_files = rename_aapp_filenames(aapp_config)
-                            if not renamed_files:
-                                LOG.warning(
-                                    "The rename of standard aapp filenames to practical ones " +
-                                    "returned an empty file list")
-                                LOG.warning(
-                                    "This means there are no files to publish")
-                            else:
-                                publish_level1(
-                                    publisher, aapp_config, msg, renamed_files, station_name, environment)
-
-                            block_before_rerun(aapp_config, msg)
-                        except Exception:
-                            LOG.exception("AAPP processing failed.")
-                            raise
-                        finally:
-                            # Want to take care of log files to possible debug.
-                            move_aapp_log_files(aapp_config)
-                            cleanup_aapp_logfiles_archive(aapp_config)
-                            LOG.info("AAPP dr runner is complete.")
+                        for pass_msg in collect_pass_messages(msg, aapp_config, pass_collector):
+                            aapp_config.reset()
+                            if not check_message(pass_msg, aapp_config.get_parameter('message_providing_server')):
+                                LOG.debug("Message providing server: {}".format(
+                                    aapp_config.get_parameter('message_providing_server')))
+                                continue
+
+                            if not check_satellite(pass_msg, aapp_config):
+                                continue
+
+                            if not check_pass_length(pass_msg, aapp_config):
+                                continue
+
+                            if not generate_process_config(pass_msg, aapp_config):
+                                continue
+
+                            if not register_pass(aapp_config):
+                                continue
+
+                            scene_id = create_scene_id(aapp_config)
+                            LOG.info("Queue {} for processing.".format(scene_id))
+                            # The next message resets aapp_config, so the worker gets a config of its own
+                            job_config = copy.copy(aapp_config)
+                            future = pass_pool.submit(run_aapp_pass, pass_msg, job_config)
+                            future.add_done_callback(
+                                lambda fut, job_config=job_config, pass_msg=pass_msg: finish_aapp_pass(
+                                    fut, publisher, job_config, pass_msg, station_name, environment))
 
     except KeyboardInterrupt:
         LOG.info("Received keyboard interrupt. Shutting down")
     finally:
+        if tle_watcher is not None:
+            tle_watcher.stop()
         LOG.info("Exit AAPP runner. See ya")